@@ -0,0 +1,116 @@
+"""
+Maintenance de l'index de visibilité AccesObjet.
+
+Règles de visibilité pour un enseignant :
+- DOSSIER    : les dossiers qu'il encadre
+- SOUTENANCE : les soutenances dont il est membre du jury
+- CANDIDAT   : les candidats de ses départements, ceux qu'il encadre
+               et ceux dont il est membre du jury
+
+Les fonctions acceptent un registre `apps` pour pouvoir être utilisées
+depuis une migration (modèles historiques).
+"""
+from django.apps import apps as global_apps
+
+
+def calculer_acces(enseignant_ids=None, apps=global_apps):
+    """
+    Calculer l'ensemble attendu des triplets (user_id, type_objet, objet_id),
+    éventuellement restreint à certains enseignants.
+    """
+    DossierSoutenance = apps.get_model('app_soutenance', 'DossierSoutenance')
+    EnseignantProfile = apps.get_model('app_soutenance', 'EnseignantProfile')
+    MembreJury = apps.get_model('app_soutenance', 'MembreJury')
+    EnseignantDepartement = EnseignantProfile.departements.through
+
+    dossiers = DossierSoutenance.objects.filter(encadreur__isnull=False)
+    membres = MembreJury.objects.filter(jury__soutenances__isnull=False)
+    departements = EnseignantDepartement.objects.filter(departement__candidats__isnull=False)
+    if enseignant_ids is not None:
+        dossiers = dossiers.filter(encadreur_id__in=enseignant_ids)
+        membres = membres.filter(enseignant_id__in=enseignant_ids)
+        departements = departements.filter(enseignantprofile_id__in=enseignant_ids)
+
+    lignes = set()
+    for user_id, dossier_id, candidat_id in dossiers.values_list(
+        'encadreur__user_id', 'id', 'candidat_id'
+    ):
+        lignes.add((user_id, 'DOSSIER', dossier_id))
+        lignes.add((user_id, 'CANDIDAT', candidat_id))
+
+    for user_id, soutenance_id, candidat_id in membres.values_list(
+        'enseignant__user_id', 'jury__soutenances__id', 'jury__soutenances__dossier__candidat_id'
+    ):
+        lignes.add((user_id, 'SOUTENANCE', soutenance_id))
+        lignes.add((user_id, 'CANDIDAT', candidat_id))
+
+    for user_id, candidat_id in departements.values_list(
+        'enseignantprofile__user_id', 'departement__candidats__id'
+    ):
+        lignes.add((user_id, 'CANDIDAT', candidat_id))
+
+    return lignes
+
+
+def synchroniser_acces(enseignant_ids=None, apps=global_apps):
+    """
+    Aligner la table AccesObjet sur les règles de visibilité.
+
+    Sans argument, reconstruit tout l'index ; sinon ne touche que les lignes
+    des enseignants donnés. Un DELETE et un bulk_create au plus.
+    """
+    AccesObjet = apps.get_model('app_soutenance', 'AccesObjet')
+    EnseignantProfile = apps.get_model('app_soutenance', 'EnseignantProfile')
+
+    if enseignant_ids is not None:
+        enseignant_ids = {pk for pk in enseignant_ids if pk is not None}
+        if not enseignant_ids:
+            return
+
+    attendues = calculer_acces(enseignant_ids, apps=apps)
+
+    existantes_qs = AccesObjet.objects.all()
+    if enseignant_ids is not None:
+        user_ids = EnseignantProfile.objects.filter(
+            id__in=enseignant_ids
+        ).values_list('user_id', flat=True)
+        existantes_qs = existantes_qs.filter(user_id__in=list(user_ids))
+
+    existantes = {
+        (user_id, type_objet, objet_id): pk
+        for pk, user_id, type_objet, objet_id in existantes_qs.values_list(
+            'id', 'user_id', 'type_objet', 'objet_id'
+        )
+    }
+
+    obsoletes = [pk for ligne, pk in existantes.items() if ligne not in attendues]
+    if obsoletes:
+        AccesObjet.objects.filter(id__in=obsoletes).delete()
+
+    nouvelles = [
+        AccesObjet(user_id=user_id, type_objet=type_objet, objet_id=objet_id)
+        for user_id, type_objet, objet_id in attendues
+        if (user_id, type_objet, objet_id) not in existantes
+    ]
+    if nouvelles:
+        AccesObjet.objects.bulk_create(nouvelles, batch_size=1000, ignore_conflicts=True)
+
+
+def enseignants_du_jury(*jury_ids):
+    """Identifiants des enseignants siégeant dans les jurys donnés"""
+    from .models import MembreJury
+    jury_ids = [pk for pk in jury_ids if pk is not None]
+    if not jury_ids:
+        return set()
+    return set(MembreJury.objects.filter(jury_id__in=jury_ids).values_list('enseignant_id', flat=True))
+
+
+def enseignants_des_departements(*departement_ids):
+    """Identifiants des enseignants rattachés aux départements donnés"""
+    from .models import EnseignantProfile
+    departement_ids = [pk for pk in departement_ids if pk is not None]
+    if not departement_ids:
+        return set()
+    return set(EnseignantProfile.objects.filter(
+        departements__in=departement_ids
+    ).values_list('id', flat=True))
@@ -0,0 +1,261 @@
+"""
+Limitation de débit et tampon d'écriture pour les événements analytics.
+
+- Le limiteur (anti-doublon 1 event/IP/fenêtre) s'appuie sur le cache Django
+  ANALYTICS_CACHE et ne touche pas la base. Il est configurable via
+  ANALYTICS_RATE_LIMITER. Avec plusieurs workers, ce cache doit être partagé.
+- Les événements acceptés sont accumulés en mémoire et écrits par bulk_create
+  lorsque le tampon atteint ANALYTICS_BUFFER_TAILLE, toutes les
+  ANALYTICS_BUFFER_INTERVALLE secondes et à l'arrêt du processus.
+- Chaque vidage incrémente les agrégats SiteEventRollup (heure et jour), sur
+  lesquels s'appuient les statistiques publiques.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, F, Min
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class CacheRateLimiter:
+    """
+    Compteur par fenêtre fixe dans le cache ANALYTICS_CACHE : au plus
+    `capacite` événements par clé et par `periode` secondes. cache.add() et
+    cache.incr() sont atomiques ; le limiteur n'est partagé entre workers
+    que si ce cache l'est (Redis, Memcached, base), pas avec LocMemCache
+    (voir checks.py).
+    """
+    def __init__(self, capacite=1, periode=5):
+        self.capacite = capacite
+        self.periode = periode
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'ANALYTICS_CACHE', 'default')]
+
+    def autoriser(self, cle):
+        cle = f'analytics:rl:{cle}'
+        if self.cache.add(cle, 1, timeout=self.periode):
+            return True
+        try:
+            return self.cache.incr(cle) <= self.capacite
+        except ValueError:
+            # Clé expirée entre add() et incr()
+            return self.cache.add(cle, 1, timeout=self.periode)
+
+
+class EventBuffer:
+    """
+    Tampon d'événements SiteEvent vidé par bulk_create : quand il est plein,
+    toutes les `intervalle` secondes (thread minuteur) et à l'arrêt du
+    processus. Un vidage en échec remet les événements dans le tampon pour
+    le suivant ; au-delà de `maximum`, les plus anciens sont abandonnés.
+    """
+    def __init__(self, taille=50, intervalle=10, maximum=None):
+        self.taille = taille
+        self.intervalle = intervalle
+        self.maximum = maximum or taille * 20
+        self._evenements = []
+        self._verrou = threading.Lock()
+        self._arret = threading.Event()
+        self._minuteur = None
+
+    def demarrer(self):
+        """Lancer le vidage périodique (thread démon)"""
+        if self._minuteur is None:
+            self._minuteur = threading.Thread(target=self._boucle, name='analytics-tampon', daemon=True)
+            self._minuteur.start()
+
+    def arreter(self):
+        """Arrêter le minuteur et écrire les événements en attente"""
+        self._arret.set()
+        self._vider_sans_erreur()
+
+    def _boucle(self):
+        while not self._arret.wait(self.intervalle):
+            # Thread hors requête : Django ne ferme pas ses connexions (CONN_MAX_AGE,
+            # connexion coupée par le serveur), comme dans derives._executer
+            close_old_connections()
+            try:
+                self._vider_sans_erreur()
+            finally:
+                close_old_connections()
+
+    def _vider_sans_erreur(self):
+        try:
+            self.vider()
+        except Exception:
+            logger.exception("Échec de l'écriture des événements analytics (remis en attente)")
+
+    def ajouter(self, evenement):
+        with self._verrou:
+            self._evenements.append(evenement)
+            doit_vider = len(self._evenements) >= self.taille
+        if doit_vider:
+            self._vider_sans_erreur()
+
+    def vider(self):
+        from .models import SiteEvent
+
+        with self._verrou:
+            evenements, self._evenements = self._evenements, []
+        if not evenements:
+            return evenements
+        try:
+            with transaction.atomic():
+                SiteEvent.objects.bulk_create(evenements)
+                incrementer_rollups(Counter(
+                    (e.event_type, granularite, periode)
+                    for e in evenements
+                    for granularite, periode in periodes(e.created_at)
+                ))
+        except Exception:
+            with self._verrou:
+                # Remettre en tête, dans l'ordre, sans dépasser `maximum`
+                self._evenements[:0] = evenements
+                del self._evenements[:-self.maximum]
+            raise
+        return evenements
+
+
+def periodes(moment):
+    """Débuts de l'heure et du jour (heure locale) contenant `moment`"""
+    local = timezone.localtime(moment)
+    heure = local.replace(minute=0, second=0, microsecond=0)
+    return [('HOUR', heure), ('DAY', heure.replace(hour=0))]
+
+
+def incrementer_rollups(compteurs, apps=global_apps):
+    """
+    Ajouter des comptes {(event_type, granularite, periode): n} aux agrégats.
+    Incrément en base (F) pour rester correct entre workers concurrents.
+    """
+    SiteEventRollup = apps.get_model('app_soutenance', 'SiteEventRollup')
+    for (event_type, granularite, periode), n in compteurs.items():
+        cle = dict(event_type=event_type, granularite=granularite, periode=periode)
+        if SiteEventRollup.objects.filter(**cle).update(compteur=F('compteur') + n):
+            continue
+        try:
+            with transaction.atomic():
+                SiteEventRollup.objects.create(compteur=n, **cle)
+        except IntegrityError:
+            # Créé entre-temps par un autre worker
+            SiteEventRollup.objects.filter(**cle).update(compteur=F('compteur') + n)
+
+
+def construire_rollups(apps=global_apps, apres=None):
+    """
+    Recalculer les agrégats depuis les SiteEvent bruts.
+
+    Sans `apres` (migration initiale), tous les agrégats sont reconstruits.
+    Avec `apres`, seules les périodes postérieures à celle qui contient
+    `apres` le sont : les événements plus anciens ont pu être compactés, et
+    les agrégats correspondants sont la seule trace qui en reste.
+    """
+    SiteEvent = apps.get_model('app_soutenance', 'SiteEvent')
+    SiteEventRollup = apps.get_model('app_soutenance', 'SiteEventRollup')
+    tz = timezone.get_current_timezone()
+    if apres is not None:
+        heure, jour = (periode for _, periode in periodes(apres))
+        bornes = {'HOUR': heure + timedelta(hours=1), 'DAY': jour + timedelta(days=1)}
+
+    with transaction.atomic():
+        for granularite, trunc in (('HOUR', TruncHour), ('DAY', TruncDay)):
+            evenements = SiteEvent.objects.all()
+            existants = SiteEventRollup.objects.filter(granularite=granularite)
+            if apres is not None:
+                evenements = evenements.filter(created_at__gte=bornes[granularite])
+                existants = existants.filter(periode__gte=bornes[granularite])
+            lignes = evenements.annotate(
+                periode=trunc('created_at', tzinfo=tz)
+            ).values('event_type', 'periode').annotate(n=Count('id')).order_by()
+            existants.delete()
+            SiteEventRollup.objects.bulk_create([
+                SiteEventRollup(
+                    event_type=ligne['event_type'], granularite=granularite,
+                    periode=ligne['periode'], compteur=ligne['n']
+                )
+                for ligne in lignes
+            ], batch_size=1000)
+
+
+def reconstruire_rollups():
+    """
+    Recalculer les agrégats des périodes entièrement couvertes par les
+    événements bruts restants. Retourne le plus ancien événement brut
+    (None s'il n'y en a aucun : rien n'est modifié).
+    """
+    from .models import SiteEvent
+
+    plus_ancien = SiteEvent.objects.aggregate(debut=Min('created_at'))['debut']
+    if plus_ancien is not None:
+        construire_rollups(apres=plus_ancien)
+    return plus_ancien
+
+
+def compacter(retention_jours=None):
+    """
+    Supprimer les SiteEvent bruts plus anciens que la rétention (les agrégats
+    sont conservés). Retourne le nombre de lignes supprimées.
+    """
+    from .models import SiteEvent
+
+    if retention_jours is None:
+        retention_jours = getattr(settings, 'ANALYTICS_RETENTION_JOURS', 90)
+    limite = timezone.now() - timedelta(days=retention_jours)
+    supprimes, _ = SiteEvent.objects.filter(created_at__lt=limite).delete()
+    return supprimes
+
+
+_limiteur = None
+_tampon = None
+
+
+def get_rate_limiter():
+    global _limiteur
+    if _limiteur is None:
+        classe = import_string(getattr(
+            settings, 'ANALYTICS_RATE_LIMITER', 'app_soutenance.analytics.CacheRateLimiter'
+        ))
+        _limiteur = classe(
+            capacite=getattr(settings, 'ANALYTICS_RATE_LIMIT_CAPACITE', 1),
+            periode=getattr(settings, 'ANALYTICS_RATE_LIMIT_PERIODE', 5),
+        )
+    return _limiteur
+
+
+def get_buffer():
+    global _tampon
+    if _tampon is None:
+        _tampon = EventBuffer(
+            taille=getattr(settings, 'ANALYTICS_BUFFER_TAILLE', 50),
+            intervalle=getattr(settings, 'ANALYTICS_BUFFER_INTERVALLE', 10),
+        )
+        _tampon.demarrer()
+        # Ne pas perdre les événements en attente à l'arrêt du worker
+        atexit.register(_tampon.arreter)
+    return _tampon
+
+
+def enregistrer_evenement(event_type, ip_hash):
+    """
+    Enregistrer un événement s'il passe le limiteur.
+    Retourne False si l'événement est un doublon.
+    """
+    from .models import SiteEvent
+
+    if not get_rate_limiter().autoriser(f'{event_type}:{ip_hash}'):
+        return False
+    get_buffer().ajouter(SiteEvent(event_type=event_type, ip_hash=ip_hash, created_at=timezone.now()))
+    return True
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AppSoutenanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_soutenance'
+
+    def ready(self):
+        # Enregistrer les signaux (index de visibilité)
+        from . import signals  # noqa: F401
+        # Vérifications de configuration (cache partagé pour l'analytics)
+        from . import checks  # noqa: F401
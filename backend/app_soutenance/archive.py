@@ -0,0 +1,372 @@
+"""
+Archives ZIP des documents d'un dossier ou d'une session, produites à la volée.
+
+- Aucun fichier temporaire : l'archive est écrite au fil de la lecture des
+  objets du stockage, par morceaux de 64 Ko.
+- Les fichiers sont stockés sans compression (PDF et images sont déjà
+  compressés) et le CRC-32 de chaque fichier est connu d'avance (Blob.crc32,
+  calculé à l'upload, ou mis en cache au premier export). La disposition de
+  l'archive, donc sa taille et ses offsets, est ainsi déterminée avant de lire
+  le moindre octet : Content-Length exact et requêtes Range (reprise) possibles.
+- Les fichiers suivants sont lus en parallèle par un pool de threads borné
+  (ARCHIVE_THREADS), chacun dans une file de taille bornée : la mémoire
+  utilisée ne dépend ni du nombre ni de la taille des fichiers.
+- Au-delà de 4 Go (fichier, offset ou archive), les extensions ZIP64 sont utilisées.
+"""
+import hashlib
+import json
+import os
+import queue
+import re
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from rest_framework.renderers import BaseRenderer
+
+from .models import AccesObjet, Blob, DossierSoutenance
+from .storage import lire_fichier
+
+PROFONDEUR_FILE = 8
+LIMITE_32 = 0xFFFFFFFF
+# Seuil de passage aux champs ZIP64 (valeurs ne tenant pas sur 32 bits)
+SEUIL_ZIP64 = LIMITE_32
+DUREE_CACHE_CRC = 60 * 60 * 24 * 30
+_FIN = object()
+
+
+class EntreeArchive:
+    """Un fichier de l'archive : nom dans le ZIP et FieldFile source"""
+
+    def __init__(self, nom, fichier, date, taille=None, crc32=None, blob_id=None):
+        self.nom = nom
+        self.fichier = fichier
+        self.date = date
+        self.taille = taille
+        self.crc32 = crc32
+        self.blob_id = blob_id
+
+
+# ============================================================================
+# VISIBILITÉ ET CONTENU
+# ============================================================================
+
+def dossiers_visibles(user):
+    """
+    Dossiers dont l'utilisateur peut télécharger les documents : tous pour
+    l'administrateur, les siens pour le candidat, ceux qu'il encadre ou dont
+    il est membre du jury pour l'enseignant.
+    """
+    qs = DossierSoutenance.objects.all()
+    if user.role == 'ADMIN':
+        return qs
+    if user.role == 'CANDIDAT':
+        return qs.filter(candidat__user=user)
+    if user.role == 'ENSEIGNANT':
+        acces = AccesObjet.objects.filter(user=user)
+        return qs.filter(
+            Q(id__in=acces.filter(type_objet=AccesObjet.TypeObjet.DOSSIER).values('objet_id'))
+            | Q(soutenance__id__in=acces.filter(type_objet=AccesObjet.TypeObjet.SOUTENANCE).values('objet_id'))
+        )
+    return qs.none()
+
+
+def nettoyer(nom):
+    return re.sub(r'[\\/:*?"<>|]+', '-', nom).strip() or 'document'
+
+
+def entrees_documents(documents, par_candidat=False):
+    """
+    Entrées de l'archive pour des Document (blob et candidat chargés par
+    select_related). Un dossier par candidat si `par_candidat`.
+    """
+    entrees = []
+    noms = set()
+    for document in documents:
+        _, ext = os.path.splitext(document.fichier.name)
+        nom = nettoyer(f"{document.get_type_piece_display()} - {document.nom}")
+        if par_candidat:
+            candidat = document.dossier.candidat.user
+            nom = f"{nettoyer(candidat.get_full_name() or candidat.email)}/{nom}"
+        base, n = nom, 1
+        while f'{nom}{ext}' in noms:
+            n += 1
+            nom = f'{base} ({n})'
+        noms.add(f'{nom}{ext}')
+
+        blob = document.blob
+        entrees.append(EntreeArchive(
+            f'{nom}{ext}', document.fichier, document.uploaded_at,
+            taille=blob.taille if blob else None,
+            crc32=blob.crc32 if blob else None,
+            blob_id=blob.pk if blob else None,
+        ))
+    return entrees
+
+
+def lire(entree, debut=0, fin=None):
+    """Contenu du fichier source entre `debut` et `fin` (exclu), par morceaux"""
+    return lire_fichier(entree.fichier, debut, fin)
+
+
+def _cle_crc(entree):
+    return 'archive:crc:' + hashlib.sha256(entree.fichier.name.encode()).hexdigest()
+
+
+def completer_metadonnees(entrees):
+    """
+    Taille et CRC-32 des entrées qui ne les ont pas (documents antérieurs au
+    stockage dédupliqué) : lus en parallèle, puis mis en cache / enregistrés.
+    Retourne les entrées utilisables (fichiers introuvables écartés).
+    """
+    manquantes = [e for e in entrees if e.taille is None or e.crc32 is None]
+    if not manquantes:
+        return entrees
+    en_cache = cache.get_many([_cle_crc(e) for e in manquantes])
+    a_calculer = []
+    for entree in manquantes:
+        connu = en_cache.get(_cle_crc(entree))
+        if connu:
+            entree.taille, entree.crc32 = connu
+        else:
+            a_calculer.append(entree)
+
+    def calculer(entree):
+        taille, crc32 = 0, 0
+        try:
+            for morceau in lire(entree):
+                taille += len(morceau)
+                crc32 = zlib.crc32(morceau, crc32)
+        except FileNotFoundError:
+            return False
+        entree.taille, entree.crc32 = taille, crc32
+        return True
+
+    with ThreadPoolExecutor(max_workers=settings.ARCHIVE_THREADS) as pool:
+        trouves = dict(zip(map(id, a_calculer), pool.map(calculer, a_calculer)))
+    a_calculer = [e for e in a_calculer if trouves[id(e)]]
+
+    cache.set_many({_cle_crc(e): (e.taille, e.crc32) for e in a_calculer}, DUREE_CACHE_CRC)
+    for entree in a_calculer:
+        if entree.blob_id:
+            Blob.objects.filter(pk=entree.blob_id, crc32__isnull=True).update(crc32=entree.crc32)
+    return [e for e in entrees if trouves.get(id(e), True)]
+
+
+# ============================================================================
+# FORMAT ZIP
+# ============================================================================
+
+def _date_dos(moment):
+    local = timezone.localtime(moment)
+    heure = (local.hour << 11) | (local.minute << 5) | (local.second // 2)
+    date = ((max(local.year, 1980) - 1980) << 9) | (local.month << 5) | local.day
+    return heure, date
+
+
+def _entete_locale(entree):
+    nom = entree.nom.encode()
+    heure, date = _date_dos(entree.date)
+    zip64 = entree.taille >= SEUIL_ZIP64
+    extra = struct.pack('<HHQQ', 0x0001, 16, entree.taille, entree.taille) if zip64 else b''
+    taille = LIMITE_32 if zip64 else entree.taille
+    return struct.pack(
+        '<IHHHHHIIIHH', 0x04034B50, 45 if zip64 else 20, 0x0800, 0,
+        heure, date, entree.crc32, taille, taille, len(nom), len(extra)
+    ) + nom + extra
+
+
+def _entete_centrale(entree, offset):
+    nom = entree.nom.encode()
+    heure, date = _date_dos(entree.date)
+    champs64 = []
+    taille = entree.taille
+    if taille >= SEUIL_ZIP64:
+        champs64 += [taille, taille]
+        taille = LIMITE_32
+    if offset >= SEUIL_ZIP64:
+        champs64.append(offset)
+        offset = LIMITE_32
+    extra = struct.pack(f'<HH{len(champs64)}Q', 0x0001, 8 * len(champs64), *champs64) if champs64 else b''
+    version = 45 if champs64 else 20
+    return struct.pack(
+        '<IHHHHHHIIIHHHHHII', 0x02014B50, version, version, 0x0800, 0,
+        heure, date, entree.crc32, taille, taille, len(nom), len(extra), 0, 0, 0, 0, offset
+    ) + nom + extra
+
+
+def _fin_archive(nb, debut_repertoire, taille_repertoire):
+    fin = b''
+    if nb >= 0xFFFF or debut_repertoire >= SEUIL_ZIP64 or taille_repertoire >= SEUIL_ZIP64:
+        offset_zip64 = debut_repertoire + taille_repertoire
+        fin += struct.pack(
+            '<IQHHIIQQQQ', 0x06064B50, 44, 45, 45, 0, 0,
+            nb, nb, taille_repertoire, debut_repertoire
+        )
+        fin += struct.pack('<IIQI', 0x07064B50, 0, offset_zip64, 1)
+        nb, debut_repertoire, taille_repertoire = (
+            min(nb, 0xFFFF), min(debut_repertoire, LIMITE_32), min(taille_repertoire, LIMITE_32)
+        )
+    return fin + struct.pack(
+        '<IHHHHIIH', 0x06054B50, 0, 0, nb, nb, taille_repertoire, debut_repertoire, 0
+    )
+
+
+def plan_archive(entrees):
+    """
+    Disposition de l'archive : liste de segments (debut, fin, contenu) où
+    contenu est un bloc d'octets ou une EntreeArchive. Retourne (segments, taille).
+    """
+    segments = []
+    centrales = []
+    position = 0
+    for entree in entrees:
+        entete = _entete_locale(entree)
+        centrales.append(_entete_centrale(entree, position))
+        segments.append((position, position + len(entete), entete))
+        position += len(entete)
+        segments.append((position, position + entree.taille, entree))
+        position += entree.taille
+
+    repertoire = b''.join(centrales)
+    repertoire += _fin_archive(len(entrees), position, len(repertoire))
+    segments.append((position, position + len(repertoire), repertoire))
+    return segments, position + len(repertoire)
+
+
+def produire(segments, debut, fin):
+    """Octets [debut, fin) de l'archive, fichiers lus en parallèle (pool borné)"""
+    morceaux = []
+    for s_debut, s_fin, contenu in segments:
+        if s_fin <= debut or s_debut >= fin or s_debut == s_fin:
+            continue
+        a, b = max(debut, s_debut) - s_debut, min(fin, s_fin) - s_debut
+        if isinstance(contenu, bytes):
+            morceaux.append(contenu[a:b])
+        else:
+            morceaux.append((contenu, a, b))
+
+    taches = [m for m in morceaux if not isinstance(m, bytes)]
+    arret = threading.Event()
+    files = [queue.Queue(maxsize=PROFONDEUR_FILE) for _ in taches]
+
+    def deposer(file, element):
+        while not arret.is_set():
+            try:
+                file.put(element, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def remplir(indice):
+        entree, a, b = taches[indice]
+        try:
+            for morceau in lire(entree, a, b):
+                if not deposer(files[indice], morceau):
+                    return
+            deposer(files[indice], _FIN)
+        except Exception as exc:
+            deposer(files[indice], exc)
+
+    nb_threads = settings.ARCHIVE_THREADS
+    pool = ThreadPoolExecutor(max_workers=nb_threads)
+    try:
+        # Lecture anticipée des `nb_threads` fichiers suivants
+        for indice in range(min(nb_threads, len(taches))):
+            pool.submit(remplir, indice)
+        suivant = min(nb_threads, len(taches))
+        indice = 0
+        for morceau in morceaux:
+            if isinstance(morceau, bytes):
+                yield morceau
+                continue
+            while True:
+                element = files[indice].get()
+                if element is _FIN:
+                    break
+                if isinstance(element, Exception):
+                    raise element
+                yield element
+            indice += 1
+            if suivant < len(taches):
+                pool.submit(remplir, suivant)
+                suivant += 1
+    finally:
+        # Client déconnecté ou archive terminée : libérer les threads
+        arret.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ============================================================================
+# RÉPONSE HTTP
+# ============================================================================
+
+class ZipRenderer(BaseRenderer):
+    """
+    Permet aux clients d'envoyer `Accept: application/zip` sans obtenir un 406 ;
+    les erreurs éventuelles restent rendues en JSON.
+    """
+    media_type = 'application/zip'
+    format = 'zip'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return json.dumps(data).encode()
+
+
+def _plage_demandee(request, taille, etag):
+    """(debut, fin) demandés par l'en-tête Range, None sinon ; ValueError si insatisfiable"""
+    plage = request.headers.get('Range', '')
+    if_range = request.headers.get('If-Range')
+    if not plage.startswith('bytes=') or ',' in plage or (if_range and if_range != etag):
+        return None
+    premier, _, dernier = plage[len('bytes='):].strip().partition('-')
+    if not premier:
+        # Suffixe : les N derniers octets
+        debut, fin = max(taille - int(dernier), 0), taille
+    else:
+        debut = int(premier)
+        fin = min(int(dernier) + 1, taille) if dernier else taille
+    if debut >= fin:
+        raise ValueError(plage)
+    return debut, fin
+
+
+def reponse_archive(request, entrees, nom_archive):
+    """Réponse ZIP en flux, avec prise en charge de Range / If-Range"""
+    entrees = completer_metadonnees(entrees)
+    segments, taille = plan_archive(entrees)
+    etag = '"%s"' % hashlib.sha256('|'.join(
+        f'{e.nom}:{e.taille}:{e.crc32}' for e in entrees
+    ).encode()).hexdigest()[:32]
+
+    try:
+        plage = _plage_demandee(request, taille, etag)
+    except ValueError:
+        reponse = HttpResponse(status=416)
+        reponse['Content-Range'] = f'bytes */{taille}'
+        return reponse
+
+    debut, fin = plage or (0, taille)
+    reponse = StreamingHttpResponse(
+        produire(segments, debut, fin),
+        status=206 if plage else 200,
+        content_type='application/zip'
+    )
+    if plage:
+        reponse['Content-Range'] = f'bytes {debut}-{fin - 1}/{taille}'
+    reponse['Content-Length'] = str(fin - debut)
+    reponse['Accept-Ranges'] = 'bytes'
+    reponse['ETag'] = etag
+    reponse['Content-Disposition'] = content_disposition_header(True, nom_archive)
+    return reponse
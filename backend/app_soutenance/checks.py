@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+CACHES_LOCAUX = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def cache_analytics_partage(app_configs, **kwargs):
+    """Le limiteur analytics n'est effectif entre workers qu'avec un cache partagé"""
+    alias = getattr(settings, 'ANALYTICS_CACHE', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if settings.DEBUG or backend not in CACHES_LOCAUX:
+        return []
+    return [Warning(
+        f"Le cache '{alias}' ({backend}) est propre à chaque processus : l'anti-doublon "
+        "analytics n'est pas partagé entre workers.",
+        hint="Définir REDIS_URL, ou pointer ANALYTICS_CACHE vers un cache partagé.",
+        id='app_soutenance.W001',
+    )]
@@ -0,0 +1,213 @@
+"""
+Détection des doubles réservations : une salle ou un enseignant (membre du
+jury ou encadreur) pris par deux soutenances qui se chevauchent.
+
+Une soutenance occupe [date_heure, date_heure + duree_minutes). Les
+soutenances annulées ou sans date n'occupent rien.
+
+- Sous PostgreSQL, une contrainte d'exclusion sur la colonne `creneau`
+  (tstzrange, migration 0013) interdit en base tout chevauchement de salle,
+  même entre requêtes concurrentes. Un chevauchement d'enseignant passe par
+  MembreJury et ne peut pas s'exprimer par une contrainte d'une seule table.
+- Pour les enseignants, et pour les salles sur les autres bases, la
+  vérification se fait ici avec un arbre d'intervalles par ressource :
+  construction O(n log n), recherche O(log n + k), sans comparer les
+  soutenances deux à deux.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import DossierSoutenance, EnseignantProfile, MembreJury, Salle, Soutenance
+
+
+class ArbreIntervalles:
+    """
+    Arbre d'intervalles statique : les intervalles (début, fin, valeur) sont
+    triés par début ; le milieu de chaque tranche est un nœud, qui porte la
+    fin maximale de sa tranche pour élaguer les sous-arbres.
+    """
+
+    def __init__(self, intervalles):
+        self.intervalles = sorted(intervalles, key=lambda i: i[0])
+        self.fin_max = [None] * len(self.intervalles)
+        if self.intervalles:
+            self._construire(0, len(self.intervalles))
+
+    def _construire(self, bas, haut):
+        milieu = (bas + haut) // 2
+        fin = self.intervalles[milieu][1]
+        if bas < milieu:
+            fin = max(fin, self._construire(bas, milieu))
+        if milieu + 1 < haut:
+            fin = max(fin, self._construire(milieu + 1, haut))
+        self.fin_max[milieu] = fin
+        return fin
+
+    def chevauchants(self, debut, fin):
+        """Intervalles qui chevauchent [debut, fin)"""
+        resultat = []
+        tranches = [(0, len(self.intervalles))]
+        while tranches:
+            bas, haut = tranches.pop()
+            if bas >= haut:
+                continue
+            milieu = (bas + haut) // 2
+            if self.fin_max[milieu] <= debut:
+                continue
+            tranches.append((bas, milieu))
+            intervalle = self.intervalles[milieu]
+            if intervalle[0] < fin:
+                if intervalle[1] > debut:
+                    resultat.append(intervalle)
+                tranches.append((milieu + 1, haut))
+        return resultat
+
+
+# ============================================================================
+# OCCUPATIONS
+# ============================================================================
+
+def soutenances_occupantes():
+    return Soutenance.objects.filter(date_heure__isnull=False).exclude(statut=Soutenance.Statut.ANNULEE)
+
+
+def dans_la_fenetre(soutenances, debut, fin):
+    """Restreindre aux soutenances pouvant chevaucher [debut, fin) (filtre exact ensuite)"""
+    duree_max = soutenances.aggregate(duree=Max('duree_minutes'))['duree'] or 0
+    return soutenances.filter(date_heure__lt=fin, date_heure__gt=debut - timedelta(minutes=duree_max))
+
+
+def occupations(soutenances):
+    """
+    [(soutenance_id, début, fin, salle_id, {enseignant_id})] en deux requêtes.
+    Les enseignants sont les membres du jury et l'encadreur du dossier.
+    """
+    lignes = list(soutenances.values_list(
+        'id', 'date_heure', 'duree_minutes', 'salle_id', 'jury_id', 'dossier__encadreur_id'
+    ))
+    membres = defaultdict(set)
+    for jury_id, enseignant_id in MembreJury.objects.filter(
+        jury_id__in={ligne[4] for ligne in lignes if ligne[4]}
+    ).values_list('jury_id', 'enseignant_id'):
+        membres[jury_id].add(enseignant_id)
+
+    resultat = []
+    for soutenance_id, debut, duree, salle_id, jury_id, encadreur_id in lignes:
+        enseignants = set(membres.get(jury_id, ()))
+        if encadreur_id:
+            enseignants.add(encadreur_id)
+        resultat.append((soutenance_id, debut, debut + timedelta(minutes=duree), salle_id, enseignants))
+    return resultat
+
+
+def par_ressource(occupations):
+    """{('SALLE'|'ENSEIGNANT', id): [(début, fin, soutenance_id)]}"""
+    ressources = defaultdict(list)
+    for soutenance_id, debut, fin, salle_id, enseignants in occupations:
+        if salle_id:
+            ressources[('SALLE', salle_id)].append((debut, fin, soutenance_id))
+        for enseignant_id in enseignants:
+            ressources[('ENSEIGNANT', enseignant_id)].append((debut, fin, soutenance_id))
+    return ressources
+
+
+def noms_ressources(cles):
+    """Libellés lisibles des ressources en conflit (deux requêtes au plus)"""
+    salles = {c[1] for c in cles if c[0] == 'SALLE'}
+    enseignants = {c[1] for c in cles if c[0] == 'ENSEIGNANT'}
+    noms = {('SALLE', s.pk): str(s) for s in Salle.objects.filter(pk__in=salles)}
+    noms.update({
+        ('ENSEIGNANT', e.pk): e.user.get_full_name()
+        for e in EnseignantProfile.objects.filter(pk__in=enseignants).select_related('user')
+    })
+    return noms
+
+
+def decrire(cle, noms, soutenance_id, autre_id, debut, fin):
+    return {
+        'type': cle[0],
+        'ressource_id': cle[1],
+        'ressource': noms.get(cle, ''),
+        'soutenances': [soutenance_id, autre_id],
+        'debut': timezone.localtime(max(debut)),
+        'fin': timezone.localtime(min(fin)),
+    }
+
+
+# ============================================================================
+# VÉRIFICATIONS
+# ============================================================================
+
+def conflits_soutenance(soutenance):
+    """
+    Conflits qu'entraînerait l'enregistrement de `soutenance` (instance
+    éventuellement non sauvegardée) avec les autres soutenances.
+    """
+    if soutenance.date_heure is None or soutenance.statut == Soutenance.Statut.ANNULEE:
+        return []
+    debut = soutenance.date_heure
+    fin = debut + timedelta(minutes=soutenance.duree_minutes)
+    # Identifiant éventuellement reçu en texte (planifier)
+    salle_id = Salle._meta.pk.to_python(soutenance.salle_id) if soutenance.salle_id else None
+
+    enseignants = set(MembreJury.objects.filter(jury_id=soutenance.jury_id).values_list('enseignant_id', flat=True)) \
+        if soutenance.jury_id else set()
+    encadreur_id = DossierSoutenance.objects.filter(pk=soutenance.dossier_id).values_list('encadreur_id', flat=True).first()
+    if encadreur_id:
+        enseignants.add(encadreur_id)
+
+    ressources = Q(jury__composition__enseignant_id__in=enseignants) | Q(dossier__encadreur_id__in=enseignants)
+    if salle_id:
+        ressources |= Q(salle_id=salle_id)
+    autres = dans_la_fenetre(soutenances_occupantes().exclude(pk=soutenance.pk), debut, fin) \
+        .filter(ressources).distinct()
+
+    index = par_ressource(occupations(autres))
+    cles = [('SALLE', salle_id)] if salle_id else []
+    cles += [('ENSEIGNANT', e) for e in enseignants]
+
+    trouves = [
+        (cle, autre)
+        for cle in cles if cle in index
+        for autre in ArbreIntervalles(index[cle]).chevauchants(debut, fin)
+    ]
+    noms = noms_ressources({cle for cle, _ in trouves})
+    return [
+        decrire(cle, noms, soutenance.pk, autre_id, (debut, autre_debut), (fin, autre_fin))
+        for cle, (autre_debut, autre_fin, autre_id) in trouves
+    ]
+
+
+def conflits_session(session):
+    """
+    Tous les conflits impliquant au moins une soutenance de la session (y
+    compris avec des soutenances d'autres sessions). O(n log n + k).
+    """
+    de_la_session = list(soutenances_occupantes().filter(dossier__session=session).values_list(
+        'id', 'date_heure', 'duree_minutes'
+    ))
+    if not de_la_session:
+        return []
+    debut = min(ligne[1] for ligne in de_la_session)
+    fin = max(ligne[1] + timedelta(minutes=ligne[2]) for ligne in de_la_session)
+    ids_session = {ligne[0] for ligne in de_la_session}
+
+    index = par_ressource(occupations(dans_la_fenetre(soutenances_occupantes(), debut, fin)))
+    trouves = []
+    for cle, intervalles in index.items():
+        if len(intervalles) < 2:
+            continue
+        arbre = ArbreIntervalles(intervalles)
+        for inter_debut, inter_fin, soutenance_id in intervalles:
+            for autre_debut, autre_fin, autre_id in arbre.chevauchants(inter_debut, inter_fin):
+                # Chaque paire une seule fois, et seulement si elle touche la session
+                if str(soutenance_id) < str(autre_id) and (soutenance_id in ids_session or autre_id in ids_session):
+                    trouves.append((cle, soutenance_id, autre_id, (inter_debut, autre_debut), (inter_fin, autre_fin)))
+
+    noms = noms_ressources({t[0] for t in trouves})
+    conflits = [decrire(cle, noms, *reste) for cle, *reste in trouves]
+    conflits.sort(key=lambda c: (c['debut'], c['type'], c['ressource']))
+    return conflits
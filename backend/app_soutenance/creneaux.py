@@ -0,0 +1,118 @@
+"""
+Recherche de créneaux libres : salles disponibles × enseignants d'un jury.
+
+Les occupations d'une journée (soutenances, salles, enseignants) sont
+chargées d'un bloc, puis mises en cache par jour. La clé porte une version
+de la journée calculée en base (comme l'ETag des flux iCalendar) : une
+seule requête d'agrégat sur les soutenances proches, leurs dossiers et la
+composition de leurs jurys. Tout changement, quel que soit le worker qui
+l'a fait (ou un bulk_update), change la version : le cache peut rester
+local au processus sans servir de créneaux périmés.
+
+Pour chaque salle, les intervalles occupés (salle + enseignants du jury)
+sont fusionnés par balayage, et les trous d'au moins `duree` minutes dans
+la plage horaire sont retournés.
+"""
+import hashlib
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .conflits import dans_la_fenetre, occupations, soutenances_occupantes
+from .models import MembreJury, Salle, Soutenance
+
+DUREE_CACHE = 60 * 60 * 24
+
+
+def version_jour(jour):
+    """
+    Empreinte de tout ce dont dépendent les occupations de la journée.
+    Fenêtre élargie à la veille (soutenances débordant sur le jour) : un
+    changement la veille invalide aussi, ce qui reste correct.
+    """
+    debut, fin = bornes_jour(jour)
+    agregat = Soutenance.objects.filter(
+        date_heure__gte=debut - timedelta(days=1), date_heure__lt=fin
+    ).aggregate(
+        nb=Count('id', distinct=True),
+        maj=Max('updated_at'),
+        maj_dossiers=Max('dossier__updated_at'),
+        nb_membres=Count('jury__composition'),
+        maj_membres=Max('jury__composition__created_at'),
+    )
+    empreinte = ':'.join(str(agregat[cle]) for cle in sorted(agregat))
+    return hashlib.sha256(empreinte.encode()).hexdigest()[:32]
+
+
+def bornes_jour(jour, heure_debut=None, heure_fin=None):
+    """Plage [début, fin) aware de la journée (journée entière par défaut)"""
+    debut = datetime.combine(jour, heure_debut or time.min)
+    fin = datetime.combine(jour, heure_fin) if heure_fin else datetime.combine(jour + timedelta(days=1), time.min)
+    return timezone.make_aware(debut), timezone.make_aware(fin)
+
+
+def occupations_du_jour(jour):
+    """[(soutenance_id, début, fin, salle_id, {enseignant_id})] de la journée, en cache"""
+    cle = f'creneaux:occupations:{jour.isoformat()}:{version_jour(jour)}'
+    resultat = cache.get(cle)
+    if resultat is None:
+        debut, fin = bornes_jour(jour)
+        resultat = occupations(dans_la_fenetre(soutenances_occupantes(), debut, fin))
+        cache.set(cle, resultat, DUREE_CACHE)
+    return resultat
+
+
+def fusionner(intervalles):
+    """Union d'intervalles [début, fin) par balayage, triée"""
+    fusion = []
+    for debut, fin in sorted(intervalles):
+        if fusion and debut <= fusion[-1][1]:
+            if fin > fusion[-1][1]:
+                fusion[-1][1] = fin
+        else:
+            fusion.append([debut, fin])
+    return fusion
+
+
+def trous(occupes, debut, fin, duree):
+    """Intervalles libres d'au moins `duree` dans [debut, fin), `occupes` étant fusionnés"""
+    libres = []
+    curseur = debut
+    for occ_debut, occ_fin in occupes:
+        if occ_fin <= curseur:
+            continue
+        if occ_debut >= fin:
+            break
+        if occ_debut - curseur >= duree:
+            libres.append((curseur, occ_debut))
+        curseur = max(curseur, occ_fin)
+    if fin - curseur >= duree:
+        libres.append((curseur, fin))
+    return libres
+
+
+def creneaux_libres(jour, duree_minutes, jury_id=None, heure_debut=None, heure_fin=None):
+    """[(salle, [(début, fin)])] pour les salles disponibles ayant au moins un créneau"""
+    debut, fin = bornes_jour(jour, heure_debut, heure_fin)
+    duree = timedelta(minutes=duree_minutes)
+    enseignants = set(
+        MembreJury.objects.filter(jury_id=jury_id).values_list('enseignant_id', flat=True)
+    ) if jury_id else set()
+
+    par_salle = {}
+    occupes_jury = []
+    for _, occ_debut, occ_fin, salle_id, occ_enseignants in occupations_du_jour(jour):
+        if salle_id:
+            par_salle.setdefault(salle_id, []).append((occ_debut, occ_fin))
+        if enseignants & occ_enseignants:
+            occupes_jury.append((occ_debut, occ_fin))
+
+    resultat = []
+    for salle in Salle.objects.filter(est_disponible=True).order_by('batiment', 'nom'):
+        occupes = fusionner(par_salle.get(salle.pk, []) + occupes_jury)
+        libres = trous(occupes, debut, fin, duree)
+        if libres:
+            resultat.append((salle, libres))
+    return resultat
@@ -0,0 +1,173 @@
+"""
+Stockage dédupliqué (adressé par contenu) des documents.
+
+- L'empreinte SHA-256 (et le CRC-32, utile aux archives ZIP) est calculée pendant
+  la réception de la requête par les upload handlers ci-dessous
+  (FILE_UPLOAD_HANDLERS) : pas de relecture du fichier.
+- Un contenu déjà connu n'est ni ré-uploadé ni re-stocké : le Document pointe
+  vers le Blob existant dont le compteur de références est incrémenté.
+- À la suppression d'un Document (ou de son dossier, par cascade), la référence
+  est libérée ; les blobs sans référence sont supprimés du stockage après commit.
+"""
+import hashlib
+import os
+import zlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F, ProtectedError
+
+TAILLE_LECTURE = 64 * 1024
+
+
+# ============================================================================
+# UPLOAD HANDLERS (hachage à la volée)
+# ============================================================================
+
+class HachageUploadMixin:
+    """Calcule l'empreinte SHA-256 et le CRC-32 du fichier au fil des morceaux reçus"""
+
+    def new_file(self, *args, **kwargs):
+        # Avant super() : MemoryFileUploadHandler lève StopFutureHandlers
+        self._hachage = hashlib.sha256()
+        self._crc32 = 0
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hachage.update(raw_data)
+        self._crc32 = zlib.crc32(raw_data, self._crc32)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        fichier = super().file_complete(file_size)
+        if fichier is not None:
+            fichier.sha256 = self._hachage.hexdigest()
+            fichier.crc32 = self._crc32
+        return fichier
+
+
+class HachageMemoryFileUploadHandler(HachageUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HachageTemporaryFileUploadHandler(HachageUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+# ============================================================================
+# BLOBS
+# ============================================================================
+
+def empreinte_fichier(fichier):
+    """(empreinte SHA-256, taille, CRC-32) d'un fichier, sans relecture si déjà hachée à l'upload"""
+    source = getattr(fichier, 'file', None) or fichier
+    empreinte = getattr(source, 'sha256', None)
+    if empreinte:
+        return empreinte, fichier.size, getattr(source, 'crc32', None)
+
+    hachage = hashlib.sha256()
+    crc32 = 0
+    taille = 0
+    if hasattr(fichier, 'seek'):
+        fichier.seek(0)
+    for morceau in fichier.chunks(TAILLE_LECTURE):
+        hachage.update(morceau)
+        crc32 = zlib.crc32(morceau, crc32)
+        taille += len(morceau)
+    if hasattr(fichier, 'seek'):
+        fichier.seek(0)
+    return hachage.hexdigest(), taille, crc32
+
+
+def _referencer(empreinte):
+    """Ajouter une référence au blob existant (None s'il n'existe pas)"""
+    from .models import Blob
+
+    if Blob.objects.filter(empreinte=empreinte).update(nb_references=F('nb_references') + 1):
+        return Blob.objects.get(empreinte=empreinte)
+    return None
+
+
+def stocker(fichier):
+    """
+    Retourner le Blob du contenu de `fichier` (avec une référence de plus),
+    en ne l'envoyant au stockage que s'il est inconnu.
+    """
+    from .models import Blob
+
+    empreinte, taille, crc32 = empreinte_fichier(fichier)
+    blob = _referencer(empreinte)
+    if blob is not None:
+        return blob
+
+    _, ext = os.path.splitext(fichier.name or '')
+    blob = Blob(empreinte=empreinte, taille=taille, crc32=crc32, nb_references=1)
+    blob.fichier.save(f'{empreinte[:2]}/{empreinte}{ext.lower()}', fichier, save=False)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # Même contenu stocké en parallèle par une autre requête : garder le sien
+        blob.fichier.delete(save=False)
+        blob = _referencer(empreinte)
+    return blob
+
+
+def adopter(nom, empreinte, taille, crc32=None):
+    """
+    Blob (avec une référence de plus) pour un objet déjà envoyé au stockage
+    sous `nom` (upload direct) ; supprimé s'il fait doublon avec un blob existant.
+    """
+    from .models import Blob
+
+    blob = _referencer(empreinte)
+    if blob is None:
+        blob = Blob(empreinte=empreinte, taille=taille, crc32=crc32, nb_references=1)
+        blob.fichier.name = nom
+        try:
+            with transaction.atomic():
+                blob.save()
+            return blob
+        except IntegrityError:
+            blob = _referencer(empreinte)
+    # Jamais le fichier d'un blob existant (rejeu d'une finalisation)
+    if blob.fichier.name != nom:
+        Blob._meta.get_field('fichier').storage.delete(nom)
+    return blob
+
+
+def liberer(*blob_ids):
+    """Retirer une référence aux blobs ; ramasser ceux devenus orphelins après commit"""
+    from .models import Blob
+
+    blob_ids = [blob_id for blob_id in blob_ids if blob_id]
+    if not blob_ids:
+        return
+    for blob_id in blob_ids:
+        Blob.objects.filter(pk=blob_id, nb_references__gt=0).update(nb_references=F('nb_references') - 1)
+    transaction.on_commit(lambda: collecter(blob_ids))
+
+
+def collecter(blob_ids=None):
+    """
+    Supprimer (base puis stockage) les blobs sans référence.
+    Retourne le nombre de blobs supprimés.
+    """
+    from .models import Blob
+
+    orphelins = Blob.objects.filter(nb_references=0)
+    if blob_ids is not None:
+        orphelins = orphelins.filter(pk__in=blob_ids)
+
+    supprimes = 0
+    for blob in orphelins:
+        try:
+            # Suppression conditionnelle : le blob a pu être re-référencé entre-temps
+            if not Blob.objects.filter(pk=blob.pk, nb_references=0).delete()[0]:
+                continue
+        except ProtectedError:
+            # Compteur désynchronisé : des documents pointent encore vers le blob
+            continue
+        blob.fichier.delete(save=False)
+        supprimes += 1
+    return supprimes
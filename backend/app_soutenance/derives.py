@@ -0,0 +1,229 @@
+"""
+Fichiers dérivés : miniatures des photos de candidats et aperçus PNG de la
+première page des documents PDF.
+
+- Rien n'est calculé pendant la requête : la sauvegarde planifie le travail
+  après commit. Un thread d'arrière-plan lit la source et envoie le résultat
+  au stockage ; le calcul lui-même (Pillow, pypdfium2) s'exécute dans un pool
+  de processus (DERIVES_PROCESSUS).
+- Les dérivés sont identifiés par l'empreinte SHA-256 de la source : un contenu
+  déjà traité (même photo, même PDF déposé deux fois) n'est pas recalculé.
+- Les serializers obtiennent les URLs par url_derive(), mise en cache par
+  (empreinte, variante).
+- pypdfium2 est optionnel : sans lui, les PDF n'ont simplement pas d'aperçu.
+"""
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, close_old_connections, transaction
+
+try:
+    import pypdfium2
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    pypdfium2 = None
+
+logger = logging.getLogger(__name__)
+
+TAILLES_PHOTO = {'PHOTO_MINIATURE': 64, 'PHOTO_MOYENNE': 256}
+LARGEUR_APERCU = 600
+DUREE_CACHE = 60 * 60 * 24
+# Dérivé pas encore produit : ne pas interroger la base à chaque sérialisation
+DUREE_CACHE_ABSENT = 60
+
+
+# ============================================================================
+# CALCUL (exécuté dans les processus du pool)
+# ============================================================================
+
+def redimensionner_photo(chemin, taille):
+    """Vignette carrée JPEG de `taille` pixels (recadrage centré)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(chemin) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image = ImageOps.fit(image, (taille, taille), Image.LANCZOS)
+    sortie = io.BytesIO()
+    image.save(sortie, 'JPEG', quality=85, optimize=True)
+    return sortie.getvalue(), taille, taille
+
+
+def rendre_apercu_pdf(chemin, largeur):
+    """PNG de la première page, à `largeur` pixels"""
+    pdf = pypdfium2.PdfDocument(chemin)
+    try:
+        page = pdf[0]
+        image = page.render(scale=largeur / page.get_width()).to_pil()
+    finally:
+        pdf.close()
+    sortie = io.BytesIO()
+    image.save(sortie, 'PNG', optimize=True)
+    return sortie.getvalue(), image.width, image.height
+
+
+CALCULS = {
+    'PHOTO_MINIATURE': (redimensionner_photo, TAILLES_PHOTO['PHOTO_MINIATURE'], 'jpg'),
+    'PHOTO_MOYENNE': (redimensionner_photo, TAILLES_PHOTO['PHOTO_MOYENNE'], 'jpg'),
+    'APERCU_PDF': (rendre_apercu_pdf, LARGEUR_APERCU, 'png'),
+}
+
+
+# ============================================================================
+# ORCHESTRATION
+# ============================================================================
+
+_verrou = threading.Lock()
+_processus = None
+_threads = None
+
+
+def get_pool_processus():
+    global _processus
+    with _verrou:
+        if _processus is None:
+            # spawn : ne pas dupliquer par fork un processus serveur multi-thread
+            _processus = ProcessPoolExecutor(
+                max_workers=settings.DERIVES_PROCESSUS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+    return _processus
+
+
+def get_pool_threads():
+    global _threads
+    with _verrou:
+        if _threads is None:
+            _threads = ThreadPoolExecutor(max_workers=settings.DERIVES_PROCESSUS, thread_name_prefix='derives')
+    return _threads
+
+
+def _cle(empreinte, variante):
+    return f'derive:{empreinte}:{variante}'
+
+
+def generer(fichier, variantes, empreinte=None):
+    """
+    Produire les variantes manquantes pour le contenu de `fichier`.
+    Retourne l'empreinte SHA-256 de la source (calculée à la lecture si inconnue).
+    """
+    from .models import Derive
+    from .storage import lire_fichier
+
+    if empreinte:
+        variantes = _manquantes(empreinte, variantes)
+        if not variantes:
+            return empreinte
+
+    _, ext = os.path.splitext(fichier.name)
+    with tempfile.NamedTemporaryFile(suffix=ext) as source:
+        hachage = hashlib.sha256()
+        for morceau in lire_fichier(fichier):
+            source.write(morceau)
+            hachage.update(morceau)
+        source.flush()
+        empreinte = hachage.hexdigest()
+        variantes = _manquantes(empreinte, variantes)
+
+        pool = get_pool_processus()
+        calculs = {
+            variante: pool.submit(CALCULS[variante][0], source.name, CALCULS[variante][1])
+            for variante in variantes
+        }
+        for variante, calcul in calculs.items():
+            contenu, largeur, hauteur = calcul.result()
+            derive = Derive(empreinte_source=empreinte, variante=variante, largeur=largeur, hauteur=hauteur)
+            derive.fichier.save(
+                f'{empreinte[:2]}/{empreinte}_{variante.lower()}.{CALCULS[variante][2]}',
+                ContentFile(contenu), save=False
+            )
+            try:
+                with transaction.atomic():
+                    derive.save()
+            except IntegrityError:
+                # Produit en parallèle par un autre worker
+                derive.fichier.delete(save=False)
+                continue
+            cache.set(_cle(empreinte, variante), derive.fichier.name, DUREE_CACHE)
+    return empreinte
+
+
+def _manquantes(empreinte, variantes):
+    from .models import Derive
+
+    existantes = set(Derive.objects.filter(
+        empreinte_source=empreinte, variante__in=variantes
+    ).values_list('variante', flat=True))
+    return [v for v in variantes if v not in existantes]
+
+
+def _executer(fonction, *args):
+    try:
+        fonction(*args)
+    except Exception:
+        logger.exception("Échec de la génération des dérivés")
+    finally:
+        close_old_connections()
+
+
+def planifier(fonction, *args):
+    """Exécuter hors requête (thread d'arrière-plan) ou tout de suite si DERIVES_ASYNCHRONE=False"""
+    if settings.DERIVES_ASYNCHRONE:
+        get_pool_threads().submit(_executer, fonction, *args)
+    else:
+        fonction(*args)
+
+
+def generer_photo(candidat_id):
+    from .models import CandidatProfile
+
+    candidat = CandidatProfile.objects.filter(pk=candidat_id).first()
+    if candidat is None or not candidat.photo:
+        return
+    empreinte = generer(candidat.photo, list(TAILLES_PHOTO), candidat.photo_empreinte or None)
+    if empreinte != candidat.photo_empreinte:
+        # update() : pas de signal, pas de nouvelle planification
+        CandidatProfile.objects.filter(pk=candidat.pk, photo=candidat.photo.name).update(photo_empreinte=empreinte)
+
+
+def generer_apercu(document_id):
+    from .models import Document
+
+    document = Document.objects.select_related('blob').filter(pk=document_id).first()
+    if document is None or not est_pdf(document):
+        return
+    generer(document.fichier, ['APERCU_PDF'], document.blob.empreinte if document.blob else None)
+
+
+def est_pdf(document):
+    return pypdfium2 is not None and document.fichier.name.lower().endswith('.pdf')
+
+
+# ============================================================================
+# LECTURE (serializers)
+# ============================================================================
+
+def url_derive(empreinte, variante, request=None):
+    """URL du dérivé, ou None s'il n'est pas (encore) produit"""
+    from .models import Derive
+
+    if not empreinte:
+        return None
+    cle = _cle(empreinte, variante)
+    nom = cache.get(cle)
+    if nom is None:
+        nom = Derive.objects.filter(
+            empreinte_source=empreinte, variante=variante
+        ).values_list('fichier', flat=True).first() or ''
+        cache.set(cle, nom, DUREE_CACHE if nom else DUREE_CACHE_ABSENT)
+    if not nom:
+        return None
+    url = Derive._meta.get_field('fichier').storage.url(nom)
+    return request.build_absolute_uri(url) if request else url
@@ -0,0 +1,18 @@
+from django.db.models import Exists, OuterRef
+
+from .models import AccesObjet
+
+
+def acces_enseignant(user, type_objet, champ='pk'):
+    """
+    Condition EXISTS : l'objet (identifié par `champ`) figure dans l'index de
+    visibilité AccesObjet de l'enseignant `user`. Recherche corrélée sur la
+    clé unique (user, type_objet, objet_id), sans jointure multipliante.
+
+    À appliquer dans get_queryset (et non dans un filter backend) : toute
+    action, y compris celles qui ne passent pas par filter_queryset, ne voit
+    ainsi que les objets autorisés.
+    """
+    return Exists(AccesObjet.objects.filter(
+        user=user, type_objet=type_objet, objet_id=OuterRef(champ)
+    ))
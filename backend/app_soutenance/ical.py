@@ -0,0 +1,174 @@
+"""
+Génération des flux iCalendar (.ics) des soutenances.
+
+Un flux est identifié par (type_flux, objet_id) :
+- enseignant : soutenances dont l'enseignant est membre du jury
+- salle      : soutenances ayant lieu dans la salle
+- session    : soutenances de la session
+
+Chaque VEVENT dépend de la soutenance et de champs de ses relations (titre
+du dossier, nom du candidat, jury, salle), qui n'ont pas tous d'updated_at.
+Sa signature est donc l'empreinte de ces valeurs (CHAMPS_EVENEMENT), lues en
+une requête sans rendu. La version d'un flux (ETag) est l'empreinte des
+signatures de ses lignes : tant qu'elle ne change pas, le flux est servi
+depuis le cache (ou par un 304). Chaque VEVENT est lui-même mis en cache par
+signature, si bien qu'un flux n'est re-rendu que pour les lignes modifiées.
+"""
+import hashlib
+from datetime import timedelta, timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.utils.crypto import constant_time_compare
+
+from .models import MembreJury, Soutenance
+
+TYPES_FLUX = ('enseignant', 'salle', 'session')
+DUREE_CACHE = 60 * 60 * 24
+FORMAT_DATE = '%Y%m%dT%H%M%SZ'
+_signer = signing.Signer(salt='app_soutenance.ical')
+
+
+def signer_flux(type_flux, objet_id):
+    """Jeton d'abonnement (les clients calendrier ne transmettent pas de JWT)"""
+    return _signer.signature(f'{type_flux}:{objet_id}')
+
+
+def verifier_jeton(type_flux, objet_id, jeton):
+    return bool(jeton) and constant_time_compare(jeton, signer_flux(type_flux, objet_id))
+
+
+def soutenances_du_flux(type_flux, objet_id):
+    qs = Soutenance.objects.filter(date_heure__isnull=False)
+    if type_flux == 'enseignant':
+        return qs.filter(Exists(MembreJury.objects.filter(
+            jury=OuterRef('jury'), enseignant_id=objet_id
+        )))
+    if type_flux == 'salle':
+        return qs.filter(salle_id=objet_id)
+    if type_flux == 'session':
+        return qs.filter(dossier__session_id=objet_id)
+    raise ValueError(f"Type de flux inconnu : {type_flux}")
+
+
+# Valeurs dont dépend le rendu d'un VEVENT (soutenance et relations)
+CHAMPS_EVENEMENT = (
+    'id', 'updated_at', 'dossier__updated_at',
+    'dossier__candidat__user__first_name', 'dossier__candidat__user__last_name',
+    'jury__nom', 'salle__nom', 'salle__batiment',
+)
+
+
+def signature(valeurs):
+    """Empreinte des CHAMPS_EVENEMENT d'une soutenance"""
+    return hashlib.sha256(repr(tuple(valeurs)).encode()).hexdigest()[:32]
+
+
+def valeurs_evenement(soutenance):
+    """CHAMPS_EVENEMENT lus sur une instance (relations chargées)"""
+    user = soutenance.dossier.candidat.user
+    return (
+        soutenance.id, soutenance.updated_at, soutenance.dossier.updated_at,
+        user.first_name, user.last_name,
+        soutenance.jury.nom if soutenance.jury else None,
+        soutenance.salle.nom if soutenance.salle else None,
+        soutenance.salle.batiment if soutenance.salle else None,
+    )
+
+
+def version_flux(type_flux, objet_id):
+    """ETag du flux : une requête sur les seules colonnes utiles, sans rendu"""
+    empreinte = hashlib.sha256(f'{type_flux}:{objet_id}'.encode())
+    for valeurs in soutenances_du_flux(type_flux, objet_id).order_by('id').values_list(*CHAMPS_EVENEMENT):
+        empreinte.update(signature(valeurs).encode())
+    return empreinte.hexdigest()[:32]
+
+
+def echapper(texte):
+    """Échappement des valeurs TEXT (RFC 5545 §3.3.11)"""
+    return (
+        str(texte).replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def plier(ligne):
+    """Repli des lignes longues à 75 caractères (RFC 5545 §3.1)"""
+    morceaux = [ligne[:75]]
+    ligne = ligne[75:]
+    while ligne:
+        morceaux.append(' ' + ligne[:74])
+        ligne = ligne[74:]
+    return '\r\n'.join(morceaux)
+
+
+def format_utc(moment):
+    return moment.astimezone(timezone.utc).strftime(FORMAT_DATE)
+
+
+def rendre_evenement(soutenance):
+    """Rendu d'un VEVENT pour une soutenance (relations chargées par select_related)"""
+    debut = soutenance.date_heure
+    fin = debut + timedelta(minutes=soutenance.duree_minutes)
+    candidat = soutenance.dossier.candidat.user.get_full_name()
+    description = soutenance.dossier.titre_memoire
+    if soutenance.jury:
+        description += f"\nJury : {soutenance.jury.nom}"
+
+    lignes = [
+        'BEGIN:VEVENT',
+        f'UID:{soutenance.id}@soutenances',
+        f'DTSTAMP:{format_utc(soutenance.updated_at)}',
+        f'DTSTART:{format_utc(debut)}',
+        f'DTEND:{format_utc(fin)}',
+        f'SUMMARY:{echapper(f"Soutenance - {candidat}")}',
+        f'DESCRIPTION:{echapper(description)}',
+    ]
+    if soutenance.salle:
+        lignes.append(f'LOCATION:{echapper(f"{soutenance.salle.nom} ({soutenance.salle.batiment})")}')
+    lignes.append('STATUS:CANCELLED' if soutenance.statut == Soutenance.Statut.ANNULEE else 'STATUS:CONFIRMED')
+    lignes.append('END:VEVENT')
+    return '\r\n'.join(plier(ligne) for ligne in lignes)
+
+
+def rendre_flux(type_flux, objet_id):
+    """Assembler le flux, en ne rendant que les VEVENT absents du cache"""
+    soutenances = list(
+        soutenances_du_flux(type_flux, objet_id)
+        .select_related('dossier__candidat__user', 'jury', 'salle')
+        .order_by('date_heure')
+    )
+    cles = {s.id: f'ics:vevent:{signature(valeurs_evenement(s))}' for s in soutenances}
+    en_cache = cache.get_many(list(cles.values()))
+
+    manquants = {}
+    evenements = []
+    for s in soutenances:
+        evenement = en_cache.get(cles[s.id])
+        if evenement is None:
+            evenement = manquants[cles[s.id]] = rendre_evenement(s)
+        evenements.append(evenement)
+    if manquants:
+        cache.set_many(manquants, DUREE_CACHE)
+
+    entete = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Gestion des Soutenances//FR',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-TIMEZONE:{settings.TIME_ZONE}',
+    ]
+    return '\r\n'.join(entete + evenements + ['END:VCALENDAR']) + '\r\n'
+
+
+def obtenir_flux(type_flux, objet_id, version=None):
+    """Flux rendu pour une version donnée (mis en cache par version)"""
+    version = version or version_flux(type_flux, objet_id)
+    cle = f'ics:flux:{version}'
+    contenu = cache.get(cle)
+    if contenu is None:
+        contenu = rendre_flux(type_flux, objet_id)
+        cache.set(cle, contenu, DUREE_CACHE)
+    return contenu
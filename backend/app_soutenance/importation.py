@@ -0,0 +1,284 @@
+"""
+Import par lot de candidats et d'enseignants depuis un fichier CSV ou XLSX.
+
+Colonnes (en-tête obligatoire, ordre libre) :
+- communes     : email, first_name, last_name, password, username, phone
+- candidats    : matricule, cycle, departement (code)
+- enseignants  : grade, departements (codes séparés par « ; » ou « | »)
+
+Le fichier est lu ligne à ligne et traité par lots de TAILLE_LOT :
+- chaque ligne est validée seule (serializer de ligne) ;
+- l'unicité email / username / matricule est vérifiée en une requête
+  ensembliste par lot, et contre les lignes précédentes du fichier ;
+- les mots de passe sont hachés dans un pool de processus (PBKDF2, environ
+  0,3 s de CPU chacun), hors transaction ; sans mot de passe, le compte
+  reçoit un mot de passe inutilisable, à définir ensuite par l'utilisateur
+  (réinitialisation) ou l'administrateur ;
+- utilisateurs, profils et départements sont écrits par bulk_create.
+
+Les lignes invalides sont ignorées et décrites dans le rapport ; les
+lignes valides sont enregistrées ensuite, en une seule transaction courte.
+L'import HTTP ne hache rien (mots de passe inutilisables) : les mots de
+passe du fichier ne sont repris que par la commande importer_profils.
+"""
+import csv
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import serializers
+
+from .acces import enseignants_des_departements, synchroniser_acces
+from .models import CandidatProfile, CustomUser, Departement, EnseignantProfile
+
+TAILLE_LOT = 500
+
+
+class FichierInvalide(ValueError):
+    """Fichier illisible ou vide"""
+
+
+# ============================================================================
+# LECTURE
+# ============================================================================
+
+def _texte(valeur):
+    """Valeur de cellule en texte (nombres entiers d'Excel sans « .0 »)"""
+    if valeur is None:
+        return ''
+    if isinstance(valeur, float) and valeur.is_integer():
+        valeur = int(valeur)
+    return str(valeur).strip()
+
+
+def _lignes_csv(fichier):
+    texte = io.TextIOWrapper(fichier, encoding='utf-8-sig', newline='')
+    try:
+        dialecte = csv.Sniffer().sniff(texte.read(4096), delimiters=',;\t')
+    except csv.Error:
+        dialecte = csv.excel
+    texte.seek(0)
+    for ligne in csv.reader(texte, dialecte):
+        yield ligne
+
+
+def _lignes_xlsx(fichier):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise FichierInvalide("Import XLSX indisponible : installer openpyxl, ou fournir un CSV")
+    try:
+        classeur = load_workbook(fichier, read_only=True, data_only=True)
+    except Exception:
+        raise FichierInvalide("Fichier XLSX illisible")
+    try:
+        for ligne in classeur.active.iter_rows(values_only=True):
+            yield ligne
+    finally:
+        classeur.close()
+
+
+def lire_lignes(fichier, nom):
+    """
+    Itérer sur (numéro de ligne, {colonne: valeur}) du fichier binaire
+    `fichier`, au format déduit de l'extension de `nom`. Lignes vides ignorées.
+    """
+    try:
+        lignes = _lignes_xlsx(fichier) if nom.lower().endswith('.xlsx') else _lignes_csv(fichier)
+        entete = next(lignes, None)
+    except UnicodeDecodeError:
+        raise FichierInvalide("Le CSV doit être encodé en UTF-8")
+    if not entete:
+        raise FichierInvalide("Fichier vide")
+    colonnes = [_texte(c).lower() for c in entete]
+
+    try:
+        for numero, ligne in enumerate(lignes, start=2):
+            valeurs = [_texte(v) for v in ligne]
+            if any(valeurs):
+                yield numero, {c: v for c, v in zip(colonnes, valeurs) if c and v}
+    except UnicodeDecodeError:
+        raise FichierInvalide("Le CSV doit être encodé en UTF-8")
+
+
+def par_lots(iterable, taille=TAILLE_LOT):
+    lot = []
+    for element in iterable:
+        lot.append(element)
+        if len(lot) == taille:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+
+# ============================================================================
+# MOTS DE PASSE
+# ============================================================================
+
+_verrou = threading.Lock()
+_pool = None
+
+
+def get_pool():
+    global _pool
+    with _verrou:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.IMPORT_PROCESSUS,
+                mp_context=multiprocessing.get_context('spawn'),
+                # Processus neufs : charger la configuration Django (PASSWORD_HASHERS)
+                initializer=django.setup,
+            )
+    return _pool
+
+
+def hacher(mots_de_passe):
+    """Empreintes des mots de passe, dans l'ordre ; None donne un mot de passe inutilisable"""
+    a_hacher = [mdp for mdp in mots_de_passe if mdp]
+    if len(a_hacher) > 1:
+        # Lots assez petits pour occuper tous les processus
+        taille = max(1, len(a_hacher) // (settings.IMPORT_PROCESSUS * 4))
+        empreintes = iter(get_pool().map(make_password, a_hacher, chunksize=taille))
+    else:
+        empreintes = iter(map(make_password, a_hacher))
+    return [next(empreintes) if mdp else make_password(None) for mdp in mots_de_passe]
+
+
+# ============================================================================
+# IMPORT
+# ============================================================================
+
+def _erreurs(detail):
+    """Erreurs DRF en {champ: [messages]} sérialisable"""
+    return {champ: [str(m) for m in messages] for champ, messages in detail.items()}
+
+
+def importer_profils(fichier, nom, role, apercu=False, mots_de_passe=True):
+    """
+    Importer les profils `role` ('CANDIDAT' ou 'ENSEIGNANT') du fichier.
+    Avec `apercu`, tout est vérifié mais rien n'est haché ni enregistré.
+    Sans `mots_de_passe`, la colonne password est ignorée et les comptes
+    reçoivent un mot de passe inutilisable (aucun hachage).
+    Retourne {'lignes', 'crees', 'erreurs': [{'ligne', 'erreurs'}]}.
+    """
+    from .serializers import LigneCandidatImportSerializer, LigneEnseignantImportSerializer
+
+    est_candidat = role == CustomUser.Role.CANDIDAT
+    serializer_ligne = LigneCandidatImportSerializer if est_candidat else LigneEnseignantImportSerializer
+    # Une seule instance : les champs ne sont pas recopiés à chaque ligne
+    validateur = serializer_ligne(context={
+        'departements': dict(Departement.objects.values_list('code', 'id'))
+    })
+
+    rapport = {'lignes': 0, 'crees': 0, 'erreurs': []}
+    emails_vus, usernames_vus, matricules_vus = set(), set(), set()
+    # Lots prêts à écrire : (lignes retenues, empreintes des mots de passe)
+    a_ecrire = []
+
+    # Validation et hachage hors transaction : aucun verrou tenu pendant le calcul
+    for lot in par_lots(lire_lignes(fichier, nom)):
+        rapport['lignes'] += len(lot)
+
+        valides = []
+        for numero, donnees in lot:
+            if not mots_de_passe:
+                donnees.pop('password', None)
+            try:
+                valides.append((numero, validateur.run_validation(donnees)))
+            except serializers.ValidationError as e:
+                rapport['erreurs'].append({'ligne': numero, 'erreurs': _erreurs(e.detail)})
+
+        # Unicité : une requête ensembliste par lot, plus les lignes précédentes du fichier
+        emails = {d['email'] for _, d in valides}
+        usernames = {d['username'] for _, d in valides}
+        for email, username in CustomUser.objects.filter(
+            Q(email__in=emails) | Q(username__in=usernames)
+        ).values_list('email', 'username'):
+            emails_vus.add(email)
+            usernames_vus.add(username)
+        if est_candidat:
+            matricules_vus.update(CandidatProfile.objects.filter(
+                matricule__in={d['matricule'] for _, d in valides}
+            ).values_list('matricule', flat=True))
+
+        retenues = []
+        for numero, donnees in valides:
+            erreurs = {}
+            if donnees['email'] in emails_vus:
+                erreurs['email'] = ["Cet email est déjà utilisé"]
+            if donnees['username'] in usernames_vus:
+                erreurs['username'] = ["Ce nom d'utilisateur est déjà utilisé"]
+            if est_candidat and donnees['matricule'] in matricules_vus:
+                erreurs['matricule'] = ["Ce matricule est déjà utilisé"]
+            emails_vus.add(donnees['email'])
+            usernames_vus.add(donnees['username'])
+            if est_candidat:
+                matricules_vus.add(donnees['matricule'])
+            if erreurs:
+                rapport['erreurs'].append({'ligne': numero, 'erreurs': erreurs})
+            else:
+                retenues.append(donnees)
+
+        rapport['crees'] += len(retenues)
+        if apercu or not retenues:
+            continue
+        if mots_de_passe:
+            empreintes = hacher([d.get('password') for d in retenues])
+        else:
+            empreintes = [make_password(None) for _ in retenues]
+        a_ecrire.append((retenues, empreintes))
+
+    rapport['erreurs'].sort(key=lambda e: e['ligne'])
+    if a_ecrire:
+        _enregistrer(a_ecrire, role, est_candidat)
+    return rapport
+
+
+def _enregistrer(a_ecrire, role, est_candidat):
+    """Écrire les lots préparés en une seule transaction, sans calcul coûteux"""
+    a_synchroniser = set()
+    with transaction.atomic():
+        for retenues, empreintes in a_ecrire:
+            utilisateurs = [
+                CustomUser(
+                    email=d['email'], username=d['username'], first_name=d['first_name'],
+                    last_name=d['last_name'], phone=d.get('phone', ''), role=role, password=empreinte,
+                )
+                for d, empreinte in zip(retenues, empreintes)
+            ]
+            CustomUser.objects.bulk_create(utilisateurs)
+
+            if est_candidat:
+                CandidatProfile.objects.bulk_create([
+                    CandidatProfile(
+                        user=user, matricule=d['matricule'], cycle=d['cycle'],
+                        departement_id=d.get('departement'),
+                    )
+                    for user, d in zip(utilisateurs, retenues)
+                ])
+                a_synchroniser.update(d['departement'] for d in retenues if d.get('departement'))
+            else:
+                profils = EnseignantProfile.objects.bulk_create([
+                    EnseignantProfile(user=user, grade=d['grade'])
+                    for user, d in zip(utilisateurs, retenues)
+                ])
+                EnseignantDepartement = EnseignantProfile.departements.through
+                EnseignantDepartement.objects.bulk_create([
+                    EnseignantDepartement(enseignantprofile_id=profil.pk, departement_id=departement_id)
+                    for profil, d in zip(profils, retenues)
+                    for departement_id in d.get('departements', [])
+                ])
+                a_synchroniser.update(profil.pk for profil, d in zip(profils, retenues) if d.get('departements'))
+
+        # bulk_create n'émet pas de signaux : index de visibilité en une passe
+        if a_synchroniser:
+            synchroniser_acces(
+                enseignants_des_departements(*a_synchroniser) if est_candidat else a_synchroniser
+            )
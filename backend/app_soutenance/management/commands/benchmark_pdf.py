@@ -0,0 +1,76 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app_soutenance.models import (
+    CandidatProfile, CustomUser, Departement, DossierSoutenance, EnseignantProfile,
+    Jury, MembreJury, Salle, SessionSoutenance, Soutenance
+)
+from app_soutenance.pieces_pdf import contexte, convertir, empreinte, html_vers_pdf, rendre_html
+
+
+def soutenance_fictive(i, session, salle, jury, departement):
+    """Soutenance non enregistrée, avec relations préchargées comme en production"""
+    user = CustomUser(first_name=f'Prénom{i}', last_name=f'Nom{i}', email=f'candidat{i}@exemple.org')
+    candidat = CandidatProfile(user=user, matricule=f'BENCH{i:05d}', cycle='INGENIEUR', departement=departement)
+    dossier = DossierSoutenance(candidat=candidat, session=session, titre_memoire=f'Mémoire de test numéro {i}')
+    return Soutenance(
+        dossier=dossier, jury=jury, salle=salle, ordre_passage=i % 12 + 1,
+        date_heure=timezone.now() + timedelta(minutes=45 * i),
+    )
+
+
+class Command(BaseCommand):
+    """Mesure du coût de génération des convocations (sans base ni stockage)"""
+    help = "Chronomètre le rendu de N convocations : HTML + empreintes, puis conversion PDF"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nombre', type=int, default=500, help="Nombre de convocations (défaut : 500)")
+        parser.add_argument('--sequentiel', action='store_true',
+                            help="Mesurer aussi la conversion dans le processus courant, sans pool")
+
+    def handle(self, *args, **options):
+        nombre = options['nombre']
+        departement = Departement(code='BENCH', nom='Département de test')
+        session = SessionSoutenance(titre='Session de test', annee_academique='2025-2026')
+        salle = Salle(nom='Amphi A', batiment='Bâtiment principal', capacite=200)
+        jury = Jury(nom='Jury de test', session=session)
+        membres = [
+            MembreJury(jury=jury, role=role, enseignant=EnseignantProfile(
+                grade='PROFESSEUR', user=CustomUser(first_name=f'Enseignant{n}', last_name=role.title())
+            ))
+            for n, role in enumerate(MembreJury.Role.values)
+        ]
+        # Équivalent d'un prefetch_related('jury__composition')
+        jury._prefetched_objects_cache = {'composition': jury.composition.none()}
+        jury._prefetched_objects_cache['composition']._result_cache = membres
+        soutenances = [soutenance_fictive(i, session, salle, jury, departement) for i in range(nombre)]
+
+        debut = time.perf_counter()
+        documents = [rendre_html('CONVOCATION', contexte(s)) for s in soutenances]
+        empreintes = {empreinte(html) for html in documents}
+        duree_html = time.perf_counter() - debut
+        self.stdout.write(
+            f'HTML + empreintes : {duree_html:.2f} s ({len(empreintes)} empreintes distinctes) '
+            f'- coût d\'une passe sans changement'
+        )
+
+        # Démarrage du pool et import de WeasyPrint hors chronométrage
+        convertir(documents[:2])
+        debut = time.perf_counter()
+        taille = sum(len(pdf) for pdf in convertir(documents))
+        duree_pool = time.perf_counter() - debut
+        self.stdout.write(
+            f'Conversion PDF, pool de {settings.PDF_PROCESSUS} processus : {duree_pool:.2f} s '
+            f'({nombre / duree_pool:.1f} PDF/s, {taille / 1024 / 1024:.1f} Mo)'
+        )
+
+        if options['sequentiel']:
+            debut = time.perf_counter()
+            for html in documents:
+                html_vers_pdf(html)
+            duree = time.perf_counter() - debut
+            self.stdout.write(f'Conversion PDF, séquentielle : {duree:.2f} s ({nombre / duree:.1f} PDF/s)')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from app_soutenance.dedup import collecter
+from app_soutenance.models import Blob, Document
+
+
+class Command(BaseCommand):
+    """Ramasse-miettes du stockage dédupliqué (à planifier via cron)"""
+    help = "Supprime du stockage les blobs qui ne sont plus référencés par aucun document"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recompter', action='store_true',
+                            help="Recalculer les compteurs de références depuis les documents avant collecte")
+
+    def handle(self, *args, **options):
+        if options['recompter']:
+            nb_documents = Document.objects.filter(blob=OuterRef('pk')).order_by().values('blob') \
+                .annotate(n=Count('id')).values('n')
+            Blob.objects.update(nb_references=Coalesce(Subquery(nb_documents), 0))
+            self.stdout.write('Compteurs de références recalculés')
+        nb = collecter()
+        self.stdout.write(self.style.SUCCESS(f'{nb} blob(s) supprimé(s)'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app_soutenance.analytics import compacter, reconstruire_rollups
+
+
+class Command(BaseCommand):
+    """Compacter les événements analytics (à planifier via cron)"""
+    help = "Supprime les SiteEvent bruts au-delà de la rétention ; les agrégats horaires/journaliers sont conservés"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention', type=int, default=None,
+                            help="Rétention en jours (défaut : ANALYTICS_RETENTION_JOURS)")
+        parser.add_argument('--reconstruire', action='store_true',
+                            help="Recalculer depuis les événements bruts les agrégats des périodes "
+                                 "qu'ils couvrent entièrement, avant compaction (les plus anciens sont conservés)")
+
+    def handle(self, *args, **options):
+        if options['reconstruire']:
+            plus_ancien = reconstruire_rollups()
+            if plus_ancien is None:
+                self.stdout.write('Aucun événement brut : agrégats inchangés')
+            else:
+                self.stdout.write(
+                    f'Agrégats recalculés après la période du {timezone.localtime(plus_ancien):%Y-%m-%d %H:%M}'
+                )
+        nb = compacter(options['retention'])
+        self.stdout.write(self.style.SUCCESS(f'{nb} événement(s) brut(s) supprimé(s)'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app_soutenance.derives import generer_apercu, generer_photo
+from app_soutenance.models import CandidatProfile, Document
+
+
+class Command(BaseCommand):
+    """Rattrapage des miniatures et aperçus manquants (contenus antérieurs, échecs)"""
+    help = "Génère les miniatures des photos de candidats et les aperçus des documents PDF manquants"
+
+    def handle(self, *args, **options):
+        candidats = CandidatProfile.objects.exclude(photo='').exclude(photo__isnull=True).values_list('pk', flat=True)
+        for pk in candidats.iterator():
+            generer_photo(pk)
+        self.stdout.write(f'{len(candidats)} photo(s) traitée(s)')
+
+        documents = Document.objects.filter(fichier__iendswith='.pdf').values_list('pk', flat=True)
+        for pk in documents.iterator():
+            generer_apercu(pk)
+        self.stdout.write(self.style.SUCCESS(f'{len(documents)} document(s) PDF traité(s)'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app_soutenance.models import PieceGeneree, SessionSoutenance, Soutenance
+from app_soutenance.pieces_pdf import generer_pieces
+
+
+class Command(BaseCommand):
+    """Génération par lot des convocations et procès-verbaux d'une session"""
+    help = "Génère les pièces PDF des soutenances (seules les soutenances modifiées sont re-rendues)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', help="Identifiant de la session (toutes les sessions par défaut)")
+        parser.add_argument('--type', choices=PieceGeneree.TypePiece.values, dest='type_piece',
+                            help="Type de pièce (tous par défaut)")
+        parser.add_argument('--forcer', action='store_true', help="Re-rendre même les pièces à jour")
+
+    def handle(self, *args, **options):
+        soutenances = Soutenance.objects.all()
+        if options['session']:
+            if not SessionSoutenance.objects.filter(pk=options['session']).exists():
+                raise CommandError(f"Session introuvable : {options['session']}")
+            soutenances = soutenances.filter(dossier__session_id=options['session'])
+
+        types = [options['type_piece']] if options['type_piece'] else PieceGeneree.TypePiece.values
+        for type_piece in types:
+            pieces, nb_rendues = generer_pieces(soutenances, type_piece, forcer=options['forcer'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{type_piece} : {nb_rendues} rendue(s), {len(pieces) - nb_rendues} inchangée(s)'
+            ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app_soutenance.importation import FichierInvalide, importer_profils
+from app_soutenance.models import CustomUser
+
+
+class Command(BaseCommand):
+    """Import par lot de candidats ou d'enseignants depuis un fichier CSV/XLSX"""
+    help = "Crée les comptes et profils d'un fichier CSV/XLSX et affiche les erreurs par ligne"
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="Chemin du fichier CSV (UTF-8) ou XLSX, avec en-tête")
+        parser.add_argument('--role', required=True,
+                            choices=[CustomUser.Role.CANDIDAT, CustomUser.Role.ENSEIGNANT],
+                            help="Type de profils à créer")
+        parser.add_argument('--apercu', action='store_true', help="Vérifier sans rien enregistrer")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['fichier'], 'rb') as fichier:
+                rapport = importer_profils(fichier, options['fichier'], options['role'], apercu=options['apercu'])
+        except OSError as e:
+            raise CommandError(f"Fichier illisible : {e}")
+        except FichierInvalide as e:
+            raise CommandError(str(e))
+
+        for erreur in rapport['erreurs']:
+            details = ' ; '.join(f"{champ} : {' '.join(messages)}" for champ, messages in erreur['erreurs'].items())
+            self.stderr.write(f"Ligne {erreur['ligne']} - {details}")
+        verbe = 'à créer' if options['apercu'] else 'créé(s)'
+        self.stdout.write(self.style.SUCCESS(
+            f"{rapport['crees']} profil(s) {verbe} sur {rapport['lignes']} ligne(s), "
+            f"{len(rapport['erreurs'])} en erreur"
+        ))
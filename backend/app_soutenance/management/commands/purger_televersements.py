@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from app_soutenance.televersement import purger_expires
+
+
+class Command(BaseCommand):
+    """Nettoyage des uploads reprenables abandonnés (à planifier via cron)"""
+    help = "Supprime les téléversements expirés et leurs fichiers partiels"
+
+    def handle(self, *args, **options):
+        nb = purger_expires()
+        self.stdout.write(self.style.SUCCESS(f'{nb} téléversement(s) expiré(s) supprimé(s)'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from app_soutenance.acces import synchroniser_acces
+from app_soutenance.models import AccesObjet
+
+
+class Command(BaseCommand):
+    """Reconstruire l'index de visibilité AccesObjet"""
+    help = "Recalcule entièrement la table AccesObjet à partir des dossiers, jurys et départements"
+
+    def handle(self, *args, **options):
+        synchroniser_acces()
+        self.stdout.write(self.style.SUCCESS(f'{AccesObjet.objects.count()} accès indexés'))
@@ -0,0 +1,29 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app_soutenance.stockage_local import creer_serveur
+
+
+class Command(BaseCommand):
+    """Serveur local imitant Supabase Storage (développement hors ligne)"""
+    help = "Lance un serveur de stockage local compatible avec SupabaseStorage (uploads TUS, objets)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hote', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=54321)
+        parser.add_argument('--racine', default=os.path.join(settings.MEDIA_ROOT, 'stockage_local'))
+
+    def handle(self, *args, **options):
+        serveur = creer_serveur(options['racine'], options['hote'], options['port'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stockage local sur http://{options['hote']}:{options['port']} "
+            f"(racine : {options['racine']}) - SUPABASE_URL=http://{options['hote']}:{options['port']}"
+        ))
+        try:
+            serveur.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            serveur.server_close()
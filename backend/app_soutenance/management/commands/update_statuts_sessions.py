@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from app_soutenance.models import SessionSoutenance
+
+
+class Command(BaseCommand):
+    """Mettre à jour les statuts de toutes les sessions (à planifier via cron)"""
+    help = "Met à jour le statut des sessions de soutenance en fonction de leurs dates"
+
+    def handle(self, *args, **options):
+        nb = SessionSoutenance.objects.update_statuts()
+        self.stdout.write(self.style.SUCCESS(f'{nb} session(s) mise(s) à jour'))
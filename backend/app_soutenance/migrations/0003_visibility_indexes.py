@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0002_siteevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dossiersoutenance',
+            index=models.Index(fields=['encadreur', 'candidat'], name='dossier_encadreur_cand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='membrejury',
+            index=models.Index(fields=['enseignant', 'jury'], name='membrejury_ens_jury_idx'),
+        ),
+    ]
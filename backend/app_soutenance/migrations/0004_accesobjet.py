@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:19
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+def construire_acces(apps, schema_editor):
+    from app_soutenance.acces import synchroniser_acces
+    synchroniser_acces(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0003_visibility_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccesObjet',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('type_objet', models.CharField(choices=[('CANDIDAT', 'Candidat'), ('DOSSIER', 'Dossier'), ('SOUTENANCE', 'Soutenance')], max_length=20, verbose_name="Type d'objet")),
+                ('objet_id', models.UUIDField(verbose_name="Identifiant de l'objet")),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='acces', to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+            ],
+            options={
+                'verbose_name': 'Accès objet',
+                'verbose_name_plural': 'Accès objets',
+                'unique_together': {('user', 'type_objet', 'objet_id')},
+            },
+        ),
+        migrations.RunPython(construire_acces, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0004_accesobjet'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='soutenance',
+            index=models.Index(fields=['date_heure'], name='soutenance_date_heure_idx'),
+        ),
+    ]
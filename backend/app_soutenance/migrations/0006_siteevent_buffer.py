@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0005_soutenance_date_heure_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='siteevent',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='siteevent',
+            index=models.Index(fields=['event_type', 'ip_hash', 'created_at'], name='siteevent_type_ip_date_idx'),
+        ),
+    ]
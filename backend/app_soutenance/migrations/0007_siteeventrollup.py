@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:23
+
+import uuid
+from django.db import migrations, models
+
+
+def construire_rollups(apps, schema_editor):
+    from app_soutenance.analytics import construire_rollups
+    construire_rollups(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0006_siteevent_buffer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteEventRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('event_type', models.CharField(choices=[('REPO_CLICK', 'Clic repo GitHub'), ('PAGE_VIEW', 'Vue de page')], max_length=20)),
+                ('granularite', models.CharField(choices=[('HOUR', 'Heure'), ('DAY', 'Jour')], max_length=4)),
+                ('periode', models.DateTimeField(verbose_name='Début de période')),
+                ('compteur', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': "Agrégat d'événements",
+                'verbose_name_plural': "Agrégats d'événements",
+                'ordering': ['granularite', 'periode'],
+                'unique_together': {('granularite', 'event_type', 'periode')},
+            },
+        ),
+        migrations.RunPython(construire_rollups, migrations.RunPython.noop),
+    ]
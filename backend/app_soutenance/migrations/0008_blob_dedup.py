@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:31
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0007_siteeventrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('empreinte', models.CharField(max_length=64, unique=True, verbose_name='Empreinte SHA-256')),
+                ('fichier', models.FileField(max_length=255, upload_to='blobs/', verbose_name='Fichier')),
+                ('taille', models.BigIntegerField(verbose_name='Taille (octets)')),
+                ('nb_references', models.PositiveIntegerField(default=0, verbose_name='Nombre de références')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Contenu stocké',
+                'verbose_name_plural': 'Contenus stockés',
+            },
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='fichier',
+            field=models.FileField(max_length=255, upload_to='documents/', verbose_name='Fichier'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='documents', to='app_soutenance.blob', verbose_name='Contenu stocké'),
+        ),
+    ]
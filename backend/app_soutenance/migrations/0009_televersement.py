@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:34
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0008_blob_dedup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Televersement',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nom', models.CharField(max_length=200, verbose_name='Nom du document')),
+                ('type_piece', models.CharField(choices=[('MEMOIRE', 'Mémoire'), ('RECU_PAIEMENT', 'Reçu de paiement'), ('ACCORD_STAGE', 'Accord de stage'), ('LETTRE_MISE_EN_STAGE', 'Lettre de mise en stage'), ('CERTIFICAT_SCOLARITE', 'Certificat de scolarité'), ('ATTESTATION', 'Attestation'), ('AUTRE', 'Autre')], max_length=30)),
+                ('est_obligatoire', models.BooleanField(default=False)),
+                ('nom_fichier', models.CharField(max_length=200)),
+                ('taille', models.BigIntegerField(verbose_name='Taille totale (octets)')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Octets reçus')),
+                ('expire_at', models.DateTimeField(verbose_name='Expire le')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dossier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='televersements', to='app_soutenance.dossiersoutenance')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='televersements', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Téléversement en cours',
+                'verbose_name_plural': 'Téléversements en cours',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
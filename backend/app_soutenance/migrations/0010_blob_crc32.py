@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0009_televersement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='crc32',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='CRC-32'),
+        ),
+    ]
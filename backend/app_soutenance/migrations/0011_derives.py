@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:40
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0010_blob_crc32'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidatprofile',
+            name='photo_empreinte',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Empreinte SHA-256 de la photo'),
+        ),
+        migrations.CreateModel(
+            name='Derive',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('empreinte_source', models.CharField(max_length=64, verbose_name='Empreinte de la source')),
+                ('variante', models.CharField(choices=[('PHOTO_MINIATURE', 'Photo 64 px'), ('PHOTO_MOYENNE', 'Photo 256 px'), ('APERCU_PDF', 'Aperçu de la première page')], max_length=20)),
+                ('fichier', models.FileField(max_length=255, upload_to='derives/', verbose_name='Fichier')),
+                ('largeur', models.PositiveIntegerField()),
+                ('hauteur', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Fichier dérivé',
+                'verbose_name_plural': 'Fichiers dérivés',
+                'unique_together': {('empreinte_source', 'variante')},
+            },
+        ),
+    ]
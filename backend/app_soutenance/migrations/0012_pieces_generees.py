@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:43
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0011_derives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PieceGeneree',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('type_piece', models.CharField(choices=[('CONVOCATION', 'Convocation'), ('PROCES_VERBAL', 'Procès-verbal')], max_length=20, verbose_name='Type de pièce')),
+                ('empreinte', models.CharField(max_length=64, verbose_name='Empreinte des données')),
+                ('fichier', models.FileField(max_length=255, upload_to='pieces/', verbose_name='Fichier')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Générée le')),
+                ('soutenance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pieces', to='app_soutenance.soutenance', verbose_name='Soutenance')),
+            ],
+            options={
+                'verbose_name': 'Pièce générée',
+                'verbose_name_plural': 'Pièces générées',
+                'unique_together': {('soutenance', 'type_piece')},
+            },
+        ),
+    ]
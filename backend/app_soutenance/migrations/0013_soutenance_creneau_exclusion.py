@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:05
+
+from django.db import migrations
+
+# PostgreSQL seulement : colonne tstzrange maintenue par trigger (timestamptz +
+# interval n'est pas IMMUTABLE, donc pas indexable comme expression), et
+# contrainte d'exclusion interdisant deux soutenances simultanées dans une salle.
+# Différée à la fin de la transaction pour permettre les échanges de créneaux
+# en un seul bulk_update (planification automatique).
+CRENEAU = "tstzrange(date_heure, date_heure + make_interval(mins => duree_minutes))"
+
+SQL_AVANT = f"""
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+ALTER TABLE app_soutenance_soutenance ADD COLUMN creneau tstzrange;
+UPDATE app_soutenance_soutenance SET creneau = {CRENEAU} WHERE date_heure IS NOT NULL;
+CREATE FUNCTION app_soutenance_creneau() RETURNS trigger AS $$
+BEGIN
+    NEW.creneau := CASE WHEN NEW.date_heure IS NULL THEN NULL
+                   ELSE tstzrange(NEW.date_heure, NEW.date_heure + make_interval(mins => NEW.duree_minutes)) END;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER soutenance_creneau
+    BEFORE INSERT OR UPDATE OF date_heure, duree_minutes ON app_soutenance_soutenance
+    FOR EACH ROW EXECUTE FUNCTION app_soutenance_creneau();
+"""
+
+SQL_CONTRAINTE = """
+ALTER TABLE app_soutenance_soutenance ADD CONSTRAINT soutenance_salle_sans_chevauchement
+    EXCLUDE USING gist (salle_id WITH =, creneau WITH &&)
+    WHERE (salle_id IS NOT NULL AND statut <> 'ANNULEE')
+    DEFERRABLE INITIALLY DEFERRED;
+"""
+
+SQL_CHEVAUCHEMENTS = """
+SELECT count(*) FROM app_soutenance_soutenance a
+JOIN app_soutenance_soutenance b
+  ON a.salle_id = b.salle_id AND a.id < b.id AND a.creneau && b.creneau
+WHERE a.statut <> 'ANNULEE' AND b.statut <> 'ANNULEE';
+"""
+
+SQL_ARRIERE = """
+ALTER TABLE app_soutenance_soutenance DROP CONSTRAINT IF EXISTS soutenance_salle_sans_chevauchement;
+DROP TRIGGER IF EXISTS soutenance_creneau ON app_soutenance_soutenance;
+DROP FUNCTION IF EXISTS app_soutenance_creneau();
+ALTER TABLE app_soutenance_soutenance DROP COLUMN IF EXISTS creneau;
+"""
+
+
+def ajouter_contrainte(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(SQL_AVANT)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(SQL_CHEVAUCHEMENTS)
+        nb = cursor.fetchone()[0]
+    if nb:
+        raise RuntimeError(
+            f"{nb} chevauchement(s) de salle existant(s) : les corriger "
+            f"(GET /api/soutenances/conflits/?session=) avant d'appliquer cette migration"
+        )
+    schema_editor.execute(SQL_CONTRAINTE)
+
+
+def retirer_contrainte(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SQL_ARRIERE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0012_pieces_generees'),
+    ]
+
+    operations = [
+        migrations.RunPython(ajouter_contrainte, retirer_contrainte),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0013_soutenance_creneau_exclusion'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='siteevent',
+            name='siteevent_type_ip_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='siteevent',
+            index=models.Index(fields=['created_at'], name='siteevent_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_soutenance', '0014_siteevent_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='nonce_upload',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
@@ -1,7 +1,8 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import FileExtensionValidator
+from django.utils import timezone
 
 
 # ============================================================================
@@ -113,6 +114,10 @@ class CandidatProfile(models.Model):
         null=True,
         verbose_name="Photo"
     )
+    photo_empreinte = models.CharField(
+        max_length=64, blank=True, default='', editable=False,
+        verbose_name="Empreinte SHA-256 de la photo"
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Créé le")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Modifié le")
 
@@ -168,6 +173,40 @@ class EnseignantProfile(models.Model):
 # GESTION DES SESSIONS ET SALLES
 # ============================================================================
 
+class SessionSoutenanceQuerySet(models.QuerySet):
+    """QuerySet des sessions avec mise à jour ensembliste des statuts"""
+
+    def update_statuts(self, now=None):
+        """
+        Met à jour le statut de toutes les sessions en une seule requête UPDATE.
+
+        Même logique que SessionSoutenance.update_status_auto(), mais appliquée
+        à l'ensemble du QuerySet via un CASE conditionnel : seules les lignes
+        dont le statut doit changer sont touchées. Retourne le nombre de lignes
+        modifiées.
+        """
+        from django.utils import timezone
+        now = now or timezone.now()
+        Statut = SessionSoutenance.Statut
+
+        a_venir = models.Q(date_ouverture__gt=now)
+        en_cours = models.Q(date_ouverture__lte=now, date_cloture__gt=now)
+        termine = models.Q(date_cloture__lte=now)
+
+        return self.filter(
+            (a_venir & ~models.Q(statut__in=[Statut.OUVERT, Statut.FERME]))
+            | (en_cours & ~models.Q(statut=Statut.EN_COURS))
+            | (termine & ~models.Q(statut=Statut.TERMINE))
+        ).update(
+            statut=models.Case(
+                models.When(a_venir, then=models.Value(Statut.FERME)),
+                models.When(en_cours, then=models.Value(Statut.EN_COURS)),
+                default=models.Value(Statut.TERMINE),
+                output_field=models.CharField(),
+            )
+        )
+
+
 class SessionSoutenance(models.Model):
     """
     Session de soutenance (ex: Session Master 2024-2025)
@@ -201,6 +240,8 @@ class SessionSoutenance(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Créé le")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Modifié le")
 
+    objects = SessionSoutenanceQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Session de Soutenance"
         verbose_name_plural = "Sessions de Soutenance"
@@ -209,6 +250,24 @@ class SessionSoutenance(models.Model):
     def __str__(self):
         return f"{self.titre} ({self.annee_academique})"
 
+    @classmethod
+    def refresh_statuts(cls):
+        """
+        Déclenche la mise à jour ensembliste des statuts au plus une fois par
+        intervalle SESSION_STATUT_REFRESH_SECONDS (déclencheur par tranche de temps).
+
+        Le verrou de tranche passe par le cache : cache.add() est atomique, donc
+        un seul worker exécute l'UPDATE pour une tranche donnée.
+        """
+        from django.conf import settings
+        from django.core.cache import cache
+        from django.utils import timezone
+
+        intervalle = getattr(settings, 'SESSION_STATUT_REFRESH_SECONDS', 60)
+        tranche = int(timezone.now().timestamp() // intervalle)
+        if cache.add(f'sessions:statuts:{tranche}', True, timeout=intervalle):
+            cls.objects.update_statuts()
+
     def update_status_auto(self):
         """
         Met à jour automatiquement le statut de la session en fonction des dates
@@ -311,11 +370,65 @@ class DossierSoutenance(models.Model):
         verbose_name = "Dossier de Soutenance"
         verbose_name_plural = "Dossiers de Soutenance"
         ordering = ['-created_at']
+        indexes = [
+            # Visibilité enseignant : EXISTS (encadreur, candidat)
+            models.Index(fields=['encadreur', 'candidat'], name='dossier_encadreur_cand_idx'),
+        ]
 
     def __str__(self):
         return f"{self.candidat.user.get_full_name()} - {self.titre_memoire[:50]}"
 
 
+class Blob(models.Model):
+    """
+    Contenu de fichier stocké une seule fois, identifié par son empreinte SHA-256.
+    Les Document de même contenu partagent le même blob (voir dedup.py) ;
+    un blob sans référence est supprimé du stockage par le ramasse-miettes.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    empreinte = models.CharField(max_length=64, unique=True, verbose_name="Empreinte SHA-256")
+    fichier = models.FileField(upload_to='blobs/', max_length=255, verbose_name="Fichier")
+    taille = models.BigIntegerField(verbose_name="Taille (octets)")
+    crc32 = models.BigIntegerField(null=True, blank=True, verbose_name="CRC-32")
+    nb_references = models.PositiveIntegerField(default=0, verbose_name="Nombre de références")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Contenu stocké"
+        verbose_name_plural = "Contenus stockés"
+
+    def __str__(self):
+        return f"{self.empreinte[:12]} ({self.nb_references} réf.)"
+
+
+class Derive(models.Model):
+    """
+    Fichier dérivé d'un contenu source (miniature de photo, aperçu de PDF),
+    identifié par l'empreinte SHA-256 de la source : deux sources identiques
+    partagent leurs dérivés. Produit hors requête (voir derives.py).
+    """
+    class Variante(models.TextChoices):
+        PHOTO_MINIATURE = 'PHOTO_MINIATURE', 'Photo 64 px'
+        PHOTO_MOYENNE = 'PHOTO_MOYENNE', 'Photo 256 px'
+        APERCU_PDF = 'APERCU_PDF', 'Aperçu de la première page'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    empreinte_source = models.CharField(max_length=64, verbose_name="Empreinte de la source")
+    variante = models.CharField(max_length=20, choices=Variante.choices)
+    fichier = models.FileField(upload_to='derives/', max_length=255, verbose_name="Fichier")
+    largeur = models.PositiveIntegerField()
+    hauteur = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Fichier dérivé"
+        verbose_name_plural = "Fichiers dérivés"
+        unique_together = ['empreinte_source', 'variante']
+
+    def __str__(self):
+        return f"{self.get_variante_display()} - {self.empreinte_source[:12]}"
+
+
 class Document(models.Model):
     """
     Document/Pièce jointe d'un dossier de soutenance
@@ -337,13 +450,24 @@ class Document(models.Model):
         verbose_name="Dossier"
     )
     nom = models.CharField(max_length=200, verbose_name="Nom du document")
-    fichier = models.FileField(upload_to='documents/', verbose_name="Fichier")
+    fichier = models.FileField(upload_to='documents/', max_length=255, verbose_name="Fichier")
+    blob = models.ForeignKey(
+        Blob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='documents',
+        editable=False,
+        verbose_name="Contenu stocké"
+    )
     type_piece = models.CharField(
         max_length=30,
         choices=TypePiece.choices,
         verbose_name="Type de pièce"
     )
     est_obligatoire = models.BooleanField(default=False, verbose_name="Obligatoire")
+    # Upload direct : nonce du jeton de finalisation (usage unique, voir televersement.py)
+    nonce_upload = models.UUIDField(null=True, blank=True, unique=True, editable=False)
     uploaded_at = models.DateTimeField(auto_now_add=True, verbose_name="Uploadé le")
 
     class Meta:
@@ -354,6 +478,39 @@ class Document(models.Model):
     def __str__(self):
         return f"{self.get_type_piece_display()} - {self.nom}"
 
+    def save(self, *args, **kwargs):
+        # Ligne et rattachement au blob (signals.document_post_save) vont ensemble :
+        # un échec du stockage ne laisse pas de Document sans contenu
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class Televersement(models.Model):
+    """
+    Upload reprenable (style tus) en cours : les morceaux reçus sont ajoutés
+    à un fichier partiel sur disque ; `offset` est le nombre d'octets reçus.
+    Le Document est créé lorsque `offset` atteint `taille`.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='televersements')
+    dossier = models.ForeignKey(DossierSoutenance, on_delete=models.CASCADE, related_name='televersements')
+    nom = models.CharField(max_length=200, verbose_name="Nom du document")
+    type_piece = models.CharField(max_length=30, choices=Document.TypePiece.choices)
+    est_obligatoire = models.BooleanField(default=False)
+    nom_fichier = models.CharField(max_length=200)
+    taille = models.BigIntegerField(verbose_name="Taille totale (octets)")
+    offset = models.BigIntegerField(default=0, verbose_name="Octets reçus")
+    expire_at = models.DateTimeField(verbose_name="Expire le")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Téléversement en cours"
+        verbose_name_plural = "Téléversements en cours"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.nom_fichier} ({self.offset}/{self.taille})"
+
 
 # ============================================================================
 # JURYS
@@ -435,6 +592,10 @@ class MembreJury(models.Model):
         verbose_name_plural = "Membres du Jury"
         unique_together = ['jury', 'enseignant', 'role']
         ordering = ['role', 'enseignant__user__last_name']
+        indexes = [
+            # Visibilité enseignant : EXISTS (enseignant, jury)
+            models.Index(fields=['enseignant', 'jury'], name='membrejury_ens_jury_idx'),
+        ]
 
     def __str__(self):
         return f"{self.enseignant.user.get_full_name()} - {self.get_role_display()} ({self.jury.nom})"
@@ -492,6 +653,10 @@ class Soutenance(models.Model):
         verbose_name = "Soutenance"
         verbose_name_plural = "Soutenances"
         ordering = ['date_heure', 'ordre_passage']
+        indexes = [
+            # Fenêtrage du calendrier (?from=&to=)
+            models.Index(fields=['date_heure'], name='soutenance_date_heure_idx'),
+        ]
 
     @property
     def session(self):
@@ -502,6 +667,70 @@ class Soutenance(models.Model):
         return f"Soutenance de {self.dossier.candidat.user.get_full_name()}"
 
 
+class PieceGeneree(models.Model):
+    """
+    PDF officiel produit pour une soutenance (convocation, procès-verbal).
+    `empreinte` est le SHA-256 du HTML source : tant qu'il est inchangé,
+    le PDF stocké est réutilisé sans nouveau rendu (voir pieces_pdf.py).
+    """
+    class TypePiece(models.TextChoices):
+        CONVOCATION = 'CONVOCATION', 'Convocation'
+        PROCES_VERBAL = 'PROCES_VERBAL', 'Procès-verbal'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    soutenance = models.ForeignKey(
+        Soutenance,
+        on_delete=models.CASCADE,
+        related_name='pieces',
+        verbose_name="Soutenance"
+    )
+    type_piece = models.CharField(max_length=20, choices=TypePiece.choices, verbose_name="Type de pièce")
+    empreinte = models.CharField(max_length=64, verbose_name="Empreinte des données")
+    fichier = models.FileField(upload_to='pieces/', max_length=255, verbose_name="Fichier")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Générée le")
+
+    class Meta:
+        verbose_name = "Pièce générée"
+        verbose_name_plural = "Pièces générées"
+        unique_together = ['soutenance', 'type_piece']
+
+    def __str__(self):
+        return f"{self.get_type_piece_display()} - {self.soutenance_id}"
+
+
+# ============================================================================
+# INDEX DE VISIBILITÉ (contrôle d'accès par ligne)
+# ============================================================================
+
+class AccesObjet(models.Model):
+    """
+    Index précalculé de visibilité : une ligne par (utilisateur, type d'objet, objet)
+    visible par un enseignant. Maintenu par les signaux (voir acces.py).
+    """
+    class TypeObjet(models.TextChoices):
+        CANDIDAT = 'CANDIDAT', 'Candidat'
+        DOSSIER = 'DOSSIER', 'Dossier'
+        SOUTENANCE = 'SOUTENANCE', 'Soutenance'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='acces',
+        verbose_name="Utilisateur"
+    )
+    type_objet = models.CharField(max_length=20, choices=TypeObjet.choices, verbose_name="Type d'objet")
+    objet_id = models.UUIDField(verbose_name="Identifiant de l'objet")
+
+    class Meta:
+        verbose_name = "Accès objet"
+        verbose_name_plural = "Accès objets"
+        unique_together = ['user', 'type_objet', 'objet_id']
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.type_objet} {self.objet_id}"
+
+
 # ============================================================================
 # ANALYTICS (KPI site)
 # ============================================================================
@@ -514,9 +743,39 @@ class SiteEvent(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     event_type = models.CharField(max_length=20, choices=EventType.choices)
     ip_hash = models.CharField(max_length=64, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # default (et non auto_now_add) : l'horodatage est fixé à la réception,
+    # pas au vidage du tampon d'écriture (voir analytics.py)
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         verbose_name = "Événement site"
         verbose_name_plural = "Événements site"
         ordering = ['-created_at']
+        indexes = [
+            # Compactage (created_at < limite) et plus ancien événement (reconstruire_rollups) ;
+            # l'anti-doublon passe par le cache, pas par la base
+            models.Index(fields=['created_at'], name='siteevent_created_idx'),
+        ]
+
+
+class SiteEventRollup(models.Model):
+    """
+    Compteur agrégé d'événements par type et par période (heure ou jour).
+    Maintenu à l'ingestion (voir analytics.py) ; les SiteEvent bruts au-delà
+    de la rétention sont supprimés par la commande compacter_analytics.
+    """
+    class Granularite(models.TextChoices):
+        HEURE = 'HOUR', 'Heure'
+        JOUR = 'DAY', 'Jour'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    event_type = models.CharField(max_length=20, choices=SiteEvent.EventType.choices)
+    granularite = models.CharField(max_length=4, choices=Granularite.choices)
+    periode = models.DateTimeField(verbose_name="Début de période")
+    compteur = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Agrégat d'événements"
+        verbose_name_plural = "Agrégats d'événements"
+        ordering = ['granularite', 'periode']
+        unique_together = ['granularite', 'event_type', 'periode']
@@ -0,0 +1,149 @@
+"""
+Génération des pièces officielles en PDF : convocations et procès-verbaux.
+
+- Chaque type de pièce a son gabarit HTML (templates/app_soutenance/pdf/),
+  rendu depuis la soutenance, son jury (MembreJury) et son dossier, puis
+  converti en PDF par WeasyPrint.
+- Le rendu HTML est rapide ; son SHA-256 sert d'empreinte des données. Une
+  pièce dont l'empreinte n'a pas changé n'est pas reconvertie : seules les
+  soutenances modifiées (ou un gabarit modifié) coûtent un rendu PDF.
+- Pour une session entière, la conversion s'exécute dans un pool de
+  processus (PDF_PROCESSUS) ; les PDF produits sont envoyés au stockage au
+  fil de l'eau.
+"""
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.template.loader import render_to_string
+
+GABARITS = {
+    'CONVOCATION': 'app_soutenance/pdf/convocation.html',
+    'PROCES_VERBAL': 'app_soutenance/pdf/proces_verbal.html',
+}
+ORDRE_ROLES = ['PRESIDENT', 'RAPPORTEUR', 'EXAMINATEUR', 'ENCADREUR']
+# Nombre de pièces envoyées ensemble à un processus du pool
+TAILLE_LOT = 8
+
+
+# ============================================================================
+# RENDU
+# ============================================================================
+
+def html_vers_pdf(html):
+    """Conversion HTML -> PDF (exécutée dans les processus du pool)"""
+    from weasyprint import HTML
+
+    return HTML(string=html).write_pdf()
+
+
+def contexte(soutenance):
+    """Données d'une soutenance pour les gabarits (relations préchargées)"""
+    dossier = soutenance.dossier
+    membres = []
+    if soutenance.jury:
+        membres = sorted(
+            soutenance.jury.composition.all(),
+            key=lambda m: (ORDRE_ROLES.index(m.role), m.enseignant.user.last_name)
+        )
+    return {
+        'soutenance': soutenance,
+        'dossier': dossier,
+        'candidat': dossier.candidat,
+        'session': dossier.session,
+        'jury': soutenance.jury,
+        'membres': membres,
+        'salle': soutenance.salle,
+    }
+
+
+def rendre_html(type_piece, donnees):
+    return render_to_string(GABARITS[type_piece], donnees)
+
+
+def empreinte(html):
+    return hashlib.sha256(html.encode()).hexdigest()
+
+
+def soutenances_a_rendre(queryset):
+    """Précharger en quelques requêtes tout ce qu'utilisent les gabarits"""
+    return queryset.select_related(
+        'dossier__candidat__user', 'dossier__candidat__departement', 'dossier__session',
+        'dossier__encadreur__user', 'jury', 'salle'
+    ).prefetch_related('jury__composition__enseignant__user')
+
+
+# ============================================================================
+# GÉNÉRATION ET CACHE
+# ============================================================================
+
+_verrou = threading.Lock()
+_pool = None
+
+
+def get_pool():
+    global _pool
+    with _verrou:
+        if _pool is None:
+            # spawn : ne pas dupliquer par fork un processus serveur multi-thread
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_PROCESSUS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+    return _pool
+
+
+def convertir(documents_html):
+    """PDF des documents HTML, dans l'ordre : dans le pool s'il y en a plusieurs"""
+    if len(documents_html) == 1:
+        return [html_vers_pdf(documents_html[0])]
+    return get_pool().map(html_vers_pdf, documents_html, chunksize=TAILLE_LOT)
+
+
+def generer_pieces(soutenances, type_piece, forcer=False):
+    """
+    Pièces `type_piece` à jour pour les soutenances données (queryset).
+    Retourne ({soutenance_id: PieceGeneree}, nombre de PDF rendus).
+    """
+    from .models import PieceGeneree
+
+    soutenances = list(soutenances_a_rendre(soutenances))
+    pieces = {
+        piece.soutenance_id: piece
+        for piece in PieceGeneree.objects.filter(soutenance__in=soutenances, type_piece=type_piece)
+    }
+
+    a_rendre = {}
+    for soutenance in soutenances:
+        html = rendre_html(type_piece, contexte(soutenance))
+        piece = pieces.get(soutenance.pk)
+        if forcer or piece is None or piece.empreinte != empreinte(html):
+            a_rendre[soutenance.pk] = html
+    if not a_rendre:
+        return pieces, 0
+
+    pdfs = convertir(list(a_rendre.values()))
+    for (soutenance_id, html), contenu in zip(a_rendre.items(), pdfs):
+        piece = pieces.get(soutenance_id) or PieceGeneree(soutenance_id=soutenance_id, type_piece=type_piece)
+        ancien = piece.fichier.name
+        piece.empreinte = empreinte(html)
+        piece.fichier.save(f'{type_piece.lower()}_{soutenance_id}.pdf', ContentFile(contenu), save=False)
+        with transaction.atomic():
+            piece.save()
+            if ancien:
+                stockage = piece.fichier.storage
+                transaction.on_commit(lambda nom=ancien: stockage.delete(nom))
+        pieces[soutenance_id] = piece
+    return pieces, len(a_rendre)
+
+
+def piece_a_jour(soutenance, type_piece):
+    """Pièce d'une seule soutenance, rendue seulement si ses données ont changé"""
+    from .models import Soutenance
+
+    pieces, _ = generer_pieces(Soutenance.objects.filter(pk=soutenance.pk), type_piece)
+    return pieces[soutenance.pk]
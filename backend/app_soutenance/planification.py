@@ -0,0 +1,208 @@
+"""
+Planification automatique des soutenances d'une session.
+
+Contraintes :
+- une salle n'accueille qu'une soutenance à la fois, et seulement si sa
+  capacité suffit (membres du jury + candidat, au moins `capacite_min`) ;
+- un enseignant (membre du jury ou encadreur) n'est jamais à deux
+  soutenances en même temps, y compris celles déjà fixées hors de la
+  session ;
+- chaque soutenance dure `duree_minutes`, dans les plages horaires des
+  jours ouvrés de la période.
+
+Heuristique gloutonne (ordonnancement par liste) plutôt qu'une recherche
+exhaustive : les soutenances sont groupées par jury, les groupes les plus
+chargés d'abord, et chacune est placée au plus tôt. Placer au plus tôt
+tasse les journées (peu de trous) et enchaîne les passages d'un même jury ;
+à heure égale, la salle de la soutenance précédente du jury est préférée.
+Chaque recherche de créneau se fait par dichotomie dans des agendas triés :
+O(n · salles · jours · log n) au total.
+"""
+import bisect
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DossierSoutenance, MembreJury, Salle, Soutenance
+
+
+class Agenda:
+    """Intervalles [début, fin) occupés d'une ressource, triés et disjoints"""
+
+    def __init__(self):
+        self.debuts = []
+        self.fins = []
+
+    def ajouter(self, debut, fin):
+        i = bisect.bisect_left(self.debuts, debut)
+        # Fusion avec les intervalles chevauchants (réservations existantes)
+        while i > 0 and self.fins[i - 1] > debut:
+            i -= 1
+        j = i
+        while j < len(self.debuts) and self.debuts[j] < fin:
+            debut, fin = min(debut, self.debuts[j]), max(fin, self.fins[j])
+            j += 1
+        self.debuts[i:j] = [debut]
+        self.fins[i:j] = [fin]
+
+    def conflit(self, debut, fin):
+        """Fin de l'intervalle occupé qui chevauche [debut, fin), ou None"""
+        i = bisect.bisect_right(self.debuts, debut) - 1
+        if i >= 0 and self.fins[i] > debut:
+            return self.fins[i]
+        if i + 1 < len(self.debuts) and self.debuts[i + 1] < fin:
+            return self.fins[i + 1]
+        return None
+
+
+def premier_creneau(agendas, debut, limite, duree):
+    """Premier début >= `debut` libre dans tous les agendas et finissant avant `limite`"""
+    while debut + duree <= limite:
+        for agenda in agendas:
+            fin_conflit = agenda.conflit(debut, debut + duree)
+            if fin_conflit is not None:
+                debut = fin_conflit
+                break
+        else:
+            return debut
+    return None
+
+
+def plages_horaires(date_debut, date_fin, heure_debut, heure_fin, samedi=False):
+    """(début, fin) aware de chaque jour ouvré de la période"""
+    plages = []
+    jour = date_debut
+    while jour <= date_fin:
+        if jour.weekday() < (6 if samedi else 5):
+            plages.append((
+                timezone.make_aware(datetime.combine(jour, heure_debut)),
+                timezone.make_aware(datetime.combine(jour, heure_fin)),
+            ))
+        jour += timedelta(days=1)
+    return plages
+
+
+def planifier_session(session, date_debut, date_fin, heure_debut, heure_fin,
+                      capacite_min=0, samedi=False, replanifier=False):
+    """
+    Calculer un planning sans conflit, sans l'enregistrer.
+    Retourne (soutenances placées, [(soutenance, raison)] non placées).
+    """
+    a_planifier = Soutenance.objects.filter(
+        dossier__session=session,
+        dossier__statut=DossierSoutenance.Statut.VALIDE,
+        statut=Soutenance.Statut.PLANIFIEE,
+    ).select_related('dossier__candidat__user', 'jury', 'salle')
+    if not replanifier:
+        a_planifier = a_planifier.filter(date_heure__isnull=True)
+    a_planifier = list(a_planifier)
+
+    enseignants_par_jury = defaultdict(set)
+    for jury_id, enseignant_id in MembreJury.objects.filter(
+        jury__in={s.jury_id for s in a_planifier if s.jury_id}
+    ).values_list('jury_id', 'enseignant_id'):
+        enseignants_par_jury[jury_id].add(enseignant_id)
+
+    def enseignants(soutenance):
+        membres = set(enseignants_par_jury.get(soutenance.jury_id, ()))
+        if soutenance.dossier.encadreur_id:
+            membres.add(soutenance.dossier.encadreur_id)
+        return membres
+
+    plages = plages_horaires(date_debut, date_fin, heure_debut, heure_fin, samedi)
+    # Plus petites salles d'abord : garder les grandes pour les jurys nombreux
+    salles = list(Salle.objects.filter(est_disponible=True).order_by('capacite', 'nom'))
+    agendas_salles = defaultdict(Agenda)
+    agendas_enseignants = defaultdict(Agenda)
+
+    # Réservations déjà fixées (autres sessions, soutenances hors planification)
+    if plages:
+        tous_enseignants = set().union(*map(enseignants, a_planifier)) if a_planifier else set()
+        fixees = Soutenance.objects.filter(
+            date_heure__isnull=False,
+            date_heure__lt=plages[-1][1],
+            date_heure__gte=plages[0][0] - timedelta(days=1),
+        ).exclude(statut=Soutenance.Statut.ANNULEE).exclude(pk__in=[s.pk for s in a_planifier])
+        occupations = defaultdict(set)
+        for jury_id, enseignant_id in MembreJury.objects.filter(
+            jury__soutenances__in=fixees, enseignant_id__in=tous_enseignants
+        ).values_list('jury_id', 'enseignant_id'):
+            occupations[jury_id].add(enseignant_id)
+        for salle_id, jury_id, encadreur_id, debut, duree in fixees.values_list(
+            'salle_id', 'jury_id', 'dossier__encadreur_id', 'date_heure', 'duree_minutes'
+        ):
+            fin = debut + timedelta(minutes=duree)
+            if salle_id:
+                agendas_salles[salle_id].ajouter(debut, fin)
+            for enseignant_id in occupations.get(jury_id, set()) | ({encadreur_id} & tous_enseignants):
+                agendas_enseignants[enseignant_id].ajouter(debut, fin)
+
+    groupes = defaultdict(list)
+    for soutenance in a_planifier:
+        groupes[soutenance.jury_id or soutenance.pk].append(soutenance)
+    ordre_groupes = sorted(
+        groupes.values(),
+        key=lambda groupe: (-sum(s.duree_minutes for s in groupe), -len(enseignants(groupe[0])))
+    )
+
+    placees, non_placees = [], []
+    for groupe in ordre_groupes:
+        salle_precedente = None
+        for soutenance in sorted(groupe, key=lambda s: s.ordre_passage or 0):
+            agendas = [agendas_enseignants[e] for e in enseignants(soutenance)]
+            duree = timedelta(minutes=soutenance.duree_minutes)
+            capacite = max(capacite_min, len(enseignants(soutenance)) + 1)
+            eligibles = [salle for salle in salles if salle.capacite >= capacite]
+            if not eligibles:
+                non_placees.append((soutenance, "Aucune salle de capacité suffisante"))
+                continue
+
+            meilleur = None
+            for debut_plage, fin_plage in plages:
+                for salle in eligibles:
+                    debut = premier_creneau(
+                        agendas + [agendas_salles[salle.pk]], debut_plage, fin_plage, duree
+                    )
+                    if debut is None:
+                        continue
+                    cle = (debut, salle.pk != salle_precedente)
+                    if meilleur is None or cle < meilleur[0]:
+                        meilleur = (cle, salle)
+                if meilleur:
+                    break
+            if meilleur is None:
+                non_placees.append((soutenance, "Aucun créneau libre dans la période"))
+                continue
+
+            (debut, _), salle = meilleur
+            for agenda in agendas + [agendas_salles[salle.pk]]:
+                agenda.ajouter(debut, debut + duree)
+            soutenance.date_heure = debut
+            soutenance.salle = salle
+            salle_precedente = salle.pk
+            placees.append(soutenance)
+
+    # Ordre de passage : rang dans la salle et la journée
+    par_salle_et_jour = defaultdict(list)
+    for soutenance in placees:
+        par_salle_et_jour[(soutenance.salle_id, timezone.localdate(soutenance.date_heure))].append(soutenance)
+    for soutenances in par_salle_et_jour.values():
+        for rang, soutenance in enumerate(sorted(soutenances, key=lambda s: s.date_heure), start=1):
+            soutenance.ordre_passage = rang
+
+    placees.sort(key=lambda s: (s.date_heure, s.salle.nom))
+    return placees, non_placees
+
+
+@transaction.atomic
+def appliquer(placees):
+    """Enregistrer le planning en une transaction (bulk_update, un seul aller-retour par lot)"""
+    maintenant = timezone.now()
+    for soutenance in placees:
+        # auto_now n'est pas appliqué par bulk_update (ETag iCalendar, pièces PDF)
+        soutenance.updated_at = maintenant
+    Soutenance.objects.bulk_update(
+        placees, ['date_heure', 'salle', 'ordre_passage', 'updated_at'], batch_size=500
+    )
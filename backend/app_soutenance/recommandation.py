@@ -0,0 +1,133 @@
+"""
+Recommandation de compositions de jury équilibrées.
+
+Règles :
+- les membres appartiennent au département du candidat (s'il en a un) ;
+- le PRESIDENT est PROFESSEUR ou MAITRE_CONF ;
+- l'encadreur du dossier siège comme ENCADREUR et n'occupe aucun autre
+  rôle ; un enseignant n'a qu'un rôle par jury.
+
+Équilibrage : la charge d'un enseignant est son nombre de participations
+dans la session (existantes + proposées). On minimise la somme des carrés
+des charges, rôle par rôle (PRESIDENT, le plus contraint, d'abord).
+
+Chaque rôle est un problème d'affectation à coûts convexes, résolu par
+plus courts chemins successifs (flot de coût minimal) : chaque dossier
+ajouté cherche, dans le graphe alterné dossiers/enseignants, l'enseignant
+atteignable le moins chargé, quitte à réaffecter d'autres dossiers le long
+du chemin. Les arcs dossier-enseignant étant de coût nul, le plus court
+chemin se trouve par un simple parcours en largeur : O(dossiers × arcs).
+"""
+from collections import defaultdict, deque
+
+from django.db.models import Count
+
+from .models import DossierSoutenance, EnseignantProfile, MembreJury
+
+GRADES_PRESIDENT = {EnseignantProfile.Grade.PROFESSEUR, EnseignantProfile.Grade.MAITRE_CONF}
+
+
+def affecter(dossiers, eligibles, charges):
+    """
+    Affecter un enseignant à chaque dossier en équilibrant `charges`
+    (mis à jour). `eligibles(dossier)` donne les enseignants possibles.
+    Retourne {dossier: enseignant} ; un dossier sans candidat possible est absent.
+    """
+    affectation = {}
+    titulaires = defaultdict(set)
+    charge_min = min(charges.values(), default=0)
+
+    for dossier in dossiers:
+        atteint_par = {}              # enseignant -> dossier depuis lequel il est atteint
+        cede_par = {dossier: None}    # dossier -> enseignant qu'il libérerait
+        meilleur = None
+        file = deque([dossier])
+        while file and (meilleur is None or charges[meilleur] > charge_min):
+            courant = file.popleft()
+            for enseignant in eligibles(courant):
+                if enseignant in atteint_par:
+                    continue
+                atteint_par[enseignant] = courant
+                if meilleur is None or charges[enseignant] < charges[meilleur]:
+                    meilleur = enseignant
+                for autre in titulaires[enseignant]:
+                    if autre not in cede_par:
+                        cede_par[autre] = enseignant
+                        file.append(autre)
+        if meilleur is None:
+            continue
+
+        # Réaffectations le long du chemin : seule la charge du dernier enseignant augmente
+        enseignant = meilleur
+        while enseignant is not None:
+            courant = atteint_par[enseignant]
+            precedent = cede_par[courant]
+            if precedent is not None:
+                titulaires[precedent].discard(courant)
+            titulaires[enseignant].add(courant)
+            affectation[courant] = enseignant
+            enseignant = precedent
+        charges[meilleur] += 1
+        if charges[meilleur] - 1 == charge_min:
+            charge_min = min(charges.values())
+    return affectation
+
+
+def recommander(session, dossiers, nb_examinateurs=1):
+    """
+    Compositions proposées pour les dossiers (non enregistrées).
+    Retourne (propositions, non_pourvus, charges, enseignants) : propositions
+    {dossier: [(enseignant_id, rôle)]}, non_pourvus {dossier_id: [rôles]},
+    charges {enseignant_id: participations}, enseignants {id: EnseignantProfile}.
+    """
+    dossiers = list(dossiers.select_related('candidat__user'))
+    enseignants = {
+        e.pk: e for e in EnseignantProfile.objects.select_related('user')
+    }
+    par_departement = defaultdict(list)
+    for enseignant_id, departement_id in EnseignantProfile.departements.through.objects.values_list(
+        'enseignantprofile_id', 'departement_id'
+    ):
+        par_departement[departement_id].append(enseignant_id)
+
+    charges = dict.fromkeys(enseignants, 0)
+    for ligne in MembreJury.objects.filter(jury__session=session).values('enseignant_id').annotate(n=Count('id')):
+        charges[ligne['enseignant_id']] = ligne['n']
+
+    membres = {d.pk: [] for d in dossiers}
+    for dossier in dossiers:
+        if dossier.encadreur_id:
+            membres[dossier.pk].append((dossier.encadreur_id, MembreJury.Role.ENCADREUR))
+            charges[dossier.encadreur_id] = charges.get(dossier.encadreur_id, 0) + 1
+
+    vivier = {
+        d.pk: par_departement[d.candidat.departement_id] if d.candidat.departement_id else list(enseignants)
+        for d in dossiers
+    }
+    roles = [MembreJury.Role.PRESIDENT, MembreJury.Role.RAPPORTEUR] + [MembreJury.Role.EXAMINATEUR] * nb_examinateurs
+    non_pourvus = defaultdict(list)
+    for role in roles:
+        eligibles = {}
+        for dossier_id, deja in membres.items():
+            deja = {e for e, _ in deja}
+            eligibles[dossier_id] = [
+                e for e in vivier[dossier_id]
+                if e not in deja
+                and (role != MembreJury.Role.PRESIDENT or enseignants[e].grade in GRADES_PRESIDENT)
+            ]
+        affectation = affecter(list(membres), eligibles.__getitem__, charges)
+        for dossier_id in membres:
+            if dossier_id in affectation:
+                membres[dossier_id].append((affectation[dossier_id], role))
+            else:
+                non_pourvus[dossier_id].append(role)
+
+    propositions = {d: membres[d.pk] for d in dossiers}
+    return propositions, dict(non_pourvus), charges, enseignants
+
+
+def dossiers_sans_jury(session):
+    """Dossiers validés de la session dont la soutenance n'a pas encore de jury"""
+    return DossierSoutenance.objects.filter(
+        session=session, statut=DossierSoutenance.Statut.VALIDE, soutenance__jury__isnull=True
+    )
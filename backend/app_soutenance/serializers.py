@@ -1,11 +1,19 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from datetime import time
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils.dateparse import parse_date
 from .models import (
     CustomUser, Departement, CandidatProfile, EnseignantProfile,
     SessionSoutenance, Salle, DossierSoutenance, Document,
-    Jury, MembreJury, Soutenance
+    Jury, MembreJury, Soutenance, Televersement, PieceGeneree
 )
+from .storage import prechauffer_urls
+from .derives import url_derive
+from .conflits import conflits_soutenance
+from .acces import synchroniser_acces
 
 
 # ============================================================================
@@ -115,9 +123,14 @@ class DepartementSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
     def get_nb_candidats(self, obj):
+        # Utiliser l'annotation du queryset si présente
+        if hasattr(obj, 'nb_candidats'):
+            return obj.nb_candidats
         return obj.candidats.count()
 
     def get_nb_enseignants(self, obj):
+        if hasattr(obj, 'nb_enseignants'):
+            return obj.nb_enseignants
         return obj.enseignants.count()
 
 
@@ -130,14 +143,18 @@ class SimpleCandidatProfileSerializer(serializers.ModelSerializer):
     user = SimpleUserSerializer(read_only=True)
     departement = SimpleDepartementSerializer(read_only=True)
     nom_complet = serializers.SerializerMethodField()
+    photo_miniature = serializers.SerializerMethodField()
 
     class Meta:
         model = CandidatProfile
-        fields = ['id', 'user', 'matricule', 'nom_complet', 'cycle', 'departement']
+        fields = ['id', 'user', 'matricule', 'nom_complet', 'cycle', 'departement', 'photo_miniature']
 
     def get_nom_complet(self, obj):
         return obj.user.get_full_name()
 
+    def get_photo_miniature(self, obj):
+        return url_derive(obj.photo_empreinte, 'PHOTO_MINIATURE', self.context.get('request'))
+
 
 class SimpleEnseignantProfileSerializer(serializers.ModelSerializer):
     """Serializer minimal pour EnseignantProfile (objets imbriqués)"""
@@ -157,6 +174,8 @@ class CandidatProfileSerializer(serializers.ModelSerializer):
     user = CustomUserSerializer(read_only=True)
     departement = DepartementSerializer(read_only=True)
     has_dossier = serializers.SerializerMethodField()
+    photo_miniature = serializers.SerializerMethodField()
+    photo_moyenne = serializers.SerializerMethodField()
 
     # Champs pour créer l'utilisateur en même temps (write_only)
     email = serializers.EmailField(write_only=True, required=True)
@@ -176,11 +195,17 @@ class CandidatProfileSerializer(serializers.ModelSerializer):
             'email', 'first_name', 'last_name', 'password', 'username', 'phone',
             # Champs profil candidat
             'matricule', 'cycle', 'departement', 'departement_id', 'photo',
-            'has_dossier',
+            'photo_miniature', 'photo_moyenne', 'has_dossier',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_photo_miniature(self, obj):
+        return url_derive(obj.photo_empreinte, 'PHOTO_MINIATURE', self.context.get('request'))
+
+    def get_photo_moyenne(self, obj):
+        return url_derive(obj.photo_empreinte, 'PHOTO_MOYENNE', self.context.get('request'))
+
     def get_has_dossier(self, obj):
         """Indique si le candidat a au moins un dossier"""
         return obj.dossiers.exists()
@@ -343,6 +368,55 @@ class EnseignantProfileSerializer(serializers.ModelSerializer):
         return instance
 
 
+class ImportProfilsSerializer(serializers.Serializer):
+    """Paramètres de l'import par lot de candidats ou d'enseignants"""
+    fichier = serializers.FileField(help_text="CSV (UTF-8, séparateur , ou ;) ou XLSX, avec en-tête")
+    apercu = serializers.BooleanField(default=False, help_text="Vérifier sans rien enregistrer")
+
+
+class LigneImportSerializer(serializers.Serializer):
+    """Ligne d'un fichier d'import : champs utilisateur (unicité vérifiée par lot)"""
+    email = serializers.EmailField()
+    first_name = serializers.CharField(max_length=150)
+    last_name = serializers.CharField(max_length=150)
+    password = serializers.CharField(required=False, validators=[validate_password])
+    username = serializers.CharField(required=False, max_length=150, validators=[CustomUser.username_validator])
+    phone = serializers.CharField(required=False, max_length=20)
+
+    def validate_email(self, value):
+        return CustomUser.objects.normalize_email(value)
+
+    def validate(self, attrs):
+        attrs.setdefault('username', attrs['email'].split('@')[0])
+        return attrs
+
+    def departement_par_code(self, code):
+        try:
+            return self.context['departements'][code]
+        except KeyError:
+            raise serializers.ValidationError(f"Département inconnu : {code}")
+
+
+class LigneCandidatImportSerializer(LigneImportSerializer):
+    """Ligne d'import de candidat ; departement est un code, converti en identifiant"""
+    matricule = serializers.CharField(max_length=50)
+    cycle = serializers.ChoiceField(choices=CandidatProfile.Cycle.choices)
+    departement = serializers.CharField(required=False)
+
+    def validate_departement(self, value):
+        return self.departement_par_code(value)
+
+
+class LigneEnseignantImportSerializer(LigneImportSerializer):
+    """Ligne d'import d'enseignant ; departements : codes séparés par « ; » ou « | »"""
+    grade = serializers.ChoiceField(choices=EnseignantProfile.Grade.choices)
+    departements = serializers.CharField(required=False)
+
+    def validate_departements(self, value):
+        codes = {code.strip() for code in value.replace('|', ';').split(';') if code.strip()}
+        return [self.departement_par_code(code) for code in sorted(codes)]
+
+
 # ============================================================================
 # SERIALIZERS SESSIONS ET SALLES
 # ============================================================================
@@ -377,11 +451,15 @@ class SessionSoutenanceSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
     def get_nb_dossiers(self, obj):
+        # Utiliser l'annotation du queryset si présente
+        if hasattr(obj, 'nb_dossiers'):
+            return obj.nb_dossiers
         return obj.dossiers.count()
 
     def get_nb_soutenances(self, obj):
+        if hasattr(obj, 'nb_soutenances'):
+            return obj.nb_soutenances
         # Compter les soutenances via les dossiers de cette session
-        from .models import Soutenance
         return Soutenance.objects.filter(dossier__session=obj).count()
 
 
@@ -398,14 +476,121 @@ class SalleSerializer(serializers.ModelSerializer):
 # SERIALIZERS DOSSIERS
 # ============================================================================
 
+class DocumentListSerializer(serializers.ListSerializer):
+    """Résout les URLs des fichiers de la liste en un seul appel au stockage"""
+
+    def to_representation(self, data):
+        documents = list(data.all() if hasattr(data, 'all') else data)
+        prechauffer_urls([d.fichier for d in documents])
+        return super().to_representation(documents)
+
+
 class DocumentSerializer(serializers.ModelSerializer):
     """Serializer pour Document"""
+    apercu = serializers.SerializerMethodField(help_text="Aperçu PNG de la première page (PDF), dès qu'il est produit")
 
     class Meta:
         model = Document
-        fields = ['id', 'dossier', 'nom', 'fichier', 'type_piece', 'est_obligatoire', 'uploaded_at']
+        list_serializer_class = DocumentListSerializer
+        fields = ['id', 'dossier', 'nom', 'fichier', 'apercu', 'type_piece', 'est_obligatoire', 'uploaded_at']
         read_only_fields = ['id', 'uploaded_at']
 
+    def get_apercu(self, obj):
+        if obj.blob_id is None:
+            return None
+        return url_derive(obj.blob.empreinte, 'APERCU_PDF', self.context.get('request'))
+
+
+class UploadDirectSerializer(serializers.Serializer):
+    """Déclaration d'un document à envoyer directement au stockage"""
+    dossier = serializers.UUIDField()
+    nom = serializers.CharField(max_length=200)
+    type_piece = serializers.ChoiceField(choices=Document.TypePiece.choices)
+    est_obligatoire = serializers.BooleanField(default=False)
+    nom_fichier = serializers.CharField(max_length=200)
+    taille = serializers.IntegerField(min_value=1)
+    empreinte = serializers.RegexField(r'^[0-9a-f]{64}$', help_text="SHA-256 hexadécimal du fichier")
+
+
+class FinaliserUploadSerializer(serializers.Serializer):
+    """Jeton retourné par upload-direct, à présenter une fois le fichier envoyé"""
+    jeton = serializers.CharField()
+
+
+class PlanificationSerializer(serializers.Serializer):
+    """Paramètres de la planification automatique d'une session"""
+    date_debut = serializers.DateField()
+    date_fin = serializers.DateField()
+    heure_debut = serializers.TimeField(default=time(8, 0))
+    heure_fin = serializers.TimeField(default=time(18, 0))
+    capacite_min = serializers.IntegerField(default=0, min_value=0, help_text="Capacité minimale des salles")
+    samedi = serializers.BooleanField(default=False, help_text="Planifier aussi le samedi")
+    replanifier = serializers.BooleanField(
+        default=False, help_text="Replacer aussi les soutenances déjà planifiées de la session"
+    )
+    apercu = serializers.BooleanField(default=False, help_text="Calculer le planning sans l'enregistrer")
+
+    def validate(self, attrs):
+        if attrs['date_fin'] < attrs['date_debut']:
+            raise serializers.ValidationError({'date_fin': "La date de fin précède la date de début"})
+        if attrs['heure_fin'] <= attrs['heure_debut']:
+            raise serializers.ValidationError({'heure_fin': "L'heure de fin doit suivre l'heure de début"})
+        return attrs
+
+
+class PlanificationSoutenanceSerializer(serializers.Serializer):
+    """Paramètres de la planification manuelle d'une soutenance"""
+    date_heure = serializers.DateTimeField(help_text="Date et heure de début (ISO 8601)")
+    duree_minutes = serializers.IntegerField(default=60, min_value=1)
+    salle_id = serializers.PrimaryKeyRelatedField(
+        queryset=Salle.objects.all(), source='salle', required=False, allow_null=True
+    )
+    ordre_passage = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+
+    def validate_date_heure(self, valeur):
+        # Une date seule serait acceptée comme minuit : l'heure est exigée
+        brut = self.initial_data.get('date_heure')
+        if isinstance(brut, str) and parse_date(brut.strip()) is not None:
+            raise serializers.ValidationError("Préciser l'heure (AAAA-MM-JJTHH:MM)")
+        return valeur
+
+
+class CreneauxLibresSerializer(serializers.Serializer):
+    """Paramètres de la recherche de créneaux libres"""
+    date = serializers.DateField()
+    duree = serializers.IntegerField(default=45, min_value=1, help_text="Durée souhaitée (minutes)")
+    jury = serializers.UUIDField(required=False, help_text="Jury dont les enseignants doivent être libres")
+    heure_debut = serializers.TimeField(default=time(8, 0))
+    heure_fin = serializers.TimeField(default=time(18, 0))
+
+    def validate(self, attrs):
+        if attrs['heure_fin'] <= attrs['heure_debut']:
+            raise serializers.ValidationError({'heure_fin': "L'heure de fin doit suivre l'heure de début"})
+        return attrs
+
+
+class TeleversementSerializer(serializers.ModelSerializer):
+    """Upload reprenable : déclaration du document et progression"""
+    dossier_id = serializers.UUIDField(write_only=True)
+
+    class Meta:
+        model = Televersement
+        fields = [
+            'id', 'dossier', 'dossier_id', 'nom', 'type_piece', 'est_obligatoire',
+            'nom_fichier', 'taille', 'offset', 'expire_at', 'created_at'
+        ]
+        read_only_fields = ['id', 'dossier', 'offset', 'expire_at', 'created_at']
+        extra_kwargs = {'taille': {'min_value': 1}}
+
+
+class DossierSoutenanceDocumentsListSerializer(serializers.ListSerializer):
+    """Résout les URLs des documents de toute la page de dossiers en un seul appel"""
+
+    def to_representation(self, data):
+        dossiers = list(data.all() if hasattr(data, 'all') else data)
+        prechauffer_urls([doc.fichier for dossier in dossiers for doc in dossier.documents.all()])
+        return super().to_representation(dossiers)
+
 
 class DossierSoutenanceSerializer(serializers.ModelSerializer):
     """Serializer pour DossierSoutenance"""
@@ -420,6 +605,7 @@ class DossierSoutenanceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = DossierSoutenance
+        list_serializer_class = DossierSoutenanceDocumentsListSerializer
         fields = [
             'id', 'candidat', 'candidat_id', 'session', 'session_id',
             'titre_memoire', 'encadreur', 'encadreur_id',
@@ -431,11 +617,16 @@ class DossierSoutenanceSerializer(serializers.ModelSerializer):
 
 
 class DossierSoutenanceListSerializer(serializers.ModelSerializer):
-    """Serializer simplifié pour liste de dossiers"""
-    candidat_nom = serializers.SerializerMethodField()
-    session_titre = serializers.SerializerMethodField()
-    encadreur_nom = serializers.SerializerMethodField()
-    nb_documents = serializers.SerializerMethodField()
+    """
+    Serializer simplifié pour liste de dossiers.
+
+    Lit des lignes plates (dict issus de .values()) dont les champs calculés
+    sont annotés par DossierSoutenanceViewSet.get_queryset_compact().
+    """
+    candidat_nom = serializers.CharField(read_only=True)
+    session_titre = serializers.CharField(read_only=True)
+    encadreur_nom = serializers.CharField(read_only=True, allow_null=True)
+    nb_documents = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = DossierSoutenance
@@ -444,18 +635,6 @@ class DossierSoutenanceListSerializer(serializers.ModelSerializer):
             'encadreur_nom', 'nb_documents', 'statut', 'date_depot', 'date_validation'
         ]
 
-    def get_candidat_nom(self, obj):
-        return obj.candidat.user.get_full_name()
-
-    def get_session_titre(self, obj):
-        return obj.session.titre
-
-    def get_encadreur_nom(self, obj):
-        return obj.encadreur.user.get_full_name() if obj.encadreur else None
-
-    def get_nb_documents(self, obj):
-        return obj.documents.count()
-
 
 # ============================================================================
 # SERIALIZERS DOSSIERS (SUITE)
@@ -498,17 +677,27 @@ class MembreJurySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class MembreDataSerializer(serializers.Serializer):
+    """Membre demandé dans la composition d'un jury"""
+    enseignant_id = serializers.UUIDField()
+    role = serializers.ChoiceField(choices=MembreJury.Role.choices)
+
+
+# Relations de la composition affichées par JurySerializer
+PREFETCH_COMPOSITION = ('composition__enseignant__user', 'composition__enseignant__departements')
+
+
 class JurySerializer(serializers.ModelSerializer):
     """Serializer pour Jury"""
     session = SimpleSessionSoutenanceSerializer(read_only=True)
     composition = MembreJurySerializer(many=True, read_only=True)
 
     session_id = serializers.UUIDField(write_only=True)
-    membres_data = serializers.ListField(
-        child=serializers.DictField(),
+    membres_data = MembreDataSerializer(
+        many=True,
         write_only=True,
         required=False,
-        help_text="Liste des membres: [{'enseignant_id': 'uuid', 'role': 'PRESIDENT'}, ...]"
+        help_text="Composition complète: [{'enseignant_id': 'uuid', 'role': 'PRESIDENT'}, ...]"
     )
 
     class Meta:
@@ -519,23 +708,67 @@ class JurySerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'date_validation', 'created_at']
 
+    def validate_membres_data(self, value):
+        """Paires (enseignant, rôle) sans doublon ; enseignants vérifiés en une requête"""
+        paires = list(dict.fromkeys((m['enseignant_id'], m['role']) for m in value))
+        ids = {enseignant_id for enseignant_id, _ in paires}
+        inconnus = ids - set(EnseignantProfile.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        if inconnus:
+            raise serializers.ValidationError(
+                f"Enseignant(s) introuvable(s) : {', '.join(sorted(map(str, inconnus)))}"
+            )
+        return paires
+
+    def _appliquer_composition(self, jury, paires, actuels):
+        """
+        Aligner la composition sur `paires` : un DELETE pour les membres
+        retirés, un bulk_create pour les nouveaux, les autres sont conservés.
+        La composition est ensuite relue avec les relations de JuryViewSet.
+        """
+        voulus = set(paires)
+        retires = [m.pk for m in actuels if (m.enseignant_id, m.role) not in voulus]
+        presents = {(m.enseignant_id, m.role) for m in actuels}
+        nouveaux = [
+            MembreJury(jury=jury, enseignant_id=enseignant_id, role=role)
+            for enseignant_id, role in paires if (enseignant_id, role) not in presents
+        ]
+
+        if retires:
+            MembreJury.objects.filter(jury=jury, pk__in=retires).delete()
+        if nouveaux:
+            MembreJury.objects.bulk_create(nouveaux)
+            # bulk_create n'émet pas de signaux : index de visibilité
+            synchroniser_acces({m.enseignant_id for m in nouveaux})
+
+        if hasattr(jury, '_prefetched_objects_cache'):
+            jury._prefetched_objects_cache.pop('composition', None)
+        prefetch_related_objects([jury], *PREFETCH_COMPOSITION)
+
+    @transaction.atomic
     def create(self, validated_data):
-        membres_data = validated_data.pop('membres_data', [])
+        paires = validated_data.pop('membres_data', [])
         jury = Jury.objects.create(**validated_data)
+        self._appliquer_composition(jury, paires, [])
+        return jury
 
-        for membre in membres_data:
-            MembreJury.objects.create(
-                jury=jury,
-                enseignant_id=membre['enseignant_id'],
-                role=membre['role']
-            )
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        paires = validated_data.pop('membres_data', None)
+        instance = super().update(instance, validated_data)
+        if paires is not None:
+            # Composition préchargée par JuryViewSet.get_queryset
+            self._appliquer_composition(instance, paires, list(instance.composition.all()))
+        return instance
 
-        # Recharger le jury avec ses relations
-        jury = Jury.objects.select_related('session').prefetch_related(
-            'composition__enseignant__user'
-        ).get(pk=jury.pk)
 
-        return jury
+class RecommandationJurySerializer(serializers.Serializer):
+    """Paramètres de la recommandation de jurys"""
+    session_id = serializers.UUIDField()
+    dossier_ids = serializers.ListField(
+        child=serializers.UUIDField(), required=False,
+        help_text="Dossiers à pourvoir (par défaut : dossiers validés de la session sans jury)"
+    )
+    nb_examinateurs = serializers.IntegerField(default=1, min_value=0, max_value=3)
 
 
 class SimpleMembreJurySerializer(serializers.ModelSerializer):
@@ -566,10 +799,14 @@ class JuryListSerializer(serializers.ModelSerializer):
         return obj.session.titre
 
     def get_nb_membres(self, obj):
-        return obj.composition.count()
+        # .all() réutilise le prefetch de composition (pas de requête supplémentaire)
+        return len(obj.composition.all())
 
     def get_president(self, obj):
-        president_membre = obj.composition.filter(role='PRESIDENT').first()
+        president_membre = next(
+            (m for m in obj.composition.all() if m.role == MembreJury.Role.PRESIDENT),
+            None
+        )
         return president_membre.enseignant.user.get_full_name() if president_membre else None
 
 
@@ -597,6 +834,32 @@ class SoutenanceSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'session', 'created_at', 'updated_at']
 
+    def validate(self, attrs):
+        """Refuser un créneau qui chevauche une autre soutenance de la salle ou d'un enseignant"""
+        instance = self.instance
+        champs = ['dossier_id', 'jury_id', 'salle_id', 'date_heure', 'duree_minutes', 'statut']
+        valeurs = {champ: attrs.get(champ, getattr(instance, champ, None)) for champ in champs}
+        if valeurs['duree_minutes'] is None:
+            valeurs['duree_minutes'] = Soutenance._meta.get_field('duree_minutes').default
+        candidate = Soutenance(pk=instance.pk if instance else None, **valeurs)
+        conflits = conflits_soutenance(candidate)
+        if conflits:
+            raise serializers.ValidationError({'date_heure': [
+                f"{c['ressource']} déjà occupé(e) le {c['debut']:%d/%m/%Y} de {c['debut']:%H:%M} à {c['fin']:%H:%M} "
+                f"(soutenance {c['soutenances'][1]})"
+                for c in conflits
+            ]})
+        return attrs
+
+
+class PieceGenereeSerializer(serializers.ModelSerializer):
+    """Serializer pour PieceGeneree (convocation, procès-verbal)"""
+
+    class Meta:
+        model = PieceGeneree
+        fields = ['id', 'soutenance', 'type_piece', 'fichier', 'empreinte', 'updated_at']
+        read_only_fields = fields
+
 
 class SoutenanceListSerializer(serializers.ModelSerializer):
     """Serializer simplifié pour liste de soutenances"""
@@ -623,3 +886,26 @@ class SoutenanceListSerializer(serializers.ModelSerializer):
 
     def get_jury_nom(self, obj):
         return obj.jury.nom if obj.jury else None
+
+
+class SoutenanceCalendrierSerializer(serializers.ModelSerializer):
+    """
+    Représentation plate pour les widgets calendrier.
+
+    Lit des lignes (dict issus de .values()) annotées par SoutenanceViewSet.calendrier().
+    """
+    candidat_nom = serializers.CharField(read_only=True)
+    titre_memoire = serializers.CharField(read_only=True)
+    salle_id = serializers.UUIDField(read_only=True, allow_null=True)
+    salle_nom = serializers.CharField(read_only=True, allow_null=True)
+    jury_id = serializers.UUIDField(read_only=True, allow_null=True)
+    jury_nom = serializers.CharField(read_only=True, allow_null=True)
+    session_id = serializers.UUIDField(read_only=True)
+
+    class Meta:
+        model = Soutenance
+        fields = [
+            'id', 'date_heure', 'duree_minutes', 'ordre_passage', 'statut',
+            'candidat_nom', 'titre_memoire', 'salle_id', 'salle_nom',
+            'jury_id', 'jury_nom', 'session_id'
+        ]
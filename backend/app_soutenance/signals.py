@@ -0,0 +1,190 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import (
+    CandidatProfile, EnseignantProfile, DossierSoutenance, Document, MembreJury, Soutenance, Televersement
+)
+from .acces import synchroniser_acces, enseignants_du_jury, enseignants_des_departements
+from .dedup import stocker, liberer
+from .derives import planifier, generer_photo, generer_apercu, est_pdf
+from .televersement import chemin_partiel
+
+
+# ============================================================================
+# INDEX DE VISIBILITÉ (AccesObjet)
+# ============================================================================
+
+def _valeur_precedente(instance, champ):
+    """Valeur en base d'un champ avant sauvegarde (None pour une création)"""
+    if instance._state.adding:
+        return None
+    return type(instance).objects.filter(pk=instance.pk).values_list(champ, flat=True).first()
+
+
+@receiver(pre_save, sender=DossierSoutenance)
+def dossier_pre_save(sender, instance, **kwargs):
+    instance._encadreur_precedent = _valeur_precedente(instance, 'encadreur_id')
+    instance._candidat_precedent = _valeur_precedente(instance, 'candidat_id')
+
+
+@receiver(post_save, sender=DossierSoutenance)
+def dossier_post_save(sender, instance, created, **kwargs):
+    precedent = getattr(instance, '_encadreur_precedent', None)
+    candidat_change = not created and getattr(instance, '_candidat_precedent', None) != instance.candidat_id
+    if created or precedent != instance.encadreur_id or candidat_change:
+        enseignants = {instance.encadreur_id, precedent}
+        if candidat_change:
+            # Le jury de la soutenance voit le candidat du dossier
+            enseignants |= enseignants_du_jury(
+                *Soutenance.objects.filter(dossier=instance).values_list('jury_id', flat=True)
+            )
+        synchroniser_acces(enseignants)
+
+
+@receiver(post_delete, sender=DossierSoutenance)
+def dossier_post_delete(sender, instance, **kwargs):
+    synchroniser_acces({instance.encadreur_id})
+
+
+@receiver(pre_save, sender=Soutenance)
+def soutenance_pre_save(sender, instance, **kwargs):
+    instance._jury_precedent = _valeur_precedente(instance, 'jury_id')
+    instance._dossier_precedent = _valeur_precedente(instance, 'dossier_id')
+
+
+@receiver(post_save, sender=Soutenance)
+def soutenance_post_save(sender, instance, created, **kwargs):
+    precedent = getattr(instance, '_jury_precedent', None)
+    # Changer de dossier change le candidat visible par le jury
+    if created or precedent != instance.jury_id or \
+            getattr(instance, '_dossier_precedent', None) != instance.dossier_id:
+        synchroniser_acces(enseignants_du_jury(instance.jury_id, precedent))
+
+
+@receiver(post_delete, sender=Soutenance)
+def soutenance_post_delete(sender, instance, **kwargs):
+    synchroniser_acces(enseignants_du_jury(instance.jury_id))
+
+
+@receiver(pre_save, sender=MembreJury)
+def membre_jury_pre_save(sender, instance, **kwargs):
+    instance._enseignant_precedent = _valeur_precedente(instance, 'enseignant_id')
+
+
+@receiver(post_save, sender=MembreJury)
+def membre_jury_post_save(sender, instance, **kwargs):
+    synchroniser_acces({instance.enseignant_id, getattr(instance, '_enseignant_precedent', None)})
+
+
+@receiver(post_delete, sender=MembreJury)
+def membre_jury_post_delete(sender, instance, **kwargs):
+    synchroniser_acces({instance.enseignant_id})
+
+
+@receiver(pre_save, sender=CandidatProfile)
+def candidat_pre_save(sender, instance, **kwargs):
+    instance._departement_precedent = _valeur_precedente(instance, 'departement_id')
+
+
+@receiver(post_save, sender=CandidatProfile)
+def candidat_post_save(sender, instance, created, **kwargs):
+    precedent = getattr(instance, '_departement_precedent', None)
+    if created or precedent != instance.departement_id:
+        synchroniser_acces(enseignants_des_departements(instance.departement_id, precedent))
+
+
+@receiver(m2m_changed, sender=EnseignantProfile.departements.through)
+def enseignant_departements_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # Département vidé de ses enseignants : les mémoriser avant suppression
+        instance._enseignants_precedents = set(instance.enseignants.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        synchroniser_acces({instance.pk})
+    elif action == 'post_clear':
+        synchroniser_acces(getattr(instance, '_enseignants_precedents', set()))
+    else:
+        synchroniser_acces(pk_set)
+
+
+# ============================================================================
+# STOCKAGE DÉDUPLIQUÉ (Blob)
+# ============================================================================
+
+@receiver(pre_save, sender=Document)
+def document_pre_save(sender, instance, **kwargs):
+    instance._blob_precedent = _valeur_precedente(instance, 'blob_id')
+    fichier = instance.fichier
+    instance._fichier_a_stocker = None
+    if fichier and not fichier._committed:
+        # Nouveau fichier : ne pas l'envoyer sous upload_to, il sera rattaché
+        # au blob partagé une fois la ligne enregistrée (voir post_save)
+        instance._fichier_a_stocker = fichier
+        fichier._committed = True
+
+
+@receiver(post_save, sender=Document)
+def document_post_save(sender, instance, **kwargs):
+    fichier = getattr(instance, '_fichier_a_stocker', None)
+    precedent = getattr(instance, '_blob_precedent', None)
+    if fichier is not None:
+        # Après un enregistrement réussi seulement (dans la transaction de
+        # Document.save) : un échec de l'insert ne laisse ni référence en trop
+        # ni objet orphelin dans le stockage, un échec du stockage annule l'insert
+        instance._fichier_a_stocker = None
+        blob = stocker(fichier)
+        try:
+            Document.objects.filter(pk=instance.pk).update(blob=blob, fichier=blob.fichier.name)
+        except Exception:
+            liberer(blob.pk)
+            raise
+        instance.blob = blob
+        fichier.name = blob.fichier.name
+        # stocker() a pris une référence : rendre celle de l'ancien contenu,
+        # y compris lorsqu'il est identique au nouveau
+        liberer(precedent)
+    elif precedent and precedent != instance.blob_id:
+        liberer(precedent)
+
+
+@receiver(post_delete, sender=Document)
+def document_post_delete(sender, instance, **kwargs):
+    liberer(instance.blob_id)
+
+
+@receiver(post_delete, sender=Televersement)
+def televersement_post_delete(sender, instance, **kwargs):
+    # Y compris par cascade (utilisateur, dossier) : purger_expires ne voit que les lignes
+    chemin = chemin_partiel(instance)
+    transaction.on_commit(lambda: chemin.unlink(missing_ok=True))
+
+
+# ============================================================================
+# FICHIERS DÉRIVÉS (miniatures, aperçus)
+# ============================================================================
+
+@receiver(pre_save, sender=CandidatProfile)
+def candidat_photo_pre_save(sender, instance, **kwargs):
+    instance._photo_precedente = _valeur_precedente(instance, 'photo')
+    photo = instance.photo
+    if not photo:
+        instance.photo_empreinte = ''
+    elif not photo._committed:
+        # Empreinte calculée à la réception par l'upload handler (sinon en arrière-plan)
+        instance.photo_empreinte = getattr(photo.file, 'sha256', '')
+
+
+@receiver(post_save, sender=CandidatProfile)
+def candidat_photo_post_save(sender, instance, created, **kwargs):
+    if instance.photo and instance.photo.name != getattr(instance, '_photo_precedente', None):
+        transaction.on_commit(lambda: planifier(generer_photo, instance.pk))
+
+
+@receiver(post_save, sender=Document)
+def document_apercu_post_save(sender, instance, created, **kwargs):
+    if created and est_pdf(instance):
+        transaction.on_commit(lambda: planifier(generer_apercu, instance.pk))
@@ -0,0 +1,300 @@
+"""
+Serveur de stockage local imitant l'API Supabase Storage (développement / tests hors ligne).
+
+Points d'entrée pris en charge :
+- POST   /storage/v1/upload/resumable             création d'un upload TUS
+- HEAD   /storage/v1/upload/resumable/<id>        offset courant
+- PATCH  /storage/v1/upload/resumable/<id>        ajout d'un morceau
+- GET    /storage/v1/object/[public/]<bucket>/<chemin>   (en-tête Range accepté)
+- POST   /storage/v1/object/sign/<bucket>          {"paths": [...], "expiresIn": n}
+- GET    /storage/v1/object/sign/<bucket>/<chemin>?token=...
+- POST   /storage/v1/object/upload/sign/<bucket>/<chemin>   URL d'upload signée
+- PUT    /storage/v1/object/upload/sign/<bucket>/<chemin>?token=...  (corps brut)
+- HEAD   /storage/v1/object/<bucket>/<chemin>
+- DELETE /storage/v1/object/<bucket>              {"prefixes": [...]}
+
+Les objets sont écrits sous <racine>/<bucket>/<chemin>, les uploads en
+cours sous <racine>/.uploads/. Lancer avec `python manage.py serveur_stockage_local`.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import shutil
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+TAILLE_LECTURE = 64 * 1024
+PREFIXE_TUS = '/storage/v1/upload/resumable'
+PREFIXE_OBJET = '/storage/v1/object/'
+PREFIXE_SIGNE = '/storage/v1/object/sign/'
+PREFIXE_UPLOAD_SIGNE = '/storage/v1/object/upload/sign/'
+DUREE_UPLOAD_SIGNE = 2 * 60 * 60
+
+
+class StockageLocalHandler(BaseHTTPRequestHandler):
+    racine = Path('.')
+    cle_signature = b''
+
+    # ------------------------------------------------------------------
+    # Outils
+    # ------------------------------------------------------------------
+
+    def _repondre(self, code, corps=b'', headers=None):
+        self.send_response(code)
+        for cle, valeur in (headers or {}).items():
+            self.send_header(cle, valeur)
+        self.send_header('Content-Length', str(len(corps)))
+        self.end_headers()
+        if corps and self.command != 'HEAD':
+            self.wfile.write(corps)
+
+    def _json(self, code, donnees):
+        self._repondre(code, json.dumps(donnees).encode(), {'Content-Type': 'application/json'})
+
+    def _chemin(self):
+        return unquote(urlparse(self.path).path)
+
+    def _fichier_objet(self, bucket, chemin):
+        fichier = (self.racine / bucket / chemin).resolve()
+        if self.racine.resolve() not in fichier.parents:
+            raise ValueError('Chemin invalide')
+        return fichier
+
+    def _etat_upload(self, upload_id):
+        return self.racine / '.uploads' / f'{upload_id}.json'
+
+    def _lire_corps(self, destination):
+        """Copier le corps de la requête par blocs (mémoire bornée)"""
+        restant = int(self.headers.get('Content-Length', 0))
+        while restant:
+            bloc = self.rfile.read(min(TAILLE_LECTURE, restant))
+            if not bloc:
+                break
+            destination.write(bloc)
+            restant -= len(bloc)
+
+    # ------------------------------------------------------------------
+    # TUS
+    # ------------------------------------------------------------------
+
+    def _creer_upload(self):
+        metadata = {}
+        for paire in self.headers.get('Upload-Metadata', '').split(','):
+            if ' ' in paire.strip():
+                cle, valeur = paire.strip().split(' ', 1)
+                metadata[cle] = base64.b64decode(valeur).decode()
+        if 'bucketName' not in metadata or 'objectName' not in metadata:
+            return self._json(400, {'error': 'Upload-Metadata incomplet'})
+
+        upload_id = uuid.uuid4().hex
+        etat = {
+            'bucket': metadata['bucketName'],
+            'objet': metadata['objectName'],
+            'taille': int(self.headers['Upload-Length']),
+            'offset': 0,
+        }
+        (self.racine / '.uploads').mkdir(parents=True, exist_ok=True)
+        (self.racine / '.uploads' / f'{upload_id}.part').touch()
+        self._etat_upload(upload_id).write_text(json.dumps(etat))
+        if etat['taille'] == 0:
+            self._terminer_upload(upload_id, etat)
+        self._repondre(201, headers={
+            'Location': f'{PREFIXE_TUS}/{upload_id}',
+            'Tus-Resumable': '1.0.0',
+        })
+
+    def _terminer_upload(self, upload_id, etat):
+        fichier = self._fichier_objet(etat['bucket'], etat['objet'])
+        fichier.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(self.racine / '.uploads' / f'{upload_id}.part'), str(fichier))
+        self._etat_upload(upload_id).unlink()
+
+    def _offset_upload(self, upload_id):
+        etat_fichier = self._etat_upload(upload_id)
+        if not etat_fichier.exists():
+            return self._repondre(404)
+        etat = json.loads(etat_fichier.read_text())
+        self._repondre(200, headers={
+            'Upload-Offset': str(etat['offset']),
+            'Upload-Length': str(etat['taille']),
+            'Tus-Resumable': '1.0.0',
+        })
+
+    def _ajouter_morceau(self, upload_id):
+        etat_fichier = self._etat_upload(upload_id)
+        if not etat_fichier.exists():
+            return self._repondre(404)
+        etat = json.loads(etat_fichier.read_text())
+        if int(self.headers.get('Upload-Offset', -1)) != etat['offset']:
+            return self._repondre(409, headers={'Upload-Offset': str(etat['offset'])})
+
+        partiel = self.racine / '.uploads' / f'{upload_id}.part'
+        with open(partiel, 'ab') as destination:
+            self._lire_corps(destination)
+        etat['offset'] = partiel.stat().st_size
+        etat_fichier.write_text(json.dumps(etat))
+        if etat['offset'] >= etat['taille']:
+            self._terminer_upload(upload_id, etat)
+        self._repondre(204, headers={'Upload-Offset': str(etat['offset']), 'Tus-Resumable': '1.0.0'})
+
+    # ------------------------------------------------------------------
+    # Objets
+    # ------------------------------------------------------------------
+
+    def _jeton(self, bucket, chemin, expire_a):
+        message = f'{bucket}/{chemin}:{expire_a}'.encode()
+        return f'{expire_a}.' + hmac.new(self.cle_signature, message, hashlib.sha256).hexdigest()
+
+    def _signer(self):
+        bucket = self._chemin()[len(PREFIXE_SIGNE):].strip('/')
+        longueur = int(self.headers.get('Content-Length', 0))
+        demande = json.loads(self.rfile.read(longueur) or b'{}')
+        expire_a = int(time.time()) + int(demande.get('expiresIn', 60))
+        resultat = []
+        for chemin in demande.get('paths', []):
+            existe = self._fichier_objet(bucket, chemin).is_file()
+            resultat.append({
+                'path': chemin,
+                'error': None if existe else 'Either the object does not exist or you do not have access to it',
+                'signedURL': (
+                    f'/object/sign/{bucket}/{quote(chemin)}?token={self._jeton(bucket, chemin, expire_a)}'
+                    if existe else None
+                ),
+            })
+        self._json(200, resultat)
+
+    def _signer_upload(self):
+        parties = self._chemin()[len(PREFIXE_UPLOAD_SIGNE):].split('/', 1)
+        if len(parties) != 2:
+            return self._repondre(400)
+        expire_a = int(time.time()) + DUREE_UPLOAD_SIGNE
+        jeton = self._jeton('upload:' + parties[0], parties[1], expire_a)
+        self._json(200, {'url': f'/object/upload/sign/{parties[0]}/{quote(parties[1])}?token={jeton}'})
+
+    def _upload_signe(self):
+        parties = self._chemin()[len(PREFIXE_UPLOAD_SIGNE):].split('/', 1)
+        jeton = parse_qs(urlparse(self.path).query).get('token', [''])[0]
+        expire_a = jeton.split('.', 1)[0]
+        if len(parties) != 2 or not expire_a.isdigit() or int(expire_a) < time.time() or \
+                not hmac.compare_digest(jeton, self._jeton('upload:' + parties[0], parties[1], expire_a)):
+            return self._json(400, {'error': 'InvalidJWT'})
+        fichier = self._fichier_objet(*parties)
+        fichier.parent.mkdir(parents=True, exist_ok=True)
+        with open(fichier, 'wb') as destination:
+            self._lire_corps(destination)
+        self._json(200, {'Key': '/'.join(parties)})
+
+    def _objet(self, avec_corps=True):
+        parties = self._chemin()[len(PREFIXE_OBJET):].split('/', 1)
+        if parties[0] == 'sign':
+            parties = parties[1].split('/', 1)
+            jeton = parse_qs(urlparse(self.path).query).get('token', [''])[0]
+            expire_a = jeton.split('.', 1)[0]
+            if len(parties) != 2 or not expire_a.isdigit() or int(expire_a) < time.time() or \
+                    not hmac.compare_digest(jeton, self._jeton(*parties, expire_a)):
+                return self._json(400, {'error': 'InvalidJWT'})
+        elif parties[0] == 'public':
+            parties = parties[1].split('/', 1)
+        if len(parties) != 2:
+            return self._repondre(400)
+        fichier = self._fichier_objet(*parties)
+        if not fichier.is_file():
+            return self._json(404, {'error': 'not_found'})
+
+        taille = fichier.stat().st_size
+        debut, fin = 0, taille
+        plage = self.headers.get('Range', '')
+        if plage.startswith('bytes='):
+            premier, _, dernier = plage[len('bytes='):].partition('-')
+            debut = int(premier or 0)
+            fin = min(int(dernier) + 1, taille) if dernier else taille
+            if debut >= taille:
+                return self._repondre(416, headers={'Content-Range': f'bytes */{taille}'})
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {debut}-{fin - 1}/{taille}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(fin - debut))
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if avec_corps:
+            with open(fichier, 'rb') as source:
+                source.seek(debut)
+                restant = fin - debut
+                while restant:
+                    bloc = source.read(min(TAILLE_LECTURE, restant))
+                    if not bloc:
+                        break
+                    self.wfile.write(bloc)
+                    restant -= len(bloc)
+
+    def _supprimer(self):
+        bucket = self._chemin()[len(PREFIXE_OBJET):].strip('/')
+        longueur = int(self.headers.get('Content-Length', 0))
+        prefixes = json.loads(self.rfile.read(longueur) or b'{}').get('prefixes', [])
+        supprimes = []
+        for chemin in prefixes:
+            fichier = self._fichier_objet(bucket, chemin)
+            if fichier.is_file():
+                fichier.unlink()
+                supprimes.append({'name': chemin})
+        self._json(200, supprimes)
+
+    # ------------------------------------------------------------------
+    # Méthodes HTTP
+    # ------------------------------------------------------------------
+
+    def do_POST(self):
+        if self._chemin().rstrip('/') == PREFIXE_TUS:
+            return self._creer_upload()
+        if self._chemin().startswith(PREFIXE_SIGNE):
+            return self._signer()
+        if self._chemin().startswith(PREFIXE_UPLOAD_SIGNE):
+            return self._signer_upload()
+        self._repondre(404)
+
+    def do_HEAD(self):
+        chemin = self._chemin()
+        if chemin.startswith(PREFIXE_TUS + '/'):
+            return self._offset_upload(chemin.rsplit('/', 1)[-1])
+        if chemin.startswith(PREFIXE_OBJET):
+            return self._objet(avec_corps=False)
+        self._repondre(404)
+
+    def do_PATCH(self):
+        chemin = self._chemin()
+        if chemin.startswith(PREFIXE_TUS + '/'):
+            return self._ajouter_morceau(chemin.rsplit('/', 1)[-1])
+        self._repondre(404)
+
+    def do_PUT(self):
+        if self._chemin().startswith(PREFIXE_UPLOAD_SIGNE):
+            return self._upload_signe()
+        self._repondre(404)
+
+    def do_GET(self):
+        if self._chemin().startswith(PREFIXE_OBJET):
+            return self._objet()
+        self._repondre(404)
+
+    def do_DELETE(self):
+        if self._chemin().startswith(PREFIXE_OBJET):
+            return self._supprimer()
+        self._repondre(404)
+
+
+def creer_serveur(racine, hote='127.0.0.1', port=54321):
+    """Créer (sans le démarrer) un serveur de stockage local servant `racine`"""
+    racine = Path(racine)
+    racine.mkdir(parents=True, exist_ok=True)
+    handler = type('Handler', (StockageLocalHandler,), {
+        'racine': racine,
+        'cle_signature': secrets.token_bytes(32),
+    })
+    return ThreadingHTTPServer((hote, port), handler)
@@ -1,42 +1,321 @@
+import base64
+import hashlib
+import threading
+import time
 import uuid
+import zlib
+from collections import OrderedDict
+from urllib.parse import quote, urljoin
+
+import httpx
 from django.core.files.storage import Storage
 from django.conf import settings
-from supabase import create_client
+from supabase import ClientOptions, create_client
+
+
+class CacheTTL:
+    """
+    Cache LRU en mémoire (par processus), avec TTL par entrée.
+    Au-delà de `taille_max` entrées, les moins récemment utilisées sont évincées.
+    """
+    def __init__(self, taille_max=10000):
+        self.taille_max = taille_max
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def get(self, nom):
+        with self._verrou:
+            entree = self._entrees.get(nom)
+            if entree is None:
+                return None
+            url, expire_a = entree
+            if expire_a <= time.monotonic():
+                del self._entrees[nom]
+                return None
+            self._entrees.move_to_end(nom)
+            return url
+
+    def set(self, nom, url, ttl):
+        with self._verrou:
+            self._entrees[nom] = (url, time.monotonic() + ttl)
+            self._entrees.move_to_end(nom)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+
+    def invalider(self, nom):
+        with self._verrou:
+            self._entrees.pop(nom, None)
+
+
+TAILLE_LECTURE = 64 * 1024
+
+# Objet absent : résultat gardé brièvement pour ne pas re-interroger à chaque ligne
+TTL_ABSENT = 60
+ABSENT = -1
+
+_cache_urls = CacheTTL(getattr(settings, 'SUPABASE_URL_CACHE_SIZE', 10000))
+# Taille des objets connus (ABSENT si l'objet n'existe pas)
+_cache_metadonnees = CacheTTL(getattr(settings, 'SUPABASE_URL_CACHE_SIZE', 10000))
+
+_verrou_client = threading.Lock()
+_http = None
+_client = None
+
+
+def get_http():
+    """
+    Client HTTP partagé par le processus : pool de connexions keep-alive,
+    utilisé pour les uploads TUS, les HEAD de métadonnées et par le client Supabase.
+    """
+    global _http
+    if _http is None:
+        with _verrou_client:
+            if _http is None:
+                key = settings.SUPABASE_SERVICE_ROLE_KEY
+                _http = httpx.Client(
+                    headers={'Authorization': f'Bearer {key}', 'apikey': key},
+                    timeout=settings.SUPABASE_UPLOAD_TIMEOUT,
+                    limits=httpx.Limits(
+                        max_connections=settings.SUPABASE_HTTP_POOL_SIZE,
+                        max_keepalive_connections=settings.SUPABASE_HTTP_POOL_SIZE,
+                    ),
+                )
+    return _http
+
+
+def get_client():
+    """Client Supabase unique par processus, créé au premier usage"""
+    global _client
+    if _client is None:
+        http = get_http()
+        with _verrou_client:
+            if _client is None:
+                _client = create_client(
+                    settings.SUPABASE_URL,
+                    settings.SUPABASE_SERVICE_ROLE_KEY,
+                    options=ClientOptions(httpx_client=http),
+                )
+    return _client
+
+
+def prechauffer_urls(fichiers):
+    """
+    Résoudre en un seul appel les URLs d'une liste de FieldFile (batch),
+    pour que la sérialisation ne fasse ensuite que des lectures de cache.
+    """
+    fichiers = [f for f in fichiers if f]
+    if fichiers and hasattr(fichiers[0].storage, 'urls'):
+        fichiers[0].storage.urls([f.name for f in fichiers])
+
+
+def lire_fichier(fichier, debut=0, fin=None):
+    """
+    Contenu d'un FieldFile de `debut` à `fin` (exclu), par morceaux : requête
+    Range sur Supabase, lecture locale sinon (FileSystemStorage).
+    """
+    storage = fichier.storage
+    if hasattr(storage, 'lire_plage'):
+        yield from storage.lire_plage(fichier.name, debut, fin)
+        return
+    with storage.open(fichier.name, 'rb') as source:
+        source.seek(debut)
+        restant = None if fin is None else fin - debut
+        while restant is None or restant > 0:
+            morceau = source.read(TAILLE_LECTURE if restant is None else min(TAILLE_LECTURE, restant))
+            if not morceau:
+                break
+            if restant is not None:
+                restant -= len(morceau)
+            yield morceau
 
 
 class SupabaseStorage(Storage):
     """Custom Django storage backend for Supabase Storage."""
 
     def __init__(self):
-        self.client = create_client(
-            settings.SUPABASE_URL,
-            settings.SUPABASE_SERVICE_ROLE_KEY
-        )
         self.bucket = settings.SUPABASE_STORAGE_BUCKET
 
+    @property
+    def client(self):
+        return get_client()
+
     def _save(self, name, content):
         # Generer un nom unique pour eviter les conflits
         ext = name.rsplit('.', 1)[-1] if '.' in name else ''
         unique_name = f"{name.rsplit('.', 1)[0]}_{uuid.uuid4().hex[:8]}.{ext}" if ext else f"{name}_{uuid.uuid4().hex[:8]}"
 
-        file_bytes = content.read()
-        content_type = getattr(content, 'content_type', 'application/octet-stream')
-
-        self.client.storage.from_(self.bucket).upload(
-            path=unique_name,
-            file=file_bytes,
-            file_options={"content-type": content_type}
-        )
+        content_type = getattr(content, 'content_type', None) or 'application/octet-stream'
+        self._upload_resumable(unique_name, content, content_type)
+        # Métadonnées connues sans aller-retour réseau pour exists()/size()
+        _cache_metadonnees.set(unique_name, content.size, settings.SUPABASE_METADATA_CACHE_TTL)
         return unique_name
 
+    def _upload_resumable(self, name, content, content_type):
+        """
+        Upload TUS (resumable) par morceaux de SUPABASE_UPLOAD_CHUNK_SIZE octets.
+
+        Le fichier est lu morceau par morceau depuis le fichier temporaire
+        d'upload de Django : la mémoire utilisée ne dépend pas de sa taille.
+        En cas de coupure, l'offset réel est relu (HEAD) et l'envoi reprend.
+        """
+        endpoint = f"{settings.SUPABASE_URL.rstrip('/')}/storage/v1/upload/resumable"
+        chunk_size = settings.SUPABASE_UPLOAD_CHUNK_SIZE
+        taille = content.size
+
+        metadata = {
+            'bucketName': self.bucket,
+            'objectName': name,
+            'contentType': content_type,
+            'cacheControl': '3600',
+        }
+        http = get_http()
+        tus = {'Tus-Resumable': '1.0.0'}
+        reponse = http.post(endpoint, headers={
+            **tus,
+            'Upload-Length': str(taille),
+            'Upload-Metadata': ','.join(
+                f'{cle} {base64.b64encode(valeur.encode()).decode()}'
+                for cle, valeur in metadata.items()
+            ),
+        })
+        reponse.raise_for_status()
+        location = urljoin(endpoint, reponse.headers['Location'])
+
+        offset = 0
+        echecs = 0
+        while offset < taille:
+            content.seek(offset)
+            morceau = content.read(chunk_size)
+            try:
+                reponse = http.patch(location, content=morceau, headers={
+                    **tus,
+                    'Upload-Offset': str(offset),
+                    'Content-Type': 'application/offset+octet-stream',
+                })
+                reponse.raise_for_status()
+                offset = int(reponse.headers['Upload-Offset'])
+                echecs = 0
+            except (httpx.TransportError, httpx.HTTPStatusError):
+                echecs += 1
+                if echecs > settings.SUPABASE_UPLOAD_RETRIES:
+                    raise
+                # Reprendre à l'offset effectivement reçu par le serveur
+                reponse = http.head(location, headers=tus)
+                reponse.raise_for_status()
+                offset = int(reponse.headers['Upload-Offset'])
+
+    def _ttl_url(self):
+        """
+        Durée de cache d'une URL : pour une URL signée, rafraîchir avant son
+        expiration (marge de 10 %) ; une URL publique ne change pas.
+        """
+        if settings.SUPABASE_SIGNED_URLS:
+            return settings.SUPABASE_SIGNED_URL_EXPIRY * 0.9
+        return settings.SUPABASE_URL_CACHE_TTL
+
     def url(self, name):
-        return self.client.storage.from_(self.bucket).get_public_url(name)
+        url = _cache_urls.get(name)
+        if url is None:
+            url = self.urls([name]).get(name)
+        return url
+
+    def urls(self, names):
+        """
+        Résoudre plusieurs URLs : lecture du cache, puis un seul appel
+        create_signed_urls() pour les noms manquants (URLs signées).
+        """
+        resultat = {}
+        manquants = []
+        for name in dict.fromkeys(names):
+            url = _cache_urls.get(name)
+            if url is None:
+                manquants.append(name)
+            else:
+                resultat[name] = url
+        if not manquants:
+            return resultat
+
+        bucket = self.client.storage.from_(self.bucket)
+        if settings.SUPABASE_SIGNED_URLS:
+            signees = bucket.create_signed_urls(manquants, settings.SUPABASE_SIGNED_URL_EXPIRY)
+            # Objet absent : URL vide, gardée brièvement pour ne pas re-signer à chaque ligne
+            nouvelles = {item['path']: '' if item.get('error') else item['signedURL'] for item in signees}
+        else:
+            nouvelles = {name: bucket.get_public_url(name) for name in manquants}
+
+        ttl = self._ttl_url()
+        for name, url in nouvelles.items():
+            _cache_urls.set(name, url, ttl if url else TTL_ABSENT)
+        resultat.update(nouvelles)
+        return resultat
+
+    def creer_cible_upload(self, name):
+        """
+        URL signée permettant au client d'envoyer `name` directement au stockage
+        (PUT, valable 2 heures côté Supabase), sans passer par un worker.
+        """
+        cible = self.client.storage.from_(self.bucket).create_signed_upload_url(name)
+        self.invalider(name)
+        return {'url': cible['signed_url'], 'token': cible['token'], 'path': name}
+
+    def _url_objet(self, name):
+        return f"{settings.SUPABASE_URL.rstrip('/')}/storage/v1/object/{self.bucket}/{quote(name)}"
+
+    def lire_plage(self, name, debut=0, fin=None):
+        """
+        Contenu de l'objet de l'octet `debut` inclus à `fin` exclu (fin du
+        fichier par défaut), produit par morceaux via une requête Range.
+        """
+        entetes = {}
+        if debut or fin is not None:
+            entetes['Range'] = f"bytes={debut}-{'' if fin is None else fin - 1}"
+        with get_http().stream('GET', self._url_objet(name), headers=entetes) as reponse:
+            if reponse.status_code in (400, 404):
+                raise FileNotFoundError(name)
+            reponse.raise_for_status()
+            if debut and reponse.status_code != 206:
+                raise IOError(f"Requête Range ignorée par le stockage pour {name}")
+            yield from reponse.iter_bytes(TAILLE_LECTURE)
+
+    def sommes_controle(self, name):
+        """(SHA-256, CRC-32) d'un objet stocké, calculés en flux (mémoire bornée)"""
+        hachage = hashlib.sha256()
+        crc32 = 0
+        for morceau in self.lire_plage(name):
+            hachage.update(morceau)
+            crc32 = zlib.crc32(morceau, crc32)
+        return hachage.hexdigest(), crc32
+
+    def _taille(self, name):
+        """Taille de l'objet (ABSENT s'il n'existe pas), HEAD seulement hors cache"""
+        taille = _cache_metadonnees.get(name)
+        if taille is not None:
+            return taille
+
+        reponse = get_http().head(self._url_objet(name))
+        # Supabase répond 400 (et non 404) pour un objet introuvable
+        if reponse.status_code in (400, 404):
+            _cache_metadonnees.set(name, ABSENT, TTL_ABSENT)
+            return ABSENT
+        reponse.raise_for_status()
+        taille = int(reponse.headers['Content-Length'])
+        _cache_metadonnees.set(name, taille, settings.SUPABASE_METADATA_CACHE_TTL)
+        return taille
 
     def exists(self, name):
-        return False
+        return self._taille(name) != ABSENT
+
+    def invalider(self, name):
+        """Oublier l'URL et les métadonnées mises en cache pour `name`"""
+        _cache_urls.invalider(name)
+        _cache_metadonnees.invalider(name)
 
     def delete(self, name):
         self.client.storage.from_(self.bucket).remove([name])
+        self.invalider(name)
 
     def size(self, name):
-        return 0
+        taille = self._taille(name)
+        if taille == ABSENT:
+            raise FileNotFoundError(name)
+        return taille
@@ -0,0 +1,324 @@
+"""
+Upload des documents hors du chemin classique multipart de DocumentViewSet.
+
+Upload direct vers le stockage (sans transiter par un worker) :
+
+1. emettre_cible() : le client déclare dossier, type de pièce, taille et
+   empreinte SHA-256 ; il reçoit une URL d'upload signée et un jeton.
+   Aucun upload n'est demandé seulement si l'utilisateur référence déjà ce
+   contenu dans un document auquel il a accès : une empreinte seule ne
+   prouve pas la possession du fichier, et révélerait sa présence.
+2. Le client envoie le fichier en PUT directement au stockage.
+3. finaliser() : vérification de la taille et de l'empreinte recalculée de
+   l'objet reçu, puis création du Document pointant vers le Blob ; un contenu
+   déjà connu est dédupliqué à ce moment (l'objet envoyé est supprimé).
+
+Le jeton est signé et porte tout l'état : rien n'est conservé côté serveur
+entre les deux étapes.
+
+Upload reprenable (style tus) pour les gros fichiers et les connexions instables :
+les morceaux sont ajoutés à un fichier partiel (UPLOAD_REPRENABLE_DIR) à
+l'offset attendu ; après une coupure, le client relit l'offset et reprend.
+Le dernier morceau déclenche, une fois l'offset enregistré (hors transaction
+et sans verrou), l'envoi en flux vers le stockage et la création du Document.
+Les fichiers partiels sont sur disque : la reprise suppose que tous les
+morceaux d'un upload arrivent sur le même hôte, ou que UPLOAD_REPRENABLE_DIR
+soit un volume partagé par les workers (avec verrous flock).
+"""
+import fcntl
+import os
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.http import UnreadablePostError
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, PermissionDenied, ValidationError
+
+from .dedup import TAILLE_LECTURE, _referencer, adopter, liberer, stocker
+from .models import Blob, Document, DossierSoutenance, Televersement
+
+# Durée de validité des URLs d'upload signées de Supabase
+DUREE_JETON = 2 * 60 * 60
+_SEL = 'app_soutenance.televersement'
+
+
+def stockage():
+    return Blob._meta.get_field('fichier').storage
+
+
+def dossier_autorise(user, dossier_id):
+    """Dossier auquel l'utilisateur peut ajouter des documents"""
+    if user.role == 'ADMIN':
+        qs = DossierSoutenance.objects.all()
+    elif user.role == 'CANDIDAT':
+        qs = DossierSoutenance.objects.filter(candidat__user=user)
+    else:
+        raise PermissionDenied("Seuls le candidat et l'administrateur peuvent déposer des documents")
+    dossier = qs.filter(pk=dossier_id).first()
+    if dossier is None:
+        raise ValidationError({'dossier': 'Dossier introuvable'})
+    return dossier
+
+
+def deja_reference(user, empreinte):
+    """L'utilisateur a-t-il déjà accès à un document de ce contenu ?"""
+    documents = Document.objects.filter(blob__empreinte=empreinte)
+    if user.role != 'ADMIN':
+        documents = documents.filter(dossier__candidat__user=user)
+    return documents.exists()
+
+
+def verifier_taille(taille):
+    if taille > settings.UPLOAD_TAILLE_MAX:
+        raise ValidationError({'taille': 'Fichier trop volumineux'})
+
+
+def emettre_cible(user, donnees):
+    """Cible d'upload pour un document déclaré (données validées par UploadDirectSerializer)"""
+    dossier = dossier_autorise(user, donnees['dossier'])
+    empreinte = donnees['empreinte']
+    verifier_taille(donnees['taille'])
+
+    etat = {
+        'user': str(user.pk),
+        'dossier': str(dossier.pk),
+        'nom': donnees['nom'],
+        'type_piece': donnees['type_piece'],
+        'est_obligatoire': donnees['est_obligatoire'],
+        'taille': donnees['taille'],
+        'empreinte': empreinte,
+        'chemin': None,
+        'nonce': uuid.uuid4().hex,
+    }
+    reponse = {'deja_stocke': deja_reference(user, empreinte)}
+    if not reponse['deja_stocke']:
+        storage = stockage()
+        if not hasattr(storage, 'creer_cible_upload'):
+            raise ValidationError("Upload direct indisponible avec ce stockage")
+        _, ext = os.path.splitext(donnees['nom_fichier'])
+        etat['chemin'] = f"blobs/{empreinte[:2]}/{empreinte}_{uuid.uuid4().hex[:8]}{ext.lower()}"
+        cible = storage.creer_cible_upload(etat['chemin'])
+        reponse.update(upload_url=cible['url'], methode='PUT')
+
+    reponse['jeton'] = signing.dumps(etat, salt=_SEL)
+    reponse['expire_dans'] = DUREE_JETON
+    return reponse
+
+
+def finaliser(user, jeton):
+    """
+    Vérifier l'objet envoyé et créer le Document. Le jeton est à usage
+    unique : son nonce est enregistré sur le Document (contrainte unique),
+    si bien qu'un rejeu (nouvel essai, double clic, requêtes concurrentes)
+    est refusé sans toucher au fichier déjà adopté.
+    """
+    try:
+        etat = signing.loads(jeton, salt=_SEL, max_age=DUREE_JETON)
+    except signing.BadSignature:
+        raise ValidationError({'jeton': 'Jeton invalide ou expiré'})
+    if etat['user'] != str(user.pk):
+        raise PermissionDenied("Jeton émis pour un autre utilisateur")
+    dossier = dossier_autorise(user, etat['dossier'])
+
+    nonce = etat.get('nonce')
+    chemin = etat['chemin']
+    if not nonce:
+        raise ValidationError({'jeton': 'Jeton invalide ou expiré'})
+    # L'objet envoyé devient le fichier du blob : un second passage ne doit ni le
+    # revérifier ni, surtout, le supprimer
+    if Document.objects.filter(nonce_upload=nonce).exists() or (
+        chemin is not None and Blob.objects.filter(fichier=chemin).exists()
+    ):
+        raise JetonConsomme()
+
+    if chemin is not None:
+        storage = stockage()
+        # Ne pas se fier à une absence mise en cache avant la fin de l'upload
+        storage.invalider(chemin)
+        if not storage.exists(chemin):
+            raise ValidationError({'jeton': 'Fichier non reçu par le stockage'})
+        crc32 = None
+        if storage.size(chemin) == etat['taille']:
+            empreinte, crc32 = storage.sommes_controle(chemin)
+        if crc32 is None or empreinte != etat['empreinte']:
+            storage.delete(chemin)
+            raise ValidationError({'jeton': 'Taille ou empreinte du fichier reçu incorrecte'})
+
+    try:
+        with transaction.atomic():
+            if chemin is None:
+                blob = _referencer(etat['empreinte']) if deja_reference(user, etat['empreinte']) else None
+                if blob is None:
+                    raise ValidationError({'jeton': 'Contenu plus disponible, demander une nouvelle cible'})
+            else:
+                blob = adopter(chemin, etat['empreinte'], etat['taille'], crc32)
+            return Document.objects.create(
+                dossier=dossier,
+                nom=etat['nom'],
+                type_piece=etat['type_piece'],
+                est_obligatoire=etat['est_obligatoire'],
+                fichier=blob.fichier.name,
+                blob=blob,
+                nonce_upload=nonce,
+            )
+    except IntegrityError:
+        # Finalisation concurrente du même jeton : la référence prise est annulée
+        raise JetonConsomme()
+
+
+class JetonConsomme(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Ce jeton a déjà été utilisé"
+    default_code = 'jeton_consomme'
+
+
+# ============================================================================
+# UPLOAD REPRENABLE
+# ============================================================================
+
+class ConflitOffset(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "L'offset ne correspond pas aux octets déjà reçus"
+    default_code = 'conflit_offset'
+
+
+def chemin_partiel(televersement):
+    return Path(settings.UPLOAD_REPRENABLE_DIR) / f'{televersement.pk}.part'
+
+
+def creer_televersement(user, donnees):
+    """Ouvrir un upload reprenable (données validées par TeleversementSerializer)"""
+    dossier = dossier_autorise(user, donnees.pop('dossier_id'))
+    verifier_taille(donnees['taille'])
+    televersement = Televersement.objects.create(
+        user=user,
+        dossier=dossier,
+        expire_at=timezone.now() + timedelta(hours=settings.UPLOAD_REPRENABLE_EXPIRATION_HEURES),
+        **donnees
+    )
+    chemin = chemin_partiel(televersement)
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    chemin.touch()
+    return televersement
+
+
+def ajouter_morceau(user, televersement_id, offset, flux, longueur):
+    """
+    Écrire `longueur` octets lus depuis `flux` à `offset`, par blocs.
+    Retourne (televersement, document) ; document vaut None tant que
+    le fichier n'est pas complet.
+
+    Le corps de la requête est lu hors transaction : un verrou sur le fichier
+    partiel (flock) sérialise les morceaux d'un même upload, et l'offset est
+    enregistré ensuite par une mise à jour conditionnelle. Un morceau reçu
+    pendant qu'un autre est encore en cours est refusé (409).
+
+    L'envoi au stockage du fichier complet se fait après l'enregistrement de
+    l'offset, hors transaction et sans verrou. S'il échoue, le client relance
+    la finalisation par un morceau vide à l'offset final.
+    """
+    televersement = Televersement.objects.filter(pk=televersement_id, user=user).first()
+    if televersement is None or televersement.expire_at < timezone.now():
+        raise NotFound("Téléversement introuvable ou expiré")
+    if offset + longueur > televersement.taille:
+        raise ValidationError({'Upload-Offset': 'Le morceau dépasse la taille déclarée'})
+
+    try:
+        partiel = open(chemin_partiel(televersement), 'r+b')
+    except FileNotFoundError:
+        raise NotFound("Téléversement introuvable ou expiré")
+    with partiel:
+        try:
+            fcntl.flock(partiel, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ConflitOffset("Un morceau est déjà en cours de réception pour ce téléversement")
+        # Offset relu sous le verrou : le morceau précédent a pu l'avancer
+        televersement.offset = Televersement.objects.filter(pk=televersement.pk).values_list(
+            'offset', flat=True
+        ).first()
+        if televersement.offset is None:
+            raise NotFound("Téléversement introuvable ou expiré")
+        if offset != televersement.offset:
+            raise ConflitOffset()
+
+        # Écarter d'éventuels octets écrits après le dernier offset enregistré
+        partiel.truncate(offset)
+        partiel.seek(offset)
+        restant = longueur
+        try:
+            while restant:
+                bloc = flux.read(min(TAILLE_LECTURE, restant))
+                if not bloc:
+                    break
+                partiel.write(bloc)
+                restant -= len(bloc)
+        except (OSError, UnreadablePostError):
+            # Connexion coupée : garder ce qui a été reçu, le client reprendra
+            pass
+        partiel.flush()
+        recu = partiel.tell()
+        if not Televersement.objects.filter(pk=televersement.pk, offset=offset).update(offset=recu):
+            # Annulé ou finalisé pendant la réception
+            raise NotFound("Téléversement introuvable ou expiré")
+        televersement.offset = recu
+
+    document = None
+    if televersement.offset == televersement.taille:
+        document = terminer(televersement)
+    return televersement, document
+
+
+def terminer(televersement):
+    """
+    Envoyer le fichier complet au stockage (en flux), puis créer le Document
+    en une courte transaction. Si un autre appel a déjà finalisé cet upload,
+    ou si la création échoue, la référence prise sur le blob est rendue.
+    """
+    chemin = chemin_partiel(televersement)
+    try:
+        with open(chemin, 'rb') as partiel:
+            blob = stocker(File(partiel, name=televersement.nom_fichier))
+    except FileNotFoundError:
+        # Finalisé entre-temps par un appel concurrent
+        return None
+
+    try:
+        with transaction.atomic():
+            if not Televersement.objects.select_for_update().filter(pk=televersement.pk).exists():
+                document = None
+            else:
+                document = Document.objects.create(
+                    dossier=televersement.dossier,
+                    nom=televersement.nom,
+                    type_piece=televersement.type_piece,
+                    est_obligatoire=televersement.est_obligatoire,
+                    fichier=blob.fichier.name,
+                    blob=blob,
+                )
+                # Le fichier partiel est supprimé après commit (signals.televersement_post_delete)
+                Televersement.objects.filter(pk=televersement.pk).delete()
+    except Exception:
+        liberer(blob.pk)
+        raise
+    if document is None:
+        liberer(blob.pk)
+        return None
+    return document
+
+
+def annuler(televersement):
+    televersement.delete()
+
+
+def purger_expires():
+    """Supprimer les uploads reprenables expirés et leurs fichiers partiels"""
+    expires = list(Televersement.objects.filter(expire_at__lt=timezone.now()))
+    for televersement in expires:
+        annuler(televersement)
+    return len(expires)
@@ -1,3 +1,1379 @@
-from django.test import TestCase
+import hashlib
+import io
+import itertools
+import os
+import random
+import shutil
+import struct
+import tempfile
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import (
+    analytics, archive, conflits, creneaux, dedup, derives, ical, importation, pieces_pdf, planification,
+    recommandation, televersement,
+)
+from .acces import synchroniser_acces
+from .models import (
+    AccesObjet, Blob, CandidatProfile, CustomUser, Departement, Derive, Document, DossierSoutenance,
+    EnseignantProfile, Jury, MembreJury, PieceGeneree, Salle, SessionSoutenance, SiteEvent, SiteEventRollup,
+    Soutenance, Televersement,
+)
+from .views import CandidatProfileViewSet, JuryViewSet, SoutenanceViewSet
+
+
+# ============================================================================
+# DONNÉES DE TEST
+# ============================================================================
+
+def creer_utilisateur(prefixe, role, **extra):
+    return CustomUser.objects.create_user(
+        email=f'{prefixe}@test.fr', username=prefixe, password='x',
+        first_name=prefixe, last_name=prefixe, role=role, **extra
+    )
+
+
+def creer_enseignants(nombre, prefixe='ens'):
+    return [
+        EnseignantProfile.objects.create(
+            user=creer_utilisateur(f'{prefixe}{i}', CustomUser.Role.ENSEIGNANT),
+            grade=EnseignantProfile.Grade.PROFESSEUR,
+        )
+        for i in range(nombre)
+    ]
+
+
+def creer_candidat(prefixe, departement=None):
+    return CandidatProfile.objects.create(
+        user=creer_utilisateur(prefixe, CustomUser.Role.CANDIDAT),
+        matricule=prefixe.upper(), departement=departement,
+    )
+
+
+def creer_dossier(candidat, session, encadreur=None):
+    return DossierSoutenance.objects.create(
+        candidat=candidat, session=session, titre_memoire=f'Mémoire {candidat.matricule}',
+        encadreur=encadreur, statut=DossierSoutenance.Statut.VALIDE,
+    )
+
+
+def creer_jury(session, membres, nom='Jury'):
+    jury = Jury.objects.create(nom=nom, session=session)
+    for enseignant, role in membres:
+        MembreJury.objects.create(jury=jury, enseignant=enseignant, role=role)
+    return jury
+
+
+def creer_session():
+    maintenant = timezone.now()
+    return SessionSoutenance.objects.create(
+        titre='Session test', annee_academique='2025-2026', niveau_concerne='MASTER',
+        date_ouverture=maintenant, date_cloture=maintenant + timedelta(days=60),
+    )
+
+
+class StockageTest(FileSystemStorage):
+    """Stockage local exposant les méthodes d'upload direct de SupabaseStorage"""
+
+    def creer_cible_upload(self, name):
+        return {'url': f'https://stockage.test/{name}', 'token': 't', 'path': name}
+
+    def invalider(self, name):
+        pass
+
+    def sommes_controle(self, name):
+        with self.open(name) as fichier:
+            contenu = fichier.read()
+        return hashlib.sha256(contenu).hexdigest(), zlib.crc32(contenu)
+
+
+class StockageTemporaireMixin:
+    """Fichiers écrits dans un répertoire temporaire supprimé après chaque test"""
+
+    def setUp(self):
+        super().setUp()
+        self.repertoire = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repertoire, ignore_errors=True)
+        reglages = override_settings(STORAGES={
+            'default': {'BACKEND': 'app_soutenance.tests.StockageTest', 'OPTIONS': {'location': self.repertoire}},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def stockage(self):
+        return Blob._meta.get_field('fichier').storage
+
+
+# ============================================================================
+# JURYS
+# ============================================================================
+
+class JuryListeRequetesTest(TestCase):
+    """La liste des jurys coûte un nombre fixe de requêtes, quel que soit le volume"""
+
+    NB_JURYS = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', CustomUser.Role.ADMIN)
+        session = creer_session()
+        enseignants = creer_enseignants(6)
+        jurys = Jury.objects.bulk_create([
+            Jury(nom=f'Jury {i:03d}', session=session) for i in range(cls.NB_JURYS)
+        ])
+        roles = [MembreJury.Role.PRESIDENT, MembreJury.Role.RAPPORTEUR, MembreJury.Role.EXAMINATEUR]
+        MembreJury.objects.bulk_create([
+            MembreJury(jury=jury, enseignant=enseignants[(i + j) % len(enseignants)], role=role)
+            for i, jury in enumerate(jurys)
+            for j, role in enumerate(roles)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def compter(self, url):
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(url)
+        self.assertEqual(reponse.status_code, 200)
+        return reponse, len(requetes)
+
+    def test_budget_fixe(self):
+        # count, page + session, composition, enseignants, utilisateurs, départements
+        with self.assertNumQueries(6):
+            reponse = self.client.get('/api/jurys/')
+        self.assertEqual(reponse.data['count'], self.NB_JURYS)
+        for jury in reponse.data['results']:
+            self.assertEqual(jury['nb_membres'], 3)
+            self.assertIsNotNone(jury['president'])
+
+    def test_independant_de_la_page(self):
+        _, premiere = self.compter('/api/jurys/')
+        _, derniere = self.compter('/api/jurys/?page=25')
+        self.assertEqual(premiere, derniere)
+
+
+class JuryCompositionTest(TestCase):
+    """Composition écrite par membres_data, relue telle que la vue la prérecharge"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', CustomUser.Role.ADMIN)
+        cls.session = creer_session()
+        cls.enseignants = creer_enseignants(6)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def membres(self, *paires):
+        return [{'enseignant_id': str(self.enseignants[i].pk), 'role': role} for i, role in paires]
+
+    def composition(self, reponse):
+        return [(m['enseignant']['id'], m['role']) for m in reponse.data['composition']]
+
+    def attendue(self, jury_id):
+        return [
+            (str(enseignant_id), role)
+            for enseignant_id, role in MembreJury.objects.filter(jury_id=jury_id).values_list('enseignant_id', 'role')
+        ]
+
+    def test_creation_modification_retrait(self):
+        P, R, E = MembreJury.Role.PRESIDENT, MembreJury.Role.RAPPORTEUR, MembreJury.Role.EXAMINATEUR
+        reponse = self.client.post('/api/jurys/', {
+            'nom': 'Jury', 'session_id': str(self.session.pk), 'membres_data': self.membres((0, P), (1, R)),
+        }, format='json')
+        self.assertEqual(reponse.status_code, 201, reponse.content)
+        jury_id = reponse.data['id']
+        self.assertEqual(self.composition(reponse), self.attendue(jury_id))
+        self.assertEqual(len(reponse.data['composition']), 2)
+
+        # Un conservé, un retiré, trois ajoutés : jury préchargé (6), savepoint et mise à jour (3),
+        # retrait et ajout avec leur index de visibilité (13), composition relue comme par la vue (4)
+        with self.assertNumQueries(26):
+            reponse = self.client.patch(f'/api/jurys/{jury_id}/', {
+                'membres_data': self.membres((0, P), (2, R), (3, E), (4, E)),
+            }, format='json')
+        self.assertEqual(reponse.status_code, 200, reponse.content)
+        self.assertEqual(self.composition(reponse), self.attendue(jury_id))
+        self.assertEqual(len(reponse.data['composition']), 4)
+
+        reponse = self.client.patch(f'/api/jurys/{jury_id}/', {'membres_data': []}, format='json')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.data['composition'], [])
+        self.assertFalse(MembreJury.objects.filter(jury_id=jury_id).exists())
+
+
+# ============================================================================
+# VISIBILITÉ ENSEIGNANT : plans d'exécution
+# ============================================================================
+
+class VisibiliteExplainTest(TestCase):
+    """
+    Les filtres de visibilité sont des EXISTS sur une clé indexée : ni
+    DISTINCT, ni parcours complet de la table d'accès ou de la composition.
+    """
+
+    NB_CANDIDATS = 300
+
+    @classmethod
+    def setUpTestData(cls):
+        session = creer_session()
+        departement = Departement.objects.create(code='INFO', nom='Informatique')
+        cls.enseignants = creer_enseignants(10)
+        for enseignant in cls.enseignants[:5]:
+            enseignant.departements.add(departement)
+        # Volume : bulk_create (sans signaux), puis index de visibilité reconstruit en une passe
+        utilisateurs = CustomUser.objects.bulk_create([
+            CustomUser(email=f'cand{i}@test.fr', username=f'cand{i}', password='!', role=CustomUser.Role.CANDIDAT)
+            for i in range(cls.NB_CANDIDATS)
+        ])
+        candidats = CandidatProfile.objects.bulk_create([
+            CandidatProfile(user=user, matricule=f'CAND{i}', departement=departement if i % 3 == 0 else None)
+            for i, user in enumerate(utilisateurs)
+        ])
+        dossiers = DossierSoutenance.objects.bulk_create([
+            DossierSoutenance(
+                candidat=candidat, session=session, titre_memoire='Mémoire',
+                encadreur=cls.enseignants[i % 10], statut=DossierSoutenance.Statut.VALIDE,
+            )
+            for i, candidat in enumerate(candidats[:60])
+        ])
+        jurys = Jury.objects.bulk_create([Jury(nom=f'Jury {i}', session=session) for i in range(60)])
+        MembreJury.objects.bulk_create([
+            MembreJury(jury=jury, enseignant=cls.enseignants[(i + decalage) % 10], role=role)
+            for i, jury in enumerate(jurys)
+            for decalage, role in [(1, MembreJury.Role.PRESIDENT), (2, MembreJury.Role.RAPPORTEUR)]
+        ])
+        Soutenance.objects.bulk_create([
+            Soutenance(dossier=dossier, jury=jury) for dossier, jury in zip(dossiers, jurys)
+        ])
+        synchroniser_acces()
+        cls.user = cls.enseignants[1].user
+
+    def queryset(self, vue, params=None):
+        requete = Request(APIRequestFactory().get('/', params or {}))
+        requete.user = self.user
+        return vue(request=requete, action='list', format_kwarg=None).get_queryset()
+
+    def plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Petites tables : forcer le planificateur à montrer l'index utilisable
+            with connection.cursor() as curseur:
+                curseur.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def index_unique(self, modele, colonnes):
+        table = modele._meta.db_table
+        with connection.cursor() as curseur:
+            contraintes = connection.introspection.get_constraints(curseur, table)
+        return next(
+            nom for nom, info in contraintes.items()
+            if info['columns'] == colonnes and (info['index'] or info['unique'])
+        )
+
+    def assertIndexUtilise(self, plan, index):
+        self.assertIn(index, plan, plan)
+
+    def test_candidats(self):
+        qs = self.queryset(CandidatProfileViewSet)
+        self.assertNotIn('DISTINCT', str(qs.query))
+        self.assertIndexUtilise(
+            self.plan(qs), self.index_unique(AccesObjet, ['user_id', 'type_objet', 'objet_id'])
+        )
+        self.assertEqual(
+            set(qs.values_list('pk', flat=True)),
+            set(AccesObjet.objects.filter(user=self.user, type_objet=AccesObjet.TypeObjet.CANDIDAT)
+                .values_list('objet_id', flat=True)),
+        )
+
+    def test_soutenances(self):
+        qs = self.queryset(SoutenanceViewSet)
+        self.assertNotIn('DISTINCT', str(qs.query))
+        self.assertIndexUtilise(
+            self.plan(qs), self.index_unique(AccesObjet, ['user_id', 'type_objet', 'objet_id'])
+        )
+        self.assertEqual(
+            set(qs.values_list('pk', flat=True)),
+            set(Soutenance.objects.filter(jury__composition__enseignant=self.enseignants[1])
+                .values_list('pk', flat=True)),
+        )
+
+    def test_jurys_par_enseignant(self):
+        qs = self.queryset(JuryViewSet, {'enseignant': str(self.enseignants[1].pk)})
+        self.assertNotIn('DISTINCT', str(qs.query))
+        plan = self.plan(qs)
+        self.assertTrue(
+            'membrejury_ens_jury_idx' in plan
+            or self.index_unique(MembreJury, ['jury_id', 'enseignant_id', 'role']) in plan,
+            plan,
+        )
+        self.assertEqual(qs.count(), 12)
+
+
+# ============================================================================
+# PLANIFICATION
+# ============================================================================
+
+class PlanificationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = creer_session()
+        cls.enseignants = creer_enseignants(6)
+        cls.petite = Salle.objects.create(nom='A', batiment='B1', capacite=3)
+        cls.grande = Salle.objects.create(nom='B', batiment='B1', capacite=6)
+        roles = [MembreJury.Role.PRESIDENT, MembreJury.Role.RAPPORTEUR, MembreJury.Role.EXAMINATEUR]
+        # Jurys qui partagent des enseignants : ils ne peuvent pas siéger en parallèle
+        for i in range(12):
+            membres = [(cls.enseignants[(i + j) % 4], role) for j, role in enumerate(roles[:2 + i % 2])]
+            jury = creer_jury(cls.session, membres, nom=f'Jury {i}')
+            dossier = creer_dossier(creer_candidat(f'plan{i}'), cls.session, encadreur=cls.enseignants[4 + i % 2])
+            Soutenance.objects.create(dossier=dossier, jury=jury, duree_minutes=60)
+
+    def planifier(self, **options):
+        lundi = date(2030, 1, 7)
+        return planification.planifier_session(
+            self.session, lundi, lundi + timedelta(days=4), time(8), time(12), **options
+        )
+
+    def membres(self, soutenance):
+        membres = set(soutenance.jury.composition.values_list('enseignant_id', flat=True))
+        return membres | {soutenance.dossier.encadreur_id}
+
+    def test_sans_chevauchement(self):
+        placees, non_placees = self.planifier()
+        self.assertEqual(len(placees), 12)
+        self.assertEqual(non_placees, [])
+        for a, b in itertools.combinations(placees, 2):
+            fin_a = a.date_heure + timedelta(minutes=a.duree_minutes)
+            fin_b = b.date_heure + timedelta(minutes=b.duree_minutes)
+            if a.date_heure < fin_b and b.date_heure < fin_a:
+                self.assertNotEqual(a.salle_id, b.salle_id)
+                self.assertFalse(self.membres(a) & self.membres(b))
+
+    def test_dans_les_plages(self):
+        placees, _ = self.planifier()
+        for soutenance in placees:
+            debut = timezone.localtime(soutenance.date_heure)
+            self.assertLess(debut.weekday(), 5)
+            self.assertGreaterEqual(debut.time(), time(8))
+            self.assertLessEqual((debut + timedelta(minutes=soutenance.duree_minutes)).time(), time(12))
+
+    def test_capacite(self):
+        placees, _ = self.planifier()
+        for soutenance in placees:
+            self.assertGreaterEqual(soutenance.salle.capacite, len(self.membres(soutenance)) + 1)
+
+    def test_capacite_insuffisante(self):
+        placees, non_placees = self.planifier(capacite_min=10)
+        self.assertEqual(placees, [])
+        self.assertEqual({raison for _, raison in non_placees}, {"Aucune salle de capacité suffisante"})
+
+    def test_reservations_existantes(self):
+        fixee = Soutenance.objects.first()
+        fixee.date_heure = timezone.make_aware(datetime(2030, 1, 7, 8))
+        fixee.salle = self.grande
+        fixee.save()
+        placees, _ = self.planifier()
+        occupes = self.membres(fixee)
+        fin_fixee = fixee.date_heure + timedelta(minutes=fixee.duree_minutes)
+        for soutenance in placees:
+            if soutenance.date_heure < fin_fixee:
+                self.assertNotEqual(soutenance.salle_id, fixee.salle_id)
+                self.assertFalse(self.membres(soutenance) & occupes)
+
+    def test_appliquer(self):
+        placees, _ = self.planifier()
+        planification.appliquer(placees)
+        self.assertFalse(Soutenance.objects.filter(date_heure__isnull=True).exists())
+        self.assertEqual(conflits.conflits_session(self.session), [])
+
+
+# ============================================================================
+# CONFLITS
+# ============================================================================
+
+class ArbreIntervallesTest(SimpleTestCase):
+
+    def test_equivaut_a_la_recherche_naive(self):
+        aleatoire = random.Random(5)
+        intervalles = []
+        for i in range(300):
+            debut = aleatoire.randrange(1000)
+            intervalles.append((debut, debut + aleatoire.randrange(1, 60), i))
+        arbre = conflits.ArbreIntervalles(intervalles)
+        for _ in range(200):
+            debut = aleatoire.randrange(1000)
+            fin = debut + aleatoire.randrange(1, 60)
+            attendus = {i for i in intervalles if i[0] < fin and i[1] > debut}
+            self.assertEqual(set(arbre.chevauchants(debut, fin)), attendus)
+
+    def test_bornes_ouvertes(self):
+        arbre = conflits.ArbreIntervalles([(10, 20, 'a')])
+        self.assertEqual(arbre.chevauchants(20, 30), [])
+        self.assertEqual(arbre.chevauchants(0, 10), [])
+        self.assertEqual(arbre.chevauchants(19, 21), [(10, 20, 'a')])
+
+    def test_vide(self):
+        self.assertEqual(conflits.ArbreIntervalles([]).chevauchants(0, 10), [])
+
+
+class ConflitsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = creer_session()
+        cls.e1, cls.e2, cls.e3, cls.e4 = creer_enseignants(4)
+        cls.salle = Salle.objects.create(nom='A', batiment='B1', capacite=10)
+        cls.autre_salle = Salle.objects.create(nom='B', batiment='B1', capacite=10)
+        cls.debut = timezone.make_aware(datetime(2030, 1, 7, 9))
+        cls.reference = cls.soutenance('ref', [cls.e1, cls.e2], cls.salle, cls.debut)
+
+    @classmethod
+    def soutenance(cls, prefixe, membres, salle, debut, duree=60):
+        jury = creer_jury(cls.session, [(e, MembreJury.Role.EXAMINATEUR) for e in membres], nom=prefixe)
+        dossier = creer_dossier(creer_candidat(prefixe), cls.session)
+        return Soutenance.objects.create(
+            dossier=dossier, jury=jury, salle=salle, date_heure=debut, duree_minutes=duree
+        )
+
+    def test_salle(self):
+        autre = self.soutenance('s', [self.e3], self.salle, self.debut + timedelta(minutes=30))
+        trouves = conflits.conflits_soutenance(autre)
+        self.assertEqual([(c['type'], c['ressource_id']) for c in trouves], [('SALLE', self.salle.pk)])
+        self.assertEqual(set(trouves[0]['soutenances']), {autre.pk, self.reference.pk})
+
+    def test_enseignant(self):
+        autre = self.soutenance('e', [self.e2, self.e3], self.autre_salle, self.debut + timedelta(minutes=59))
+        trouves = conflits.conflits_soutenance(autre)
+        self.assertEqual([(c['type'], c['ressource_id']) for c in trouves], [('ENSEIGNANT', self.e2.pk)])
+
+    def test_creneaux_consecutifs(self):
+        autre = self.soutenance('c', [self.e1, self.e2], self.salle, self.debut + timedelta(minutes=60))
+        self.assertEqual(conflits.conflits_soutenance(autre), [])
+
+    def test_annulee_ignoree(self):
+        autre = self.soutenance('a', [self.e1], self.salle, self.debut)
+        self.reference.statut = Soutenance.Statut.ANNULEE
+        self.reference.save()
+        self.assertEqual(conflits.conflits_soutenance(autre), [])
+
+    def test_session(self):
+        self.soutenance('x', [self.e1], self.autre_salle, self.debut + timedelta(minutes=10))
+        self.soutenance('y', [self.e4], self.salle, self.debut + timedelta(minutes=45))
+        self.soutenance('z', [self.e4], self.autre_salle, self.debut + timedelta(hours=3))
+        trouves = conflits.conflits_session(self.session)
+        self.assertEqual(
+            sorted((c['type'], c['ressource_id']) for c in trouves),
+            sorted([('ENSEIGNANT', self.e1.pk), ('SALLE', self.salle.pk)]),
+        )
+
+
+class PlanifierSoutenanceTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = creer_utilisateur('admin', CustomUser.Role.ADMIN)
+        cls.session = session = creer_session()
+        enseignant, = creer_enseignants(1)
+        cls.salle = Salle.objects.create(nom='A', batiment='B1', capacite=10)
+        jury = creer_jury(session, [(enseignant, MembreJury.Role.PRESIDENT)])
+        cls.occupee = Soutenance.objects.create(
+            dossier=creer_dossier(creer_candidat('occ'), session), jury=jury, salle=cls.salle,
+            date_heure=timezone.make_aware(datetime(2030, 1, 7, 9)), duree_minutes=60,
+        )
+        cls.soutenance = Soutenance.objects.create(dossier=creer_dossier(creer_candidat('lib'), session))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def planifier(self, **donnees):
+        return self.client.post(f'/api/soutenances/{self.soutenance.pk}/planifier/', donnees, format='json')
+
+    def test_date_heure_invalide(self):
+        for donnees in ({}, {'date_heure': '2030-01-07'}, {'date_heure': 'demain'}, {'date_heure': None}):
+            reponse = self.planifier(**donnees)
+            self.assertEqual(reponse.status_code, 400, donnees)
+            self.assertIn('date_heure', reponse.data)
+        self.soutenance.refresh_from_db()
+        self.assertIsNone(self.soutenance.date_heure)
+
+    def test_parametres_invalides(self):
+        reponse = self.planifier(date_heure='2030-01-07T14:00', salle_id=str(self.soutenance.pk), duree_minutes=0)
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual(set(reponse.data), {'salle_id', 'duree_minutes'})
+
+    def test_conflit_de_salle(self):
+        reponse = self.planifier(date_heure='2030-01-07T09:30', salle_id=str(self.salle.pk))
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual([c['type'] for c in reponse.data['conflits']], ['SALLE'])
+
+    def test_planifiee(self):
+        reponse = self.planifier(date_heure='2030-01-07T10:00', salle_id=str(self.salle.pk), duree_minutes=45)
+        self.assertEqual(reponse.status_code, 200)
+        self.soutenance.refresh_from_db()
+        self.assertEqual(self.soutenance.date_heure, timezone.make_aware(datetime(2030, 1, 7, 10)))
+        self.assertEqual(self.soutenance.salle, self.salle)
+        self.assertEqual(self.soutenance.duree_minutes, 45)
+
+    def test_contrainte_exclusion(self):
+        """Créneau réservé entre la vérification et le commit : 400, pas d'erreur serveur"""
+        with mock.patch.object(Soutenance, 'save', side_effect=IntegrityError):
+            reponse = self.planifier(date_heure='2030-01-07T10:00', salle_id=str(self.salle.pk))
+            self.assertEqual(reponse.status_code, 400)
+            reponse = self.client.patch(
+                f'/api/soutenances/{self.occupee.pk}/', {'duree_minutes': 90}, format='json'
+            )
+            self.assertEqual(reponse.status_code, 400)
+        self.occupee.refresh_from_db()
+        self.assertEqual(self.occupee.duree_minutes, 60)
+
+    def test_contrainte_exclusion_session(self):
+        with mock.patch.object(planification, 'appliquer', side_effect=IntegrityError):
+            reponse = self.client.post(f'/api/sessions/{self.session.pk}/planifier/', {
+                'date_debut': '2030-01-07', 'date_fin': '2030-01-11',
+            }, format='json')
+        self.assertEqual(reponse.status_code, 409)
+
+
+# ============================================================================
+# CALENDRIERS ICS
+# ============================================================================
+
+class VersionFluxTest(TestCase):
+    """L'ETag d'un flux suit aussi les relations affichées dans les VEVENT"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = creer_session()
+        enseignant, = creer_enseignants(1)
+        cls.salle = Salle.objects.create(nom='A', batiment='B1', capacite=10)
+        cls.jury = creer_jury(cls.session, [(enseignant, MembreJury.Role.PRESIDENT)], nom='Jury 1')
+        cls.candidat = creer_candidat('ics')
+        cls.soutenance = Soutenance.objects.create(
+            dossier=creer_dossier(cls.candidat, cls.session), jury=cls.jury, salle=cls.salle,
+            date_heure=timezone.make_aware(datetime(2030, 1, 7, 9)),
+        )
+
+    def version(self):
+        return ical.version_flux('session', self.session.pk)
+
+    def assertVersionChange(self, modifier, attendu):
+        avant = self.version()
+        ical.obtenir_flux('session', self.session.pk, avant)
+        modifier()
+        apres = self.version()
+        self.assertNotEqual(avant, apres)
+        self.assertIn(attendu, ical.obtenir_flux('session', self.session.pk, apres))
+
+    def test_stable(self):
+        self.assertEqual(self.version(), self.version())
+
+    def test_salle(self):
+        def renommer():
+            self.salle.nom = 'Amphi'
+            self.salle.save()
+        self.assertVersionChange(renommer, 'LOCATION:Amphi (B1)')
+
+    def test_candidat(self):
+        def renommer():
+            user = self.candidat.user
+            user.last_name = 'Nouveau'
+            user.save()
+        self.assertVersionChange(renommer, 'Nouveau')
+
+    def test_jury(self):
+        def renommer():
+            self.jury.nom = 'Jury renommé'
+            self.jury.save()
+        self.assertVersionChange(renommer, 'Jury renommé')
+
+    def test_soutenance_retiree(self):
+        def deplacer():
+            self.soutenance.date_heure = None
+            self.soutenance.save()
+        self.assertVersionChange(deplacer, 'END:VCALENDAR')
+
+
+# ============================================================================
+# RECOMMANDATION DE JURY
+# ============================================================================
+
+class AffecterTest(SimpleTestCase):
+    """affecter() donne une affectation de cardinal maximal et de coût (somme des carrés) minimal"""
+
+    @staticmethod
+    def optimum(dossiers, eligibles, charges):
+        meilleur = None
+        for choix in itertools.product(*[eligibles[d] + [None] for d in dossiers]):
+            finales = dict(charges)
+            for enseignant in choix:
+                if enseignant is not None:
+                    finales[enseignant] += 1
+            cle = (-sum(e is not None for e in choix), sum(c * c for c in finales.values()))
+            if meilleur is None or cle < meilleur:
+                meilleur = cle
+        return meilleur
+
+    def test_optimal(self):
+        aleatoire = random.Random(7)
+        for _ in range(150):
+            enseignants = list('abcd')
+            dossiers = list(range(aleatoire.randint(1, 5)))
+            eligibles = {d: aleatoire.sample(enseignants, aleatoire.randint(0, 3)) for d in dossiers}
+            charges = {e: aleatoire.randint(0, 2) for e in enseignants}
+            attendu = self.optimum(dossiers, eligibles, charges)
+
+            finales = dict(charges)
+            affectation = recommandation.affecter(dossiers, eligibles.__getitem__, finales)
+            for dossier, enseignant in affectation.items():
+                self.assertIn(enseignant, eligibles[dossier])
+            recompte = dict(charges)
+            for enseignant in affectation.values():
+                recompte[enseignant] += 1
+            self.assertEqual(finales, recompte)
+            self.assertEqual((-len(affectation), sum(c * c for c in finales.values())), attendu)
+
+
+class RecommanderTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = creer_session()
+        cls.info = Departement.objects.create(code='INFO', nom='Informatique')
+        cls.math = Departement.objects.create(code='MATH', nom='Mathématiques')
+        cls.enseignants = creer_enseignants(8)
+        for i, enseignant in enumerate(cls.enseignants):
+            enseignant.grade = EnseignantProfile.Grade.PROFESSEUR if i % 4 == 0 else EnseignantProfile.Grade.ASSISTANT
+            enseignant.save()
+            enseignant.departements.add(cls.info if i < 6 else cls.math)
+        for i in range(6):
+            creer_dossier(creer_candidat(f'rec{i}', cls.info), cls.session, encadreur=cls.enseignants[i % 3])
+
+    def test_regles(self):
+        dossiers = DossierSoutenance.objects.filter(session=self.session)
+        propositions, non_pourvus, charges, enseignants = recommandation.recommander(self.session, dossiers)
+        self.assertEqual(non_pourvus, {})
+        departement_info = set(self.info.enseignants.values_list('pk', flat=True))
+        for dossier, membres in propositions.items():
+            ids = [e for e, _ in membres]
+            self.assertEqual(len(ids), len(set(ids)))
+            roles = dict((role, e) for e, role in membres)
+            self.assertEqual(roles[MembreJury.Role.ENCADREUR], dossier.encadreur_id)
+            self.assertIn(enseignants[roles[MembreJury.Role.PRESIDENT]].grade, recommandation.GRADES_PRESIDENT)
+            self.assertLessEqual(set(ids), departement_info)
+        total = sum(len(membres) for membres in propositions.values())
+        self.assertEqual(sum(charges.values()), total)
+
+    def test_equilibre(self):
+        dossiers = DossierSoutenance.objects.filter(session=self.session)
+        _, _, charges, _ = recommandation.recommander(self.session, dossiers)
+        # Présidents : un seul professeur du département -> il préside tout
+        info = [e.pk for e in self.enseignants[:6]]
+        assistants = [e for e in info if e != self.enseignants[4].pk and e != self.enseignants[0].pk]
+        self.assertLessEqual(max(charges[e] for e in assistants) - min(charges[e] for e in assistants), 2)
+
+    def test_president_introuvable(self):
+        dossier = creer_dossier(creer_candidat('seul', self.math), self.session)
+        EnseignantProfile.objects.filter(departements=self.math).update(grade=EnseignantProfile.Grade.ASSISTANT)
+        _, non_pourvus, _, _ = recommandation.recommander(
+            self.session, DossierSoutenance.objects.filter(pk=dossier.pk)
+        )
+        self.assertEqual(non_pourvus, {dossier.pk: [MembreJury.Role.PRESIDENT]})
+
+
+# ============================================================================
+# IMPORT PAR LOT
+# ============================================================================
+
+class ImportationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Departement.objects.create(code='INFO', nom='Informatique')
+        creer_candidat('existant')
+
+    def importer(self, lignes, **options):
+        texte = 'email;first_name;last_name;matricule;cycle;departement\n' + '\n'.join(lignes) + '\n'
+        return importation.importer_profils(
+            io.BytesIO(texte.encode()), 'import.csv', CustomUser.Role.CANDIDAT, mots_de_passe=False, **options
+        )
+
+    def test_doublons_et_erreurs(self):
+        rapport = self.importer([
+            'a@test.fr;A;A;M1;INGENIEUR;INFO',
+            'a@test.fr;B;B;M2;INGENIEUR;INFO',              # email répété dans le fichier
+            'existant@test.fr;C;C;M3;INGENIEUR;',           # email déjà en base
+            'd@test.fr;D;D;EXISTANT;INGENIEUR;',            # matricule déjà en base
+            'pas-un-email;E;E;M5;INGENIEUR;',
+            'f@test.fr;F;F;M6;INGENIEUR;INCONNU',
+            'g@test.fr;G;G;M7;MASTER_PRO;',
+        ])
+        self.assertEqual(rapport['lignes'], 7)
+        self.assertEqual(rapport['crees'], 2)
+        erreurs = {e['ligne']: set(e['erreurs']) for e in rapport['erreurs']}
+        self.assertEqual(erreurs, {
+            3: {'email', 'username'}, 4: {'email', 'username'}, 5: {'matricule'},
+            6: {'email'}, 7: {'departement'},
+        })
+        cree = CandidatProfile.objects.select_related('user', 'departement').get(matricule='M1')
+        self.assertEqual(cree.departement.code, 'INFO')
+        self.assertFalse(cree.user.has_usable_password())
+        self.assertTrue(CandidatProfile.objects.filter(matricule='M7').exists())
+
+    def test_apercu(self):
+        rapport = self.importer(['a@test.fr;A;A;M1;INGENIEUR;INFO'], apercu=True)
+        self.assertEqual(rapport['crees'], 1)
+        self.assertFalse(CustomUser.objects.filter(email='a@test.fr').exists())
+
+    def test_fichier_vide(self):
+        with self.assertRaises(importation.FichierInvalide):
+            importation.importer_profils(io.BytesIO(b''), 'vide.csv', CustomUser.Role.CANDIDAT)
+
+
+# ============================================================================
+# ANALYTICS
+# ============================================================================
+
+class EventBufferTest(TestCase):
+
+    def evenement(self):
+        return SiteEvent(event_type=SiteEvent.EventType.PAGE_VIEW, ip_hash='x', created_at=timezone.now())
+
+    def test_echec_remis_en_attente(self):
+        tampon = analytics.EventBuffer(taille=10)
+        tampon.ajouter(self.evenement())
+        tampon.ajouter(self.evenement())
+        with mock.patch.object(SiteEvent.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                tampon.vider()
+        self.assertEqual(SiteEvent.objects.count(), 0)
+        self.assertEqual(len(tampon.vider()), 2)
+        self.assertEqual(SiteEvent.objects.count(), 2)
+        self.assertEqual(
+            SiteEventRollup.objects.get(granularite='DAY', event_type=SiteEvent.EventType.PAGE_VIEW).compteur, 2
+        )
+
+    def test_maximum(self):
+        tampon = analytics.EventBuffer(taille=10, maximum=3)
+        for _ in range(5):
+            tampon._evenements.append(self.evenement())
+        with mock.patch.object(SiteEvent.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                tampon.vider()
+        self.assertEqual(len(tampon._evenements), 3)
+
+    def test_minuteur_et_arret(self):
+        tampon = analytics.EventBuffer(taille=10, intervalle=0.01)
+        appele = threading.Event()
+        with mock.patch.object(tampon, 'vider', side_effect=appele.set) as vider:
+            tampon.demarrer()
+            self.assertTrue(appele.wait(5))
+            tampon.arreter()
+            tampon._minuteur.join(5)
+            self.assertFalse(tampon._minuteur.is_alive())
+            appels = vider.call_count
+            tampon.arreter()
+            self.assertEqual(vider.call_count, appels + 1)
+
+    def test_minuteur_connexions(self):
+        tampon = analytics.EventBuffer(taille=10, intervalle=0.01)
+        appele = threading.Event()
+        with mock.patch.object(analytics, 'close_old_connections') as fermer:
+            with mock.patch.object(tampon, 'vider', side_effect=appele.set):
+                tampon.demarrer()
+                self.assertTrue(appele.wait(5))
+                tampon._arret.set()
+                tampon._minuteur.join(5)
+        self.assertGreaterEqual(fermer.call_count, 2)
+
+
+# ============================================================================
+# DOCUMENTS
+# ============================================================================
+
+class UploadDirectTest(StockageTemporaireMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.candidat = creer_candidat('cand')
+        self.dossier = creer_dossier(self.candidat, creer_session())
+        self.client = APIClient()
+        self.client.force_authenticate(self.candidat.user)
+
+    def envoyer(self, contenu):
+        reponse = self.client.post('/api/documents/upload-direct/', {
+            'dossier': str(self.dossier.pk), 'nom': 'Mémoire', 'type_piece': 'MEMOIRE',
+            'nom_fichier': 'memoire.pdf', 'taille': len(contenu),
+            'empreinte': hashlib.sha256(contenu).hexdigest(),
+        }, format='json')
+        self.assertEqual(reponse.status_code, 200, reponse.content)
+        if not reponse.data['deja_stocke']:
+            chemin = televersement.signing.loads(reponse.data['jeton'], salt=televersement._SEL)['chemin']
+            self.stockage().save(chemin, ContentFile(contenu))
+        return reponse.data['jeton']
+
+    def finaliser(self, jeton):
+        return self.client.post('/api/documents/finaliser-upload/', {'jeton': jeton}, format='json')
+
+    def test_jeton_rejoue(self):
+        jeton = self.envoyer(b'%PDF-1.4 memoire')
+        self.assertEqual(self.finaliser(jeton).status_code, 201)
+        blob = Blob.objects.get()
+
+        self.assertEqual(self.finaliser(jeton).status_code, 409)
+        self.assertEqual(Document.objects.count(), 1)
+        blob.refresh_from_db()
+        self.assertEqual(blob.nb_references, 1)
+        self.assertTrue(self.stockage().exists(blob.fichier.name))
+
+    def test_jeton_sans_envoi_rejoue(self):
+        contenu = b'%PDF-1.4 memoire'
+        self.finaliser(self.envoyer(contenu))
+        jeton = self.envoyer(contenu)
+        self.assertEqual(self.finaliser(jeton).status_code, 201)
+        self.assertEqual(self.finaliser(jeton).status_code, 409)
+        self.assertEqual(Document.objects.count(), 2)
+        self.assertEqual(Blob.objects.get().nb_references, 2)
+
+    def test_doublon_adopte(self):
+        """Un contenu déjà stocké par un autre dossier : l'objet envoyé est supprimé, le blob partagé"""
+        contenu = b'%PDF-1.4 partage'
+        autre = creer_dossier(creer_candidat('autre'), self.dossier.session)
+        Document.objects.create(dossier=autre, nom='x', type_piece='MEMOIRE', fichier=ContentFile(contenu, 'x.pdf'))
+        jeton = self.envoyer(contenu)
+        chemin = televersement.signing.loads(jeton, salt=televersement._SEL)['chemin']
+        self.assertEqual(self.finaliser(jeton).status_code, 201)
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.nb_references, 2)
+        self.assertFalse(self.stockage().exists(chemin))
+        self.assertTrue(self.stockage().exists(blob.fichier.name))
+
+
+class BlobReferencesTest(StockageTemporaireMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dossier = creer_dossier(creer_candidat('cand'), creer_session())
+
+    def deposer(self, contenu, nom='piece.pdf', dossier=None):
+        return Document.objects.create(
+            dossier=dossier or self.dossier, nom=nom, type_piece='AUTRE', fichier=ContentFile(contenu, nom)
+        )
+
+    def test_contenu_partage(self):
+        premier = self.deposer(b'contenu')
+        second = self.deposer(b'contenu', 'copie.pdf')
+        blob = Blob.objects.get()
+        self.assertEqual(blob.nb_references, 2)
+        self.assertEqual(premier.blob_id, second.blob_id)
+        self.assertEqual(second.fichier.name, blob.fichier.name)
+        self.assertEqual(blob.fichier.name, f"blobs/{blob.empreinte[:2]}/{blob.empreinte}.pdf")
+
+    def test_remplacement_identique(self):
+        document = self.deposer(b'contenu')
+        with self.captureOnCommitCallbacks(execute=True):
+            document.fichier = ContentFile(b'contenu', 'nouveau.pdf')
+            document.save()
+        blob = Blob.objects.get()
+        self.assertEqual(blob.nb_references, 1)
+        self.assertTrue(self.stockage().exists(blob.fichier.name))
+
+    def test_remplacement_ramasse_ancien(self):
+        document = self.deposer(b'ancien')
+        ancien = document.blob
+        with self.captureOnCommitCallbacks(execute=True):
+            document.fichier = ContentFile(b'nouveau', 'nouveau.pdf')
+            document.save()
+        self.assertFalse(Blob.objects.filter(pk=ancien.pk).exists())
+        self.assertFalse(self.stockage().exists(ancien.fichier.name))
+        self.assertEqual(Blob.objects.get().nb_references, 1)
+
+    def test_suppression_document(self):
+        premier = self.deposer(b'contenu')
+        second = self.deposer(b'contenu', 'copie.pdf')
+        nom = premier.blob.fichier.name
+        with self.captureOnCommitCallbacks(execute=True):
+            premier.delete()
+        self.assertEqual(Blob.objects.get().nb_references, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(self.stockage().exists(nom))
+
+    def test_suppression_dossier(self):
+        autre = creer_dossier(creer_candidat('autre'), self.dossier.session)
+        self.deposer(b'commun')
+        self.deposer(b'propre')
+        self.deposer(b'commun', dossier=autre)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dossier.delete()
+        blob = Blob.objects.get()
+        self.assertEqual(blob.nb_references, 1)
+        self.assertEqual(os.listdir(os.path.join(self.repertoire, 'blobs', blob.empreinte[:2])), [
+            os.path.basename(blob.fichier.name)
+        ])
+
+    def test_collecter(self):
+        garde = self.deposer(b'garde').blob
+        document = self.deposer(b'orphelin')
+        orphelin = document.blob
+        Document.objects.filter(pk=document.pk).update(blob=None)
+        # Compteur à zéro mais document encore rattaché : le blob est conservé
+        Blob.objects.update(nb_references=0)
+        self.assertEqual(dedup.collecter(), 1)
+        self.assertEqual(list(Blob.objects.values_list('pk', flat=True)), [garde.pk])
+        self.assertFalse(self.stockage().exists(orphelin.fichier.name))
+        self.assertTrue(self.stockage().exists(garde.fichier.name))
+
+    def test_liberer_plancher(self):
+        blob = self.deposer(b'contenu').blob
+        dedup.liberer(blob.pk)
+        dedup.liberer(blob.pk)
+        blob.refresh_from_db()
+        self.assertEqual(blob.nb_references, 0)
+
+    def test_echec_stockage(self):
+        with mock.patch('app_soutenance.signals.stocker', side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.deposer(b'contenu')
+        self.assertFalse(Document.objects.exists())
+
+
+class FluxCoupe(io.BytesIO):
+    """Corps de requête dont la connexion tombe après `limite` octets"""
+
+    def __init__(self, contenu, limite):
+        super().__init__(contenu)
+        self.limite = limite
+
+    def read(self, taille=-1):
+        if self.tell() >= self.limite:
+            raise OSError("connexion perdue")
+        return super().read(min(taille, self.limite - self.tell()))
+
+
+class UploadReprenableTest(StockageTemporaireMixin, TestCase):
+    contenu = bytes(range(256)) * 40
+
+    def setUp(self):
+        super().setUp()
+        reglages = override_settings(UPLOAD_REPRENABLE_DIR=os.path.join(self.repertoire, 'televersements'))
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.candidat = creer_candidat('cand')
+        self.dossier = creer_dossier(self.candidat, creer_session())
+        self.client = APIClient()
+        self.client.force_authenticate(self.candidat.user)
+        reponse = self.client.post('/api/televersements/', {
+            'dossier_id': str(self.dossier.pk), 'nom': 'Mémoire', 'type_piece': 'MEMOIRE',
+            'nom_fichier': 'memoire.bin', 'taille': len(self.contenu),
+        }, format='json')
+        self.assertEqual(reponse.status_code, 201, reponse.content)
+        self.objet = Televersement.objects.get(pk=reponse.data['id'])
+        self.partiel = televersement.chemin_partiel(self.objet)
+
+    def envoyer(self, offset, morceau):
+        return self.client.generic(
+            'PATCH', f'/api/televersements/{self.objet.pk}/', morceau,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_conflit_offset(self):
+        self.assertEqual(self.envoyer(0, self.contenu[:1000]).status_code, 204)
+        reponse = self.envoyer(500, self.contenu[500:1500])
+        self.assertEqual(reponse.status_code, 409)
+        self.objet.refresh_from_db()
+        self.assertEqual(self.objet.offset, 1000)
+
+    def test_morceau_concurrent(self):
+        with open(self.partiel, 'r+b') as partiel:
+            televersement.fcntl.flock(partiel, televersement.fcntl.LOCK_EX)
+            self.assertEqual(self.envoyer(0, self.contenu[:1000]).status_code, 409)
+        self.assertEqual(self.envoyer(0, self.contenu[:1000]).status_code, 204)
+
+    def test_reprise_apres_coupure(self):
+        _, document = televersement.ajouter_morceau(
+            self.candidat.user, self.objet.pk, 0, FluxCoupe(self.contenu, 3000), len(self.contenu)
+        )
+        self.assertIsNone(document)
+        self.objet.refresh_from_db()
+        self.assertEqual(self.objet.offset, 3000)
+        # Octets écrits au-delà de l'offset enregistré (processus interrompu) : écartés
+        with open(self.partiel, 'ab') as partiel:
+            partiel.write(b'parasite')
+
+        reponse = self.envoyer(3000, self.contenu[3000:])
+        self.assertEqual(reponse.status_code, 200, reponse.content)
+        document = Document.objects.get()
+        with document.fichier.open('rb') as fichier:
+            self.assertEqual(fichier.read(), self.contenu)
+
+    def test_finalisation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reponse = self.envoyer(0, self.contenu)
+        self.assertEqual(reponse.status_code, 200, reponse.content)
+        self.assertEqual(reponse['Upload-Offset'], str(len(self.contenu)))
+        document = Document.objects.get()
+        self.assertEqual(document.blob.empreinte, hashlib.sha256(self.contenu).hexdigest())
+        self.assertFalse(Televersement.objects.exists())
+        self.assertFalse(self.partiel.exists())
+        # Morceau vide rejoué à l'offset final : plus rien à finaliser
+        self.assertEqual(self.envoyer(len(self.contenu), b'').status_code, 404)
+        self.assertEqual(Document.objects.count(), 1)
+
+    def test_suppression_en_cascade(self):
+        self.envoyer(0, self.contenu[:1000])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dossier.delete()
+        self.assertFalse(self.partiel.exists())
+
+
+# ============================================================================
+# ARCHIVES ZIP
+# ============================================================================
+
+class ArchiveTest(StockageTemporaireMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.candidat = creer_candidat('cand')
+        self.dossier = creer_dossier(self.candidat, creer_session())
+        self.contenus = {
+            'Mémoire - Version finale.pdf': b'%PDF-1.4 ' + bytes(range(256)) * 300,
+            'Reçu de paiement - Reçu.jpg': b'\xff\xd8' + b'recu' * 1000,
+            'Reçu de paiement - Reçu (2).jpg': b'\xff\xd8' + b'autre' * 10,
+        }
+        for nom, type_piece, fichier, contenu in [
+            ('Version finale', 'MEMOIRE', 'memoire.pdf', self.contenus['Mémoire - Version finale.pdf']),
+            ('Reçu', 'RECU_PAIEMENT', 'recu.jpg', self.contenus['Reçu de paiement - Reçu.jpg']),
+            ('Reçu', 'RECU_PAIEMENT', 'recu.jpg', self.contenus['Reçu de paiement - Reçu (2).jpg']),
+        ]:
+            Document.objects.create(
+                dossier=self.dossier, nom=nom, type_piece=type_piece, fichier=ContentFile(contenu, fichier)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.candidat.user)
+        self.url = f'/api/dossiers/{self.dossier.pk}/archive/'
+
+    def telecharger(self, **entetes):
+        reponse = self.client.get(self.url, HTTP_ACCEPT='application/zip', **entetes)
+        contenu = b''.join(reponse.streaming_content) if reponse.streaming else reponse.content
+        return reponse, contenu
+
+    def verifier_archive(self, contenu):
+        with zipfile.ZipFile(io.BytesIO(contenu)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual({nom: archive.read(nom) for nom in archive.namelist()}, self.contenus)
+
+    def test_aller_retour(self):
+        reponse, contenu = self.telecharger()
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(int(reponse['Content-Length']), len(contenu))
+        self.assertEqual(reponse['Accept-Ranges'], 'bytes')
+        self.verifier_archive(contenu)
+
+    def test_reprise_par_range(self):
+        reponse, complet = self.telecharger()
+        etag = reponse['ETag']
+        reponse, suite = self.telecharger(HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE=etag)
+        self.assertEqual(reponse.status_code, 206)
+        self.assertEqual(reponse['Content-Range'], f'bytes 1000-{len(complet) - 1}/{len(complet)}')
+        self.assertEqual(int(reponse['Content-Length']), len(suite))
+        self.verifier_archive(complet[:1000] + suite)
+
+        reponse, milieu = self.telecharger(HTTP_RANGE='bytes=500-70000')
+        self.assertEqual(reponse.status_code, 206)
+        self.assertEqual(milieu, complet[500:70001])
+        reponse, fin = self.telecharger(HTTP_RANGE='bytes=-22')
+        self.assertEqual(fin, complet[-22:])
+
+    def test_if_range_perime(self):
+        _, complet = self.telecharger()
+        reponse, contenu = self.telecharger(HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE='"perime"')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(contenu, complet)
+
+    def test_plage_insatisfiable(self):
+        _, complet = self.telecharger()
+        reponse, _ = self.telecharger(HTTP_RANGE=f'bytes={len(complet)}-')
+        self.assertEqual(reponse.status_code, 416)
+        self.assertEqual(reponse['Content-Range'], f'bytes */{len(complet)}')
+
+    def test_zip64(self):
+        """Champs ZIP64 (seuil abaissé) relus par zipfile"""
+        with mock.patch.object(archive, 'SEUIL_ZIP64', 100):
+            reponse, contenu = self.telecharger()
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIn(struct.pack('<I', 0x06064B50), contenu)
+        self.verifier_archive(contenu)
+
+    def test_crc_manquant(self):
+        """CRC-32 inconnu (blob antérieur) : relu une fois puis enregistré sur le blob"""
+        cache.clear()
+        Blob.objects.update(crc32=None)
+        self.verifier_archive(self.telecharger()[1])
+        self.assertFalse(Blob.objects.filter(crc32__isnull=True).exists())
+
+    def test_visibilite(self):
+        self.client.force_authenticate(creer_candidat('autre').user)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+# ============================================================================
+# FICHIERS DÉRIVÉS
+# ============================================================================
+
+@override_settings(DERIVES_ASYNCHRONE=False)
+class DerivesTest(StockageTemporaireMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Calculs dans un thread du test plutôt que dans des processus spawn
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        self.calculs = mock.patch.object(pool, 'submit', wraps=pool.submit).start()
+        mock.patch.object(derives, 'get_pool_processus', return_value=pool).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def image(self):
+        from PIL import Image
+
+        sortie = io.BytesIO()
+        Image.new('RGB', (400, 300), 'navy').save(sortie, 'PNG')
+        return sortie.getvalue()
+
+    def pdf(self):
+        document = derives.pypdfium2.PdfDocument.new()
+        document.new_page(200, 300)
+        sortie = io.BytesIO()
+        document.save(sortie)
+        document.close()
+        return sortie.getvalue()
+
+    def deposer_photo(self, prefixe, contenu):
+        candidat = creer_candidat(prefixe)
+        with self.captureOnCommitCallbacks(execute=True):
+            candidat.photo = ContentFile(contenu, 'photo.png')
+            candidat.save()
+        candidat.refresh_from_db()
+        return candidat
+
+    def test_miniatures_photo(self):
+        contenu = self.image()
+        candidat = self.deposer_photo('cand', contenu)
+        empreinte = hashlib.sha256(contenu).hexdigest()
+        self.assertEqual(candidat.photo_empreinte, empreinte)
+        self.assertEqual(
+            dict(Derive.objects.filter(empreinte_source=empreinte).values_list('variante', 'largeur')),
+            {'PHOTO_MINIATURE': 64, 'PHOTO_MOYENNE': 256},
+        )
+        url = derives.url_derive(empreinte, 'PHOTO_MINIATURE')
+        self.assertTrue(url.endswith(f'{empreinte}_photo_miniature.jpg'))
+        self.assertEqual(self.calculs.call_count, 2)
+
+    def test_photo_deja_traitee(self):
+        """Même contenu pour un autre candidat : rien n'est recalculé"""
+        contenu = self.image()
+        self.deposer_photo('cand', contenu)
+        autre = self.deposer_photo('autre', contenu)
+        self.assertEqual(self.calculs.call_count, 2)
+        self.assertEqual(Derive.objects.count(), 2)
+        self.assertIsNotNone(derives.url_derive(autre.photo_empreinte, 'PHOTO_MOYENNE'))
+
+    @skipUnless(derives.pypdfium2, "pypdfium2 non installé (dépendance optionnelle)")
+    def test_apercu_pdf(self):
+        contenu = self.pdf()
+        session = creer_session()
+        for prefixe in ('cand', 'autre'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Document.objects.create(
+                    dossier=creer_dossier(creer_candidat(prefixe), session), nom='Mémoire',
+                    type_piece='MEMOIRE', fichier=ContentFile(contenu, 'memoire.pdf'),
+                )
+        apercu = Derive.objects.get()
+        self.assertEqual(apercu.empreinte_source, hashlib.sha256(contenu).hexdigest())
+        self.assertEqual((apercu.largeur, apercu.hauteur), (600, 900))
+        self.assertEqual(self.calculs.call_count, 1)
+
+    def test_apercu_absent(self):
+        self.assertIsNone(derives.url_derive('0' * 64, 'APERCU_PDF'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(derives.url_derive('0' * 64, 'APERCU_PDF'))
+
+
+# ============================================================================
+# PIÈCES PDF
+# ============================================================================
+
+class PiecesPdfTest(StockageTemporaireMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        session = creer_session()
+        president, rapporteur = creer_enseignants(2)
+        jury = creer_jury(session, [
+            (president, MembreJury.Role.PRESIDENT), (rapporteur, MembreJury.Role.RAPPORTEUR)
+        ])
+        self.salle = Salle.objects.create(nom='A', batiment='B1', capacite=10)
+        self.soutenances = [
+            Soutenance.objects.create(
+                dossier=creer_dossier(creer_candidat(f'cand{i}'), session), jury=jury, salle=self.salle,
+                date_heure=timezone.make_aware(datetime(2030, 1, 7, 9 + i)),
+            )
+            for i in range(3)
+        ]
+        # Conversion WeasyPrint remplacée : un PDF factice par HTML
+        self.convertir = mock.patch.object(pieces_pdf, 'convertir', side_effect=lambda documents: [
+            b'%PDF-' + hashlib.sha256(html.encode()).hexdigest().encode() for html in documents
+        ]).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def generer(self, **options):
+        with self.captureOnCommitCallbacks(execute=True):
+            return pieces_pdf.generer_pieces(
+                Soutenance.objects.filter(pk__in=[s.pk for s in self.soutenances]), 'CONVOCATION', **options
+            )
+
+    def test_cache_par_empreinte(self):
+        pieces, rendues = self.generer()
+        self.assertEqual(rendues, 3)
+        fichiers = {pk: piece.fichier.name for pk, piece in pieces.items()}
+        self.assertTrue(all(self.stockage().exists(nom) for nom in fichiers.values()))
+
+        pieces, rendues = self.generer()
+        self.assertEqual(rendues, 0)
+        self.assertEqual({pk: piece.fichier.name for pk, piece in pieces.items()}, fichiers)
+        self.assertEqual(self.convertir.call_count, 1)
+
+    def test_soutenance_modifiee(self):
+        pieces, _ = self.generer()
+        modifiee = self.soutenances[1]
+        ancien = pieces[modifiee.pk]
+        modifiee.salle = Salle.objects.create(nom='B', batiment='B1', capacite=10)
+        modifiee.save()
+
+        pieces, rendues = self.generer()
+        self.assertEqual(rendues, 1)
+        self.assertEqual(len(self.convertir.call_args.args[0]), 1)
+        self.assertNotEqual(pieces[modifiee.pk].empreinte, ancien.empreinte)
+        # Ancien PDF supprimé du stockage après commit
+        self.assertNotEqual(pieces[modifiee.pk].fichier.name, ancien.fichier.name)
+        self.assertFalse(self.stockage().exists(ancien.fichier.name))
+        self.assertEqual(PieceGeneree.objects.count(), 3)
+
+    def test_forcer(self):
+        self.generer()
+        _, rendues = self.generer(forcer=True)
+        self.assertEqual(rendues, 3)
+
+
+# ============================================================================
+# CRÉNEAUX LIBRES
+# ============================================================================
+
+class TrousTest(SimpleTestCase):
+
+    def test_fusionner(self):
+        self.assertEqual(creneaux.fusionner([(5, 7), (1, 3), (2, 4), (7, 8)]), [[1, 4], [5, 8]])
+        self.assertEqual(creneaux.fusionner([]), [])
+
+    def test_trous(self):
+        occupes = creneaux.fusionner([(10, 12), (0, 2), (15, 30)])
+        self.assertEqual(creneaux.trous(occupes, 0, 20, 2), [(2, 10), (12, 15)])
+        self.assertEqual(creneaux.trous(occupes, 0, 20, 4), [(2, 10)])
+        # Occupations hors de la plage ignorées, fin de plage libre
+        self.assertEqual(creneaux.trous(occupes, 3, 9, 1), [(3, 9)])
+        self.assertEqual(creneaux.trous([], 0, 5, 5), [(0, 5)])
+        self.assertEqual(creneaux.trous([[0, 5]], 0, 5, 1), [])
+
+
+class CreneauxLibresTest(TestCase):
+    jour = date(2030, 1, 7)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = creer_session()
+        cls.enseignants = creer_enseignants(3)
+        cls.salle_a = Salle.objects.create(nom='A', batiment='B1', capacite=10)
+        cls.salle_b = Salle.objects.create(nom='B', batiment='B1', capacite=10)
+        Salle.objects.create(nom='C', batiment='B1', capacite=10, est_disponible=False)
+        occupe = cls.enseignants[0]
+        cls.soutenance_a = cls.soutenir('a', occupe, cls.salle_a, 9)
+        cls.soutenir('b', occupe, cls.salle_b, 10)
+        cls.jury = creer_jury(cls.session, [
+            (occupe, MembreJury.Role.PRESIDENT), (cls.enseignants[1], MembreJury.Role.RAPPORTEUR)
+        ])
+
+    @classmethod
+    def soutenir(cls, prefixe, enseignant, salle, heure):
+        return Soutenance.objects.create(
+            dossier=creer_dossier(creer_candidat(prefixe), cls.session),
+            jury=creer_jury(cls.session, [(enseignant, MembreJury.Role.PRESIDENT)], nom=f'Jury {prefixe}'),
+            salle=salle, date_heure=cls.a(heure), duree_minutes=60,
+        )
+
+    @classmethod
+    def a(cls, heure, minute=0):
+        return timezone.make_aware(datetime.combine(cls.jour, time(heure, minute)))
+
+    def setUp(self):
+        cache.clear()
+
+    def libres(self, duree=60, **options):
+        resultat = creneaux.creneaux_libres(self.jour, duree, heure_debut=time(8), heure_fin=time(12), **options)
+        return {salle.nom: libres for salle, libres in resultat}
+
+    def test_salles(self):
+        self.assertEqual(self.libres(), {
+            'A': [(self.a(8), self.a(9)), (self.a(10), self.a(12))],
+            'B': [(self.a(8), self.a(10)), (self.a(11), self.a(12))],
+        })
+
+    def test_duree(self):
+        self.assertEqual(self.libres(duree=90), {
+            'A': [(self.a(10), self.a(12))],
+            'B': [(self.a(8), self.a(10))],
+        })
+
+    def test_jury_occupe(self):
+        """Un membre du jury pris de 9 h à 11 h : même créneaux dans toutes les salles"""
+        attendus = [(self.a(8), self.a(9)), (self.a(11), self.a(12))]
+        self.assertEqual(self.libres(jury_id=self.jury.pk), {'A': attendus, 'B': attendus})
+
+    def test_modification_invalide_le_cache(self):
+        self.libres()
+        with self.assertNumQueries(2):
+            # Version du jour et salles : occupations servies par le cache
+            self.libres()
+        Soutenance.objects.filter(pk=self.soutenance_a.pk).update(
+            date_heure=self.a(10, 30), updated_at=timezone.now()
+        )
+        self.assertEqual(self.libres()['A'], [(self.a(8), self.a(10, 30))])
+
+    def test_membre_ajoute_invalide_le_cache(self):
+        self.libres()
+        MembreJury.objects.create(
+            jury=self.soutenance_a.jury, enseignant=self.enseignants[2], role=MembreJury.Role.EXAMINATEUR
+        )
+        jury = creer_jury(self.session, [(self.enseignants[2], MembreJury.Role.PRESIDENT)], nom='Autre')
+        self.assertEqual(self.libres(jury_id=jury.pk)['B'], [(self.a(8), self.a(9)), (self.a(11), self.a(12))])
@@ -15,11 +15,15 @@ from .views import (
     SalleViewSet,
     DossierSoutenanceViewSet,
     DocumentViewSet,
+    TeleversementViewSet,
     JuryViewSet,
     MembreJuryViewSet,
     SoutenanceViewSet,
     track_event,
     get_stats,
+    get_timeseries,
+    calendrier_ics,
+    abonnements_ics,
 )
 
 # Router pour les ViewSets
@@ -34,6 +38,7 @@ router.register(r'sessions', SessionSoutenanceViewSet, basename='session')
 router.register(r'salles', SalleViewSet, basename='salle')
 router.register(r'dossiers', DossierSoutenanceViewSet, basename='dossier')
 router.register(r'documents', DocumentViewSet, basename='document')
+router.register(r'televersements', TeleversementViewSet, basename='televersement')
 router.register(r'jurys', JuryViewSet, basename='jury')
 router.register(r'membres-jury', MembreJuryViewSet, basename='membre-jury')
 router.register(r'soutenances', SoutenanceViewSet, basename='soutenance')
@@ -47,6 +52,11 @@ urlpatterns = [
     # Analytics (public)
     path('analytics/track/', track_event, name='track_event'),
     path('analytics/stats/', get_stats, name='get_stats'),
+    path('analytics/timeseries/', get_timeseries, name='get_timeseries'),
+
+    # Calendriers iCalendar (abonnement)
+    path('calendriers/abonnements/', abonnements_ics, name='abonnements_ics'),
+    path('calendriers/<str:type_flux>/<uuid:objet_id>.ics', calendrier_ics, name='calendrier_ics'),
 
     # Routes du router
     path('', include(router.urls)),
@@ -1,14 +1,28 @@
 from rest_framework import viewsets, status, filters
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes as perm_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.renderers import JSONRenderer
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, Exists, F, OuterRef, Prefetch, Sum, Value, When
+from django.db.models.functions import Concat, Trim
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.http import require_GET
+from datetime import datetime, time, timedelta
+import hashlib
+import json
 
 from .models import (
     CustomUser, Departement, CandidatProfile, EnseignantProfile,
     SessionSoutenance, Salle, DossierSoutenance, Document,
-    Jury, MembreJury, Soutenance, SiteEvent
+    Jury, MembreJury, Soutenance, SiteEventRollup, AccesObjet,
+    Televersement, PieceGeneree
 )
 from .serializers import (
     CustomUserSerializer, UserRegistrationSerializer,
@@ -16,7 +30,11 @@ from .serializers import (
     SessionSoutenanceSerializer, SalleSerializer,
     DossierSoutenanceSerializer, DossierSoutenanceListSerializer,
     DocumentSerializer, JurySerializer, JuryListSerializer,
-    MembreJurySerializer, SoutenanceSerializer, SoutenanceListSerializer
+    MembreJurySerializer, SoutenanceSerializer, SoutenanceListSerializer,
+    SoutenanceCalendrierSerializer, UploadDirectSerializer, FinaliserUploadSerializer,
+    TeleversementSerializer, PieceGenereeSerializer, PlanificationSerializer,
+    CreneauxLibresSerializer, RecommandationJurySerializer, ImportProfilsSerializer,
+    PlanificationSoutenanceSerializer, PREFETCH_COMPOSITION
 )
 from .permissions import (
     IsAdmin, IsCandidat, IsEnseignant, IsAdminOrReadOnly,
@@ -24,6 +42,38 @@ from .permissions import (
     CanValidateDossier, CanManageJury, CanPlanSoutenance,
     CandidatProfilePermission, DossierSoutenancePermission
 )
+from .filters import acces_enseignant
+from . import televersement, pieces_pdf, planification, recommandation, importation, ical
+from .analytics import enregistrer_evenement
+from .creneaux import creneaux_libres
+from .conflits import conflits_session, conflits_soutenance as detecter_conflits
+from .archive import ZipRenderer, dossiers_visibles, entrees_documents, reponse_archive
+
+
+def nom_complet(prefixe):
+    """Expression SQL équivalente à user.get_full_name() (prefixe: 'candidat__user__', ...)"""
+    return Trim(Concat(f'{prefixe}first_name', Value(' '), f'{prefixe}last_name'))
+
+
+def parse_borne_calendrier(valeur, fin=False):
+    """
+    Convertir une borne ?from= / ?to= (date ou date-heure ISO) en datetime aware.
+    Une date seule en borne de fin inclut toute la journée.
+    """
+    if not valeur:
+        return None
+    try:
+        jour = parse_date(valeur)
+        moment = None if jour else parse_datetime(valeur)
+    except ValueError:
+        jour = moment = None
+    if jour:
+        moment = datetime.combine(jour + timedelta(days=1) if fin else jour, time.min)
+    elif moment is None:
+        raise ValueError(f"Date invalide : {valeur}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
 
 
 # ============================================================================
@@ -80,11 +130,37 @@ class DepartementViewSet(viewsets.ModelViewSet):
     search_fields = ['code', 'nom']
     ordering_fields = ['code', 'nom']
 
+    def get_queryset(self):
+        """Annoter les effectifs pour éviter un COUNT par ligne"""
+        return Departement.objects.annotate(
+            nb_candidats=Count('candidats', distinct=True),
+            nb_enseignants=Count('enseignants', distinct=True),
+        ).order_by('nom')
+
 
 # ============================================================================
 # VIEWSETS PROFILS
 # ============================================================================
 
+def reponse_import(request, role):
+    """
+    Import par lot (CSV/XLSX) : rapport des lignes créées et des erreurs par ligne.
+    Aucun hachage dans la requête : les comptes reçoivent un mot de passe
+    inutilisable (la commande importer_profils reprend ceux du fichier).
+    """
+    parametres = ImportProfilsSerializer(data=request.data)
+    parametres.is_valid(raise_exception=True)
+    fichier = parametres.validated_data['fichier']
+    try:
+        rapport = importation.importer_profils(
+            fichier, fichier.name, role, apercu=parametres.validated_data['apercu'], mots_de_passe=False
+        )
+    except importation.FichierInvalide as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    rapport['apercu'] = parametres.validated_data['apercu']
+    return Response(rapport)
+
+
 class CandidatProfileViewSet(viewsets.ModelViewSet):
     """ViewSet pour gérer les profils candidats"""
     queryset = CandidatProfile.objects.all()
@@ -111,22 +187,21 @@ class CandidatProfileViewSet(viewsets.ModelViewSet):
         elif user.role == 'CANDIDAT':
             return base_qs.filter(user=user)
         elif user.role == 'ENSEIGNANT':
-            from django.db.models import Q
-
-            enseignant_profile = user.enseignant_profile
-
-            candidats_departement = Q(departement__in=enseignant_profile.departements.all())
-            candidats_encadres = Q(dossiers__encadreur=enseignant_profile)
-            candidats_jury = Q(
-                dossiers__soutenance__jury__composition__enseignant=enseignant_profile
-            )
-
-            return base_qs.filter(
-                candidats_departement | candidats_encadres | candidats_jury
-            ).distinct()
+            # Départements, candidats encadrés et jurys : index de visibilité
+            return base_qs.filter(acces_enseignant(user, AccesObjet.TypeObjet.CANDIDAT))
 
         return CandidatProfile.objects.none()
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    def importer(self, request):
+        """
+        Créer des candidats depuis un fichier CSV/XLSX (multipart, champ
+        `fichier`). Colonnes : email, first_name, last_name, matricule, cycle,
+        et optionnellement password, username, phone, departement (code).
+        Les lignes invalides sont ignorées et listées dans le rapport.
+        """
+        return reponse_import(request, CustomUser.Role.CANDIDAT)
+
 
 class EnseignantProfileViewSet(viewsets.ModelViewSet):
     """ViewSet pour gérer les profils enseignants"""
@@ -141,7 +216,22 @@ class EnseignantProfileViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return EnseignantProfile.objects.none()
-        return EnseignantProfile.objects.select_related('user').prefetch_related('departements')
+        return EnseignantProfile.objects.select_related('user').prefetch_related(
+            Prefetch('departements', queryset=Departement.objects.annotate(
+                nb_candidats=Count('candidats', distinct=True),
+                nb_enseignants=Count('enseignants', distinct=True),
+            ))
+        )
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    def importer(self, request):
+        """
+        Créer des enseignants depuis un fichier CSV/XLSX (multipart, champ
+        `fichier`). Colonnes : email, first_name, last_name, grade, et
+        optionnellement password, username, phone, departements (codes
+        séparés par « ; »). Les lignes invalides sont listées dans le rapport.
+        """
+        return reponse_import(request, CustomUser.Role.ENSEIGNANT)
 
 
 # ============================================================================
@@ -158,19 +248,23 @@ class SessionSoutenanceViewSet(viewsets.ModelViewSet):
     ordering_fields = ['date_ouverture', 'created_at']
     filterset_fields = ['statut', 'niveau_concerne', 'annee_academique']
 
+    def get_queryset(self):
+        """Annoter les compteurs de dossiers et de soutenances"""
+        return SessionSoutenance.objects.select_related('created_by').annotate(
+            nb_dossiers=Count('dossiers', distinct=True),
+            nb_soutenances=Count('dossiers__soutenance', distinct=True),
+        ).order_by('-date_ouverture')
+
     def list(self, request, *args, **kwargs):
         """Liste des sessions avec mise à jour auto du statut"""
-        # Mettre à jour les statuts avant de retourner la liste
-        for session in self.get_queryset():
-            session.update_status_auto()
+        # Mise à jour ensembliste des statuts, au plus une fois par tranche de temps
+        SessionSoutenance.refresh_statuts()
         return super().list(request, *args, **kwargs)
 
     def retrieve(self, request, *args, **kwargs):
         """Récupérer une session avec mise à jour auto du statut"""
-        instance = self.get_object()
-        instance.update_status_auto()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        SessionSoutenance.refresh_statuts()
+        return super().retrieve(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """Enregistrer l'utilisateur qui a créé la session"""
@@ -180,11 +274,10 @@ class SessionSoutenanceViewSet(viewsets.ModelViewSet):
     def active(self, request):
         """Récupérer la session active actuelle"""
         # Mettre à jour les statuts d'abord
-        for session in SessionSoutenance.objects.all():
-            session.update_status_auto()
+        SessionSoutenance.refresh_statuts()
 
         now = timezone.now()
-        session = SessionSoutenance.objects.filter(
+        session = self.get_queryset().filter(
             statut='EN_COURS',
             date_ouverture__lte=now,
             date_cloture__gte=now
@@ -195,6 +288,80 @@ class SessionSoutenanceViewSet(viewsets.ModelViewSet):
             return Response(serializer.data)
         return Response({'detail': 'Aucune session active'}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, ZipRenderer])
+    def archive(self, request, pk=None):
+        """
+        Archive ZIP des documents de la session visibles par l'utilisateur,
+        un dossier par candidat (en flux, reprise par Range)
+        """
+        session = get_object_or_404(SessionSoutenance, pk=pk)
+        documents = Document.objects.filter(
+            dossier__in=dossiers_visibles(request.user).filter(session=session)
+        ).select_related('blob', 'dossier__candidat__user').order_by(
+            'dossier__candidat__user__last_name', 'dossier__candidat__user__first_name', 'type_piece', 'nom'
+        )
+        return reponse_archive(
+            request, entrees_documents(documents, par_candidat=True), f'session-{session.pk}.zip'
+        )
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    def planifier(self, request, pk=None):
+        """
+        Planifier automatiquement les soutenances validées de la session :
+        salle, date et ordre de passage, sans conflit de salle ni d'enseignant.
+        Le planning est enregistré en une transaction (sauf apercu=true).
+        """
+        session = self.get_object()
+        parametres = PlanificationSerializer(data=request.data)
+        parametres.is_valid(raise_exception=True)
+        parametres = dict(parametres.validated_data)
+        apercu = parametres.pop('apercu')
+
+        placees, non_placees = planification.planifier_session(session, **parametres)
+        if not apercu:
+            try:
+                planification.appliquer(placees)
+            except IntegrityError:
+                # Contrainte d'exclusion PostgreSQL : une salle a été réservée pendant le calcul
+                return Response(
+                    {'error': "Salle occupée entre-temps sur un des créneaux, relancer la planification"},
+                    status=status.HTTP_409_CONFLICT
+                )
+        return Response({
+            'applique': not apercu,
+            'planifiees': SoutenanceListSerializer(placees, many=True).data,
+            'non_planifiees': [
+                {'id': soutenance.pk, 'candidat_nom': soutenance.dossier.candidat.user.get_full_name(), 'raison': raison}
+                for soutenance, raison in non_placees
+            ],
+        })
+
+    @action(detail=True, methods=['post'], url_path='generer-pieces', permission_classes=[IsAuthenticated, IsAdmin])
+    def generer_pieces(self, request, pk=None):
+        """
+        Générer les convocations et procès-verbaux PDF de la session.
+        Seules les soutenances dont les données ont changé sont re-rendues
+        (tout est re-rendu avec forcer=true).
+        """
+        session = self.get_object()
+        types = request.data.get('type_piece') or list(PieceGeneree.TypePiece.values)
+        if isinstance(types, str):
+            types = [types]
+        inconnus = set(types) - set(PieceGeneree.TypePiece.values)
+        if inconnus:
+            return Response(
+                {'type_piece': f"Type(s) de pièce inconnu(s) : {', '.join(sorted(inconnus))}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        forcer = str(request.data.get('forcer', '')).lower() in ('1', 'true')
+
+        soutenances = Soutenance.objects.filter(dossier__session=session)
+        resultat = {}
+        for type_piece in types:
+            pieces, nb_rendues = pieces_pdf.generer_pieces(soutenances, type_piece, forcer=forcer)
+            resultat[type_piece] = {'rendues': nb_rendues, 'inchangees': len(pieces) - nb_rendues}
+        return Response(resultat)
+
 
 class SalleViewSet(viewsets.ModelViewSet):
     """ViewSet pour gérer les salles"""
@@ -213,6 +380,31 @@ class SalleViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(salles, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='creneaux-libres', permission_classes=[IsAuthenticated, IsAdmin])
+    def creneaux_libres(self, request):
+        """
+        Créneaux libres du jour dans les salles disponibles (?date=&duree=),
+        où tous les enseignants du jury sont libres (?jury=)
+        """
+        parametres = CreneauxLibresSerializer(data=request.query_params)
+        parametres.is_valid(raise_exception=True)
+        parametres = parametres.validated_data
+
+        resultat = creneaux_libres(
+            parametres['date'], parametres['duree'], parametres.get('jury'),
+            parametres['heure_debut'], parametres['heure_fin']
+        )
+        return Response([
+            {
+                'salle': self.get_serializer(salle).data,
+                'creneaux': [
+                    {'debut': timezone.localtime(debut), 'fin': timezone.localtime(fin)}
+                    for debut, fin in libres
+                ],
+            }
+            for salle, libres in resultat
+        ])
+
 
 # ============================================================================
 # VIEWSETS DOSSIERS
@@ -228,23 +420,60 @@ class DossierSoutenanceViewSet(viewsets.ModelViewSet):
     ordering_fields = ['date_depot', 'created_at']
     filterset_fields = ['statut', 'session', 'candidat', 'encadreur', 'candidat__cycle', 'demande_suppression']
 
+    def is_vue_compacte(self):
+        """Liste compacte demandée via ?view=compact"""
+        return self.action == 'list' and self.request.query_params.get('view') == 'compact'
+
     def get_queryset(self):
         """Filtrer selon le rôle"""
         if getattr(self, 'swagger_fake_view', False):
             return DossierSoutenance.objects.none()
 
-        base_qs = DossierSoutenance.objects.select_related(
-            'candidat__user', 'session', 'encadreur__user'
-        ).prefetch_related('documents')
+        if self.is_vue_compacte():
+            base_qs = DossierSoutenance.objects.all()
+        else:
+            base_qs = DossierSoutenance.objects.select_related(
+                'candidat__user', 'candidat__departement', 'session', 'encadreur__user'
+            ).prefetch_related(Prefetch('documents', queryset=Document.objects.select_related('blob')))
 
         user = self.request.user
         if user.role == 'ADMIN':
-            return base_qs
+            qs = base_qs
         elif user.role == 'CANDIDAT':
-            return base_qs.filter(candidat__user=user)
+            qs = base_qs.filter(candidat__user=user)
         elif user.role == 'ENSEIGNANT':
-            return base_qs.filter(encadreur__user=user)
-        return DossierSoutenance.objects.none()
+            # Dossiers encadrés : index de visibilité
+            qs = base_qs.filter(acces_enseignant(user, AccesObjet.TypeObjet.DOSSIER))
+        else:
+            return DossierSoutenance.objects.none()
+
+        if self.is_vue_compacte():
+            return self.get_queryset_compact(qs)
+        return qs
+
+    def get_queryset_compact(self, qs):
+        """
+        Lignes plates (values) pour la liste compacte : noms et nombre de
+        documents calculés en SQL, sans instancier de modèles.
+        """
+        return qs.annotate(
+            candidat_nom=nom_complet('candidat__user__'),
+            session_titre=F('session__titre'),
+            encadreur_nom=Case(
+                When(encadreur__isnull=True, then=Value(None)),
+                default=nom_complet('encadreur__user__'),
+                output_field=CharField(),
+            ),
+            nb_documents=Count('documents'),
+        ).values(
+            *DossierSoutenanceListSerializer.Meta.fields
+        ).order_by('-created_at')
+
+    def get_serializer_class(self):
+        """Utiliser le serializer compact pour ?view=compact"""
+        if self.is_vue_compacte():
+            return DossierSoutenanceListSerializer
+        return DossierSoutenanceSerializer
 
     def perform_create(self, serializer):
         """Associer automatiquement le candidat connecté ou permettre à l'admin de spécifier le candidat"""
@@ -282,12 +511,19 @@ class DossierSoutenanceViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(dossier)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, ZipRenderer])
+    def archive(self, request, pk=None):
+        """Archive ZIP de tous les documents du dossier (en flux, reprise par Range)"""
+        dossier = get_object_or_404(dossiers_visibles(request.user), pk=pk)
+        documents = dossier.documents.select_related('blob').order_by('type_piece', 'nom')
+        return reponse_archive(request, entrees_documents(documents), f'dossier-{dossier.pk}.zip')
+
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsCandidat])
     def mes_dossiers(self, request):
         """Récupérer les dossiers du candidat connecté"""
         dossiers = DossierSoutenance.objects.select_related(
             'candidat__user', 'session', 'encadreur__user'
-        ).prefetch_related('documents').filter(candidat__user=request.user)
+        ).prefetch_related(Prefetch('documents', queryset=Document.objects.select_related('blob'))).filter(candidat__user=request.user)
         serializer = DossierSoutenanceSerializer(dossiers, many=True)
         return Response(serializer.data)
 
@@ -360,7 +596,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
         if getattr(self, 'swagger_fake_view', False):
             return Document.objects.none()
 
-        base_qs = Document.objects.select_related('dossier__candidat__user', 'dossier__encadreur__user')
+        base_qs = Document.objects.select_related('dossier__candidat__user', 'dossier__encadreur__user', 'blob')
 
         user = self.request.user
         if user.role == 'ADMIN':
@@ -368,9 +604,92 @@ class DocumentViewSet(viewsets.ModelViewSet):
         elif user.role == 'CANDIDAT':
             return base_qs.filter(dossier__candidat__user=user)
         elif user.role == 'ENSEIGNANT':
-            return base_qs.filter(dossier__encadreur__user=user)
+            # Documents des dossiers encadrés : index de visibilité
+            return base_qs.filter(acces_enseignant(user, AccesObjet.TypeObjet.DOSSIER, 'dossier_id'))
         return Document.objects.none()
 
+    @action(detail=False, methods=['post'], url_path='upload-direct')
+    def upload_direct(self, request):
+        """
+        Étape 1 de l'upload direct : URL signée où envoyer le fichier (PUT)
+        et jeton à présenter à finaliser-upload. Si l'utilisateur a déjà ce
+        contenu dans un de ses documents (`deja_stocke`), aucun envoi n'est
+        nécessaire ; sinon le fichier est envoyé puis dédupliqué à la finalisation.
+        """
+        serializer = UploadDirectSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(televersement.emettre_cible(request.user, serializer.validated_data))
+
+    @action(detail=False, methods=['post'], url_path='finaliser-upload')
+    def finaliser_upload(self, request):
+        """Étape 2 : vérifier taille et empreinte du fichier reçu, créer le Document"""
+        serializer = FinaliserUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        document = televersement.finaliser(request.user, serializer.validated_data['jeton'])
+        return Response(DocumentSerializer(document).data, status=status.HTTP_201_CREATED)
+
+
+class TeleversementViewSet(viewsets.GenericViewSet):
+    """
+    Upload reprenable (protocole tus simplifié) :
+    - POST   /televersements/        déclarer le document → Location, Upload-Offset: 0
+    - HEAD   /televersements/{id}/   offset courant (reprise après coupure)
+    - PATCH  /televersements/{id}/   morceau brut (application/offset+octet-stream)
+                                     à l'offset donné par l'en-tête Upload-Offset
+    - DELETE /televersements/{id}/   abandon
+    Le dernier morceau crée le Document, retourné dans la réponse.
+    """
+    serializer_class = TeleversementSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Televersement.objects.none()
+        return Televersement.objects.filter(user=self.request.user, expire_at__gte=timezone.now())
+
+    def entetes(self, objet):
+        return {
+            'Tus-Resumable': '1.0.0',
+            'Upload-Offset': str(objet.offset),
+            'Upload-Length': str(objet.taille),
+            'Cache-Control': 'no-store',
+        }
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        objet = televersement.creer_televersement(request.user, dict(serializer.validated_data))
+        entetes = self.entetes(objet)
+        entetes['Location'] = request.build_absolute_uri(f'{objet.pk}/')
+        return Response(self.get_serializer(objet).data, status=status.HTTP_201_CREATED, headers=entetes)
+
+    def retrieve(self, request, pk=None):
+        objet = self.get_object()
+        return Response(self.get_serializer(objet).data, headers=self.entetes(objet))
+
+    def partial_update(self, request, pk=None):
+        if request.content_type != 'application/offset+octet-stream':
+            return Response(
+                {'error': 'Content-Type attendu : application/offset+octet-stream'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({'error': 'En-tête Upload-Offset manquant ou invalide'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Corps lu en flux depuis la requête (pas de request.data : rien n'est chargé en mémoire)
+        objet, document = televersement.ajouter_morceau(
+            request.user, pk, offset, request.stream, int(request.META.get('CONTENT_LENGTH') or 0)
+        )
+        if document is not None:
+            return Response(DocumentSerializer(document).data, headers=self.entetes(objet))
+        return Response(status=status.HTTP_204_NO_CONTENT, headers=self.entetes(objet))
+
+    def destroy(self, request, pk=None):
+        televersement.annuler(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 # ============================================================================
 # VIEWSETS JURYS
@@ -387,14 +706,13 @@ class JuryViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Charger les relations pour optimiser les requêtes"""
-        qs = Jury.objects.select_related('session').prefetch_related(
-            'composition__enseignant__user',
-            'composition__enseignant__departements'
-        )
+        qs = Jury.objects.select_related('session').prefetch_related(*PREFETCH_COMPOSITION)
         # Filtre custom : ?enseignant=<uuid> pour trouver les jurys d'un enseignant
         enseignant_id = self.request.query_params.get('enseignant')
         if enseignant_id:
-            qs = qs.filter(composition__enseignant_id=enseignant_id).distinct()
+            qs = qs.filter(Exists(MembreJury.objects.filter(
+                jury=OuterRef('pk'), enseignant_id=enseignant_id
+            )))
         return qs
 
     def get_serializer_class(self):
@@ -403,6 +721,60 @@ class JuryViewSet(viewsets.ModelViewSet):
             return JuryListSerializer
         return JurySerializer
 
+    def update(self, request, *args, **kwargs):
+        """
+        Comme UpdateModelMixin.update, sans vider le cache de prefetch :
+        JurySerializer y a déjà placé la composition à jour.
+        """
+        partial = kwargs.pop('partial', False)
+        serializer = self.get_serializer(self.get_object(), data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, CanManageJury])
+    def recommander(self, request):
+        """
+        Proposer une composition de jury par dossier (rien n'est enregistré) :
+        département du candidat, président PROFESSEUR/MAITRE_CONF, encadreur
+        au rôle ENCADREUR, charge des enseignants équilibrée sur la session.
+        Chaque `membres` se passe tel quel en membres_data à la création du jury.
+        """
+        parametres = RecommandationJurySerializer(data=request.data)
+        parametres.is_valid(raise_exception=True)
+        parametres = parametres.validated_data
+        session = get_object_or_404(SessionSoutenance, pk=parametres['session_id'])
+
+        if 'dossier_ids' in parametres:
+            dossiers = DossierSoutenance.objects.filter(session=session, pk__in=parametres['dossier_ids'])
+        else:
+            dossiers = recommandation.dossiers_sans_jury(session)
+        propositions, non_pourvus, charges, enseignants = recommandation.recommander(
+            session, dossiers, parametres['nb_examinateurs']
+        )
+
+        def nom(enseignant_id):
+            return enseignants[enseignant_id].user.get_full_name()
+
+        concernes = {e for membres in propositions.values() for e, _ in membres}
+        return Response({
+            'propositions': [
+                {
+                    'dossier_id': dossier.pk,
+                    'candidat_nom': dossier.candidat.user.get_full_name(),
+                    'membres': [
+                        {'enseignant_id': e, 'nom_complet': nom(e), 'role': role}
+                        for e, role in membres
+                    ],
+                    'roles_non_pourvus': non_pourvus.get(dossier.pk, []),
+                }
+                for dossier, membres in propositions.items()
+            ],
+            'charges': sorted(
+                ({'enseignant_id': e, 'nom_complet': nom(e), 'charge': charges[e]} for e in concernes),
+                key=lambda c: (-c['charge'], c['nom_complet'])
+            ),
+        })
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, CanManageJury])
     def valider(self, request, pk=None):
@@ -461,7 +833,7 @@ class SoutenanceViewSet(viewsets.ModelViewSet):
             return Soutenance.objects.none()
 
         base_qs = Soutenance.objects.select_related(
-            'dossier__candidat__user', 'dossier__session',
+            'dossier__candidat__user', 'dossier__candidat__departement', 'dossier__session',
             'dossier__encadreur__user', 'jury', 'salle'
         ).prefetch_related('jury__composition__enseignant__user')
 
@@ -471,26 +843,69 @@ class SoutenanceViewSet(viewsets.ModelViewSet):
         elif user.role == 'CANDIDAT':
             return base_qs.filter(dossier__candidat__user=user)
         elif user.role == 'ENSEIGNANT':
-            return base_qs.filter(
-                jury__composition__enseignant__user=user
-            ).distinct()
+            # Soutenances dont il est membre du jury : index de visibilité
+            return base_qs.filter(acces_enseignant(user, AccesObjet.TypeObjet.SOUTENANCE))
         return Soutenance.objects.none()
 
+    def create(self, request, *args, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().create(request, *args, **kwargs)
+        except IntegrityError:
+            return self.reponse_salle_occupee()
+
+    def update(self, request, *args, **kwargs):
+        # partial_update passe aussi par ici
+        try:
+            with transaction.atomic():
+                return super().update(request, *args, **kwargs)
+        except IntegrityError:
+            return self.reponse_salle_occupee()
+
+    def reponse_salle_occupee(self):
+        # Contrainte d'exclusion PostgreSQL (différée : levée au commit de l'atomic)
+        return Response({'error': "Salle déjà occupée sur ce créneau"}, status=status.HTTP_400_BAD_REQUEST)
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, CanPlanSoutenance])
     def planifier(self, request, pk=None):
         """Planifier une soutenance (Admin seulement)"""
         soutenance = self.get_object()
-
-        soutenance.date_heure = request.data.get('date_heure')
-        soutenance.salle_id = request.data.get('salle_id')
-        soutenance.ordre_passage = request.data.get('ordre_passage')
-        soutenance.duree_minutes = request.data.get('duree_minutes', 60)
+        parametres = PlanificationSoutenanceSerializer(data=request.data)
+        parametres.is_valid(raise_exception=True)
+        parametres = parametres.validated_data
+
+        soutenance.date_heure = parametres['date_heure']
+        soutenance.duree_minutes = parametres['duree_minutes']
+        soutenance.salle = parametres.get('salle')
+        soutenance.ordre_passage = parametres.get('ordre_passage')
         soutenance.statut = 'PLANIFIEE'
-        soutenance.save()
+
+        conflits = detecter_conflits(soutenance)
+        if conflits:
+            return Response(
+                {'error': "Salle ou membre du jury déjà occupé sur ce créneau", 'conflits': conflits},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            with transaction.atomic():
+                soutenance.save()
+        except IntegrityError:
+            # Créneau pris entre-temps
+            return self.reponse_salle_occupee()
 
         serializer = self.get_serializer(soutenance)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdmin])
+    def conflits(self, request):
+        """Doubles réservations (salle, enseignant) impliquant la session ?session="""
+        session_id = request.query_params.get('session')
+        if not session_id:
+            return Response({'error': "Paramètre session requis"}, status=status.HTTP_400_BAD_REQUEST)
+        session = get_object_or_404(SessionSoutenance, pk=session_id)
+        conflits = conflits_session(session)
+        return Response({'nb_conflits': len(conflits), 'conflits': conflits})
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
     def demarrer(self, request, pk=None):
         """Démarrer une soutenance"""
@@ -511,22 +926,32 @@ class SoutenanceViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(soutenance)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def convocation(self, request, pk=None):
+        """Convocation PDF, re-rendue seulement si les données de la soutenance ont changé"""
+        piece = pieces_pdf.piece_a_jour(self.get_object(), PieceGeneree.TypePiece.CONVOCATION)
+        return Response(PieceGenereeSerializer(piece, context={'request': request}).data)
+
+    @action(detail=True, methods=['get'], url_path='proces-verbal', permission_classes=[IsAuthenticated, IsAdmin | IsEnseignant])
+    def proces_verbal(self, request, pk=None):
+        """Procès-verbal PDF (admin et membres du jury)"""
+        piece = pieces_pdf.piece_a_jour(self.get_object(), PieceGeneree.TypePiece.PROCES_VERBAL)
+        return Response(PieceGenereeSerializer(piece, context={'request': request}).data)
+
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def mes_soutenances(self, request):
         """Récupérer les soutenances selon le rôle de l'utilisateur"""
         user = request.user
 
         base_qs = Soutenance.objects.select_related(
-            'dossier__candidat__user', 'dossier__session',
+            'dossier__candidat__user', 'dossier__candidat__departement', 'dossier__session',
             'dossier__encadreur__user', 'jury', 'salle'
         )
 
         if user.role == 'CANDIDAT':
             soutenances = base_qs.filter(dossier__candidat__user=user)
         elif user.role == 'ENSEIGNANT':
-            soutenances = base_qs.filter(
-                jury__composition__enseignant__user=user
-            ).distinct()
+            soutenances = base_qs.filter(acces_enseignant(user, AccesObjet.TypeObjet.SOUTENANCE))
         else:
             soutenances = base_qs.all()
 
@@ -535,23 +960,65 @@ class SoutenanceViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def calendrier(self, request):
-        """Calendrier des soutenances"""
-        soutenances = Soutenance.objects.filter(
+        """
+        Calendrier des soutenances, filtré selon le rôle.
+
+        Paramètres : ?from=&to= (date ou date-heure), ?salle=, ?jury=,
+        ?mode=compact (lignes plates paginées) ou ?mode=flux (JSON lines
+        en streaming, sans pagination, pour les grandes plages).
+        """
+        try:
+            debut = parse_borne_calendrier(request.query_params.get('from'))
+            fin = parse_borne_calendrier(request.query_params.get('to'), fin=True)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Mêmes règles de visibilité et filtres (?salle=...) que la liste
+        soutenances = self.filter_queryset(self.get_queryset()).filter(
             date_heure__isnull=False
-        ).order_by('date_heure')
-
-        serializer = self.get_serializer(soutenances, many=True)
-        return Response(serializer.data)
+        )
+        if debut:
+            soutenances = soutenances.filter(date_heure__gte=debut)
+        if fin:
+            soutenances = soutenances.filter(date_heure__lt=fin)
+        jury_id = request.query_params.get('jury')
+        if jury_id:
+            soutenances = soutenances.filter(jury_id=jury_id)
+        soutenances = soutenances.order_by('date_heure', 'ordre_passage')
+
+        mode = request.query_params.get('mode')
+        if mode not in ('compact', 'flux'):
+            page = self.paginate_queryset(soutenances)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        lignes = soutenances.annotate(
+            candidat_nom=nom_complet('dossier__candidat__user__'),
+            titre_memoire=F('dossier__titre_memoire'),
+            salle_nom=Case(
+                When(salle__isnull=True, then=Value(None)),
+                default=Concat('salle__nom', Value(' ('), 'salle__batiment', Value(')')),
+                output_field=CharField(),
+            ),
+            jury_nom=F('jury__nom'),
+            session_id=F('dossier__session_id'),
+        ).values(*SoutenanceCalendrierSerializer.Meta.fields)
+        serializer = SoutenanceCalendrierSerializer()
+
+        if mode == 'flux':
+            def generer():
+                for ligne in lignes.iterator(chunk_size=500):
+                    yield json.dumps(serializer.to_representation(ligne)) + '\n'
+            return StreamingHttpResponse(generer(), content_type='application/x-ndjson')
+
+        page = self.paginate_queryset(lignes)
+        return self.get_paginated_response([serializer.to_representation(ligne) for ligne in page])
 
 
 # ============================================================================
 # ANALYTICS (public, sans authentification)
 # ============================================================================
 
-import hashlib
-from rest_framework.decorators import api_view, permission_classes as perm_classes
-
-
 @api_view(['POST'])
 @perm_classes([AllowAny])
 def track_event(request):
@@ -566,25 +1033,121 @@ def track_event(request):
         ip = ip.split(',')[0].strip()
     ip_hash = hashlib.sha256(ip.encode()).hexdigest()[:32]
 
-    # Rate limit: pas le même event depuis la même IP dans les 5 dernières secondes
-    from datetime import timedelta
-    recent = SiteEvent.objects.filter(
-        event_type=event_type,
-        ip_hash=ip_hash,
-        created_at__gte=timezone.now() - timedelta(seconds=5)
-    ).exists()
-
-    if recent:
+    # Rate limit (cache) : pas le même event depuis la même IP dans la fenêtre,
+    # puis écriture différée par lots (voir analytics.py)
+    if not enregistrer_evenement(event_type, ip_hash):
         return Response({'status': 'duplicate'}, status=status.HTTP_200_OK)
 
-    SiteEvent.objects.create(event_type=event_type, ip_hash=ip_hash)
     return Response({'status': 'ok'}, status=status.HTTP_201_CREATED)
 
 
 @api_view(['GET'])
 @perm_classes([AllowAny])
 def get_stats(request):
-    """Renvoyer les compteurs publics."""
-    repo_clicks = SiteEvent.objects.filter(event_type='REPO_CLICK').count()
-    page_views = SiteEvent.objects.filter(event_type='PAGE_VIEW').count()
-    return Response({'repo_clicks': repo_clicks, 'page_views': page_views})
+    """Renvoyer les compteurs publics (lus depuis les agrégats journaliers)."""
+    totaux = dict(
+        SiteEventRollup.objects.filter(granularite='DAY')
+        .values_list('event_type').annotate(total=Sum('compteur')).order_by()
+    )
+    return Response({
+        'repo_clicks': totaux.get('REPO_CLICK', 0),
+        'page_views': totaux.get('PAGE_VIEW', 0),
+    })
+
+
+@api_view(['GET'])
+@perm_classes([AllowAny])
+def get_timeseries(request):
+    """
+    Série temporelle des compteurs : ?granularity=hour|day (défaut day),
+    ?event_type=, ?from=&to= (défaut : 48 dernières heures / 30 derniers jours).
+    """
+    granularite = {'hour': 'HOUR', 'day': 'DAY'}.get(request.query_params.get('granularity', 'day'))
+    if granularite is None:
+        return Response({'error': 'granularity doit valoir hour ou day'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        debut = parse_borne_calendrier(request.query_params.get('from'))
+        fin = parse_borne_calendrier(request.query_params.get('to'), fin=True)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if debut is None:
+        debut = timezone.now() - (timedelta(hours=48) if granularite == 'HOUR' else timedelta(days=30))
+
+    points = SiteEventRollup.objects.filter(granularite=granularite, periode__gte=debut)
+    if fin:
+        points = points.filter(periode__lt=fin)
+    event_type = request.query_params.get('event_type')
+    if event_type:
+        points = points.filter(event_type=event_type)
+
+    return Response({
+        'granularity': granularite.lower(),
+        'points': [
+            {'periode': periode, 'event_type': type_evenement, 'compteur': compteur}
+            for periode, type_evenement, compteur in points.order_by('periode', 'event_type').values_list(
+                'periode', 'event_type', 'compteur'
+            )
+        ],
+    })
+
+
+# ============================================================================
+# CALENDRIERS ICS (abonnement par jeton signé)
+# ============================================================================
+
+@require_GET
+def calendrier_ics(request, type_flux, objet_id):
+    """
+    Flux iCalendar d'un enseignant, d'une salle ou d'une session.
+    Authentifié par ?token= (voir abonnements_ics) ; répond 304 si l'ETag n'a pas changé.
+
+    Vue Django simple (hors DRF) : les clients calendrier envoient
+    Accept: text/calendar, que la négociation de contenu DRF refuserait.
+    """
+    if type_flux not in ical.TYPES_FLUX:
+        return JsonResponse({'error': 'Type de flux invalide'}, status=status.HTTP_404_NOT_FOUND)
+    if not ical.verifier_jeton(type_flux, objet_id, request.GET.get('token')):
+        return JsonResponse({'error': 'Jeton invalide'}, status=status.HTTP_403_FORBIDDEN)
+
+    version = ical.version_flux(type_flux, objet_id)
+    etag = quote_etag(version)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        reponse = HttpResponseNotModified()
+    else:
+        reponse = HttpResponse(
+            ical.obtenir_flux(type_flux, objet_id, version),
+            content_type='text/calendar; charset=utf-8'
+        )
+    reponse['ETag'] = etag
+    reponse['Cache-Control'] = 'private, max-age=300'
+    return reponse
+
+
+@api_view(['GET'])
+def abonnements_ics(request):
+    """
+    URLs d'abonnement (.ics) de l'utilisateur connecté :
+    - Enseignant : son propre flux
+    - Admin : flux de chaque salle et de chaque session
+    """
+    def url_flux(type_flux, objet_id):
+        chemin = reverse('calendrier_ics', kwargs={'type_flux': type_flux, 'objet_id': objet_id})
+        jeton = ical.signer_flux(type_flux, objet_id)
+        return request.build_absolute_uri(f'{chemin}?token={jeton}')
+
+    user = request.user
+    if user.role == 'ENSEIGNANT':
+        return Response({'enseignant': url_flux('enseignant', user.enseignant_profile.id)})
+    if user.role == 'ADMIN':
+        return Response({
+            'salles': [
+                {'id': salle_id, 'nom': nom, 'url': url_flux('salle', salle_id)}
+                for salle_id, nom in Salle.objects.values_list('id', 'nom')
+            ],
+            'sessions': [
+                {'id': session_id, 'titre': titre, 'url': url_flux('session', session_id)}
+                for session_id, titre in SessionSoutenance.objects.values_list('id', 'titre')
+            ],
+        })
+    return Response({'detail': 'Aucun calendrier disponible'}, status=status.HTTP_404_NOT_FOUND)
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 import dj_database_url
 import os
 
@@ -144,7 +145,6 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Media files (Uploads)
 MEDIA_URL = '/media/'
@@ -155,9 +155,99 @@ SUPABASE_URL = config('SUPABASE_URL', default='')
 SUPABASE_SERVICE_ROLE_KEY = config('SUPABASE_SERVICE_ROLE_KEY', default='')
 SUPABASE_STORAGE_BUCKET = config('SUPABASE_STORAGE_BUCKET', default='THEZ-DOCUMENT')
 
-# Si Supabase est configure, utiliser le storage Supabase
-if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
-    DEFAULT_FILE_STORAGE = 'app_soutenance.storage.SupabaseStorage'
+# Uploads TUS (resumable) : taille des morceaux (6 Mo imposés par Supabase), timeout, reprises
+SUPABASE_UPLOAD_CHUNK_SIZE = config('SUPABASE_UPLOAD_CHUNK_SIZE', default=6 * 1024 * 1024, cast=int)
+SUPABASE_UPLOAD_TIMEOUT = config('SUPABASE_UPLOAD_TIMEOUT', default=60, cast=int)
+SUPABASE_UPLOAD_RETRIES = config('SUPABASE_UPLOAD_RETRIES', default=3, cast=int)
+
+# Connexions HTTP keep-alive partagées par processus, cache des tailles d'objets
+SUPABASE_HTTP_POOL_SIZE = config('SUPABASE_HTTP_POOL_SIZE', default=20, cast=int)
+SUPABASE_METADATA_CACHE_TTL = config('SUPABASE_METADATA_CACHE_TTL', default=3600, cast=int)
+
+# Empreinte SHA-256 des fichiers calculée pendant la réception (stockage dédupliqué)
+FILE_UPLOAD_HANDLERS = [
+    'app_soutenance.dedup.HachageMemoryFileUploadHandler',
+    'app_soutenance.dedup.HachageTemporaryFileUploadHandler',
+]
+
+# Upload direct et reprenable : taille maximale déclarée (octets)
+UPLOAD_TAILLE_MAX = config('UPLOAD_TAILLE_MAX', default=200 * 1024 * 1024, cast=int)
+# Upload reprenable : fichiers partiels et durée de vie. Répertoire local au worker :
+# la reprise exige que tous les morceaux d'un upload arrivent sur le même hôte
+# (affinité de session), sinon un volume partagé par les workers, gérant flock
+UPLOAD_REPRENABLE_DIR = config('UPLOAD_REPRENABLE_DIR', default=os.path.join(BASE_DIR, 'media', 'televersements'))
+UPLOAD_REPRENABLE_EXPIRATION_HEURES = config('UPLOAD_REPRENABLE_EXPIRATION_HEURES', default=24, cast=int)
+
+# Archives ZIP des documents : fichiers lus en parallèle
+ARCHIVE_THREADS = config('ARCHIVE_THREADS', default=4, cast=int)
+
+# Miniatures de photos et aperçus PDF : calculés hors requête dans un pool de processus
+DERIVES_PROCESSUS = config('DERIVES_PROCESSUS', default=2, cast=int)
+DERIVES_ASYNCHRONE = config('DERIVES_ASYNCHRONE', default=True, cast=bool)
+
+# Convocations et procès-verbaux PDF : conversion par lot dans un pool de processus
+PDF_PROCESSUS = config('PDF_PROCESSUS', default=2, cast=int)
+
+# Import par lot de candidats / enseignants : hachage des mots de passe dans un pool de processus
+IMPORT_PROCESSUS = config('IMPORT_PROCESSUS', default=2, cast=int)
+
+# URLs des fichiers : signées (bucket privé) ou publiques, mises en cache par processus
+SUPABASE_SIGNED_URLS = config('SUPABASE_SIGNED_URLS', default=False, cast=bool)
+SUPABASE_SIGNED_URL_EXPIRY = config('SUPABASE_SIGNED_URL_EXPIRY', default=3600, cast=int)
+SUPABASE_URL_CACHE_TTL = config('SUPABASE_URL_CACHE_TTL', default=24 * 3600, cast=int)
+SUPABASE_URL_CACHE_SIZE = config('SUPABASE_URL_CACHE_SIZE', default=10000, cast=int)
+
+# Django >= 5.1 : STORAGES remplace DEFAULT_FILE_STORAGE / STATICFILES_STORAGE
+# (ignorés depuis : jusqu'ici, fichiers sur disque et statiques non versionnés).
+# Les deux bascules sont explicites et désactivées par défaut.
+#
+# STOCKAGE_SUPABASE=True : documents, blobs et dérivés dans le bucket Supabase
+# (SUPABASE_URL et SUPABASE_SERVICE_ROLE_KEY requis). Migration : les fichiers
+# existants de MEDIA_ROOT ne sont pas recopiés ; les envoyer dans le bucket sous
+# les mêmes chemins (documents/, blobs/, ...) avant d'activer l'option.
+STOCKAGE_SUPABASE = config('STOCKAGE_SUPABASE', default=False, cast=bool)
+# STATIC_MANIFESTE=True : statiques compressés et versionnés par WhiteNoise.
+# Exige `collectstatic` à chaque déploiement (sinon {% static %} échoue).
+STATIC_MANIFESTE = config('STATIC_MANIFESTE', default=False, cast=bool)
+
+if STOCKAGE_SUPABASE and not (SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY):
+    raise ImproperlyConfigured("STOCKAGE_SUPABASE exige SUPABASE_URL et SUPABASE_SERVICE_ROLE_KEY")
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'app_soutenance.storage.SupabaseStorage' if STOCKAGE_SUPABASE
+        else 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage' if STATIC_MANIFESTE
+        else 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Mise à jour automatique des statuts de session (déclencheur par tranche de temps, en secondes)
+# La commande `python manage.py update_statuts_sessions` peut aussi être planifiée (cron)
+SESSION_STATUT_REFRESH_SECONDS = config('SESSION_STATUT_REFRESH_SECONDS', default=60, cast=int)
+
+# Cache : local au processus par défaut ; REDIS_URL (paquet redis requis) pour
+# un cache partagé entre workers, nécessaire au limiteur analytics en production
+REDIS_URL = config('REDIS_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Analytics : limiteur anti-doublon (cache ANALYTICS_CACHE) et tampon d'écriture des événements
+ANALYTICS_RATE_LIMITER = 'app_soutenance.analytics.CacheRateLimiter'
+ANALYTICS_CACHE = config('ANALYTICS_CACHE', default='default')
+ANALYTICS_RATE_LIMIT_CAPACITE = config('ANALYTICS_RATE_LIMIT_CAPACITE', default=1, cast=int)
+ANALYTICS_RATE_LIMIT_PERIODE = config('ANALYTICS_RATE_LIMIT_PERIODE', default=5, cast=int)
+ANALYTICS_BUFFER_TAILLE = config('ANALYTICS_BUFFER_TAILLE', default=50, cast=int)
+ANALYTICS_BUFFER_INTERVALLE = config('ANALYTICS_BUFFER_INTERVALLE', default=10, cast=int)
+# Rétention des SiteEvent bruts (jours) ; les agrégats sont conservés
+ANALYTICS_RETENTION_JOURS = config('ANALYTICS_RETENTION_JOURS', default=90, cast=int)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field